@@ -198,6 +198,12 @@ void handleFrontendMessage(String message) {
     else if (message.equals("USER_FAIL")) {
         Serial.println(F("✗ Login failed - Invalid RFID card"));
     }
+    else if (message.equals("USER_LOGOUT")) {
+        Serial.println(F("← Logged out - tap a card to log in"));
+        oled_exercise = "";
+        oled_reps = 0;
+        oled_sets = 0;
+    }
 
     // Workout start
     else if (message.startsWith("WORKOUT_START")) {
@@ -222,6 +228,11 @@ void handleFrontendMessage(String message) {
         startSimulatedWorkout();
     }
 
+    // Handshake ping from frontend
+    else if (message.equals("PING")) {
+        sendToFrontend("PONG|" + String(millis()));
+    }
+
     // Workout cancel
     else if (message.equals("WORKOUT_CANCEL")) {
         Serial.println(F("✗ Workout cancelled from GUI"));
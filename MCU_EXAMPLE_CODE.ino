@@ -115,6 +115,12 @@ void handleMessage(String message) {
         // Show error on display, beep, etc.
     }
 
+    else if (message.equals("USER_LOGOUT")) {
+        // Logged out on the web page or timed out (WORKOUT_CANCEL came first)
+        Serial.println("User logged out");
+        // Show the tap-to-login screen
+    }
+
     // ==========================================
     // WORKOUT START
     // ==========================================
@@ -0,0 +1,318 @@
+# analytics.py
+"""
+Gym-wide workout analytics over all users' history, computed on columns
+
+Every *_workouts.csv is parsed once into per-user column arrays; later
+refreshes only parse the bytes appended since the last read (record_workout
+only appends), so keeping the columns current costs one stat per file.
+Queries run as vectorized NumPy aggregates over the concatenated columns and
+their results are cached until new rows arrive.
+"""
+import csv
+import pathlib
+import threading
+import time
+from array import array
+from datetime import datetime, timezone, date
+from typing import Dict, List, Optional, Tuple
+from config import ANALYTICS_REFRESH_INTERVAL
+from exercises import CATALOG
+from event_log import get_logger
+
+# NumPy is optional: without it the analytics API reports itself unavailable
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+log = get_logger("analytics")
+
+HEADER = ["timestamp", "exercise", "reps", "sets", "duration_min", "valid_reps"]
+FILE_SUFFIX = "_workouts.csv"
+WEEK = 7 * 86400
+MONDAY_OFFSET = 3 * 86400  # 1970-01-01 was a Thursday
+
+def to_epoch(value: datetime) -> int:
+    """Seconds since 1970 for a naive local timestamp, keeping its wall-clock time"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+def day_epoch(day: str) -> int:
+    """'2024-03-01' -> epoch seconds at the start of that day"""
+    return to_epoch(datetime.combine(date.fromisoformat(day), datetime.min.time()))
+
+def week_start(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).date().isoformat()
+
+class UserColumns:
+    """One user's history as typed arrays, plus how far into the file we have read"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.rejects = 0
+        self.timestamp = array('q')
+        self.exercise = array('h')
+        self.reps = array('i')
+        self.sets = array('i')
+        self.duration = array('f')
+        self.valid_reps = array('i')
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def reset(self):
+        self.__init__(self.path)
+
+    def append_from(self, data: bytes, names: Dict[str, int]) -> int:
+        """Parse complete CSV lines in data; returns the number of bytes consumed"""
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return 0
+        lines = data[:end].decode('utf-8', errors='replace').splitlines()
+        added = rejects = 0
+        for row in csv.reader(lines):
+            if not row or row == HEADER:
+                continue
+            try:
+                timestamp = to_epoch(datetime.fromisoformat(row[0]))
+                exercise = row[1]
+                reps, sets = int(row[2]), int(row[3])
+                duration = float(row[4])
+                valid = int(row[5]) if len(row) > 5 and row[5] != '' else reps * sets
+            except (ValueError, IndexError):
+                rejects += 1
+                continue
+            code = names.setdefault(exercise, len(names))
+            self.timestamp.append(timestamp)
+            self.exercise.append(code)
+            self.reps.append(reps)
+            self.sets.append(sets)
+            self.duration.append(duration)
+            self.valid_reps.append(valid)
+            added += 1
+        self.rejects += rejects
+        return end
+
+class AnalyticsEngine:
+    """
+    Columnar store of every user's history with cached aggregate queries
+
+    refresh() is rate-limited to ANALYTICS_REFRESH_INTERVAL, so API calls can
+    trigger it freely. Query results are cached per generation: the
+    generation changes only when rows are added, so repeated dashboard loads
+    reuse the previous answer.
+    """
+
+    def __init__(self, data_dir: pathlib.Path, refresh_interval: float = ANALYTICS_REFRESH_INTERVAL):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("analytics needs numpy (pip install numpy)")
+        self.data_dir = pathlib.Path(data_dir)
+        self.refresh_interval = refresh_interval
+        self.users: Dict[str, UserColumns] = {}
+        self.exercise_names: Dict[str, int] = {}
+        self.generation = 0
+        self._last_refresh = float('-inf')
+        self._columns = None
+        self._columns_generation = -1
+        self._results: Dict[Tuple, Tuple[int, object]] = {}
+        self._lock = threading.RLock()
+
+    # ==========================================
+    # LOADING
+    # ==========================================
+
+    def refresh(self, force: bool = False) -> int:
+        """Read rows appended to any history file since the last refresh; returns rows added"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return 0
+            self._last_refresh = now
+
+            added = 0
+            seen = set()
+            for path in self.data_dir.glob(f"*{FILE_SUFFIX}"):
+                username = path.name[:-len(FILE_SUFFIX)]
+                seen.add(username)
+                columns = self.users.get(username)
+                if columns is None:
+                    columns = self.users[username] = UserColumns(path)
+                added += self._read_new(columns)
+
+            removed = set(self.users) - seen
+            for username in removed:
+                del self.users[username]
+            if added or removed:
+                self.generation += 1
+            return added
+
+    def _read_new(self, columns: UserColumns) -> int:
+        try:
+            stat = columns.path.stat()
+        except OSError:
+            return 0
+        if columns.inode != stat.st_ino or stat.st_size < columns.offset:
+            # Replaced or truncated (e.g. by the importer): start over
+            removed = len(columns)
+            columns.reset()
+            columns.inode = stat.st_ino
+            if removed:
+                self.generation += 1
+        if stat.st_size == columns.offset:
+            return 0
+
+        before = len(columns)
+        rejects = columns.rejects
+        with open(columns.path, 'rb') as f:
+            f.seek(columns.offset)
+            columns.offset += columns.append_from(f.read(), self.exercise_names)
+        if columns.rejects > rejects:
+            log.warning("analytics_rows_rejected", file=columns.path.name, count=columns.rejects - rejects)
+        return len(columns) - before
+
+    def columns(self) -> Dict[str, "np.ndarray"]:
+        """All users' rows concatenated into NumPy columns (rebuilt only after new rows)"""
+        with self._lock:
+            self.refresh()
+            if self._columns_generation == self.generation:
+                return self._columns
+            users = list(self.users.items())
+            user_code = np.concatenate([np.full(len(c), i, dtype=np.int32) for i, (_, c) in enumerate(users)]
+                                       or [np.empty(0, np.int32)])
+
+            def stack(field, dtype):
+                parts = [np.frombuffer(getattr(c, field), dtype=dtype) for _, c in users]
+                return np.concatenate(parts) if parts else np.empty(0, dtype)
+
+            self._columns = {
+                'user': user_code,
+                'usernames': np.array([name for name, _ in users], dtype=object),
+                'timestamp': stack('timestamp', np.int64),
+                'exercise': stack('exercise', np.int16),
+                'reps': stack('reps', np.int32),
+                'sets': stack('sets', np.int32),
+                'duration': stack('duration', np.float32),
+                'valid_reps': stack('valid_reps', np.int32),
+            }
+            self._columns_generation = self.generation
+            return self._columns
+
+    def _cached(self, key: Tuple, compute):
+        with self._lock:
+            columns = self.columns()
+            cached = self._results.get(key)
+            if cached and cached[0] == self.generation:
+                return cached[1]
+            result = compute(columns)
+            if len(self._results) >= 256:
+                self._results.clear()
+            self._results[key] = (self.generation, result)
+            return result
+
+    def _mask(self, columns, user: Optional[str], start: Optional[int], end: Optional[int],
+              exercise: Optional[str] = None):
+        mask = np.ones(len(columns['timestamp']), dtype=bool)
+        if user is not None:
+            matches = np.flatnonzero(columns['usernames'] == user.lower())
+            mask &= columns['user'] == (matches[0] if len(matches) else -1)
+        if start is not None:
+            mask &= columns['timestamp'] >= start
+        if end is not None:
+            mask &= columns['timestamp'] < end
+        if exercise is not None:
+            code = self.exercise_names.get(CATALOG.name(exercise), -1)
+            mask &= columns['exercise'] == code
+        return mask
+
+    def _calories_per_rep(self) -> "np.ndarray":
+        """Calories per rep indexed by exercise code (0 for names not in the catalog)"""
+        by_name = {ex['name']: ex['calories_per_rep'] for ex in CATALOG}
+        table = np.zeros(max(len(self.exercise_names), 1), dtype=np.float64)
+        for name, code in self.exercise_names.items():
+            table[code] = by_name.get(name, 0.0)
+        return table
+
+    # ==========================================
+    # QUERIES
+    # ==========================================
+
+    def weekly_volume(self, user: Optional[str] = None, start: Optional[int] = None,
+                      end: Optional[int] = None) -> List[Dict]:
+        """Workouts, total reps and valid-rep accuracy per Monday-based week"""
+        def compute(c):
+            mask = self._mask(c, user, start, end)
+            if not mask.any():
+                return []
+            weeks = (c['timestamp'][mask] + MONDAY_OFFSET) // WEEK
+            first = weeks.min()
+            index = weeks - first
+            total = (c['reps'][mask] * c['sets'][mask]).astype(np.int64)
+            workouts = np.bincount(index)
+            reps = np.bincount(index, weights=total)
+            valid = np.bincount(index, weights=c['valid_reps'][mask])
+            minutes = np.bincount(index, weights=c['duration'][mask])
+            return [{
+                'week': week_start(int(first + i) * WEEK - MONDAY_OFFSET),
+                'workouts': int(workouts[i]),
+                'reps': int(reps[i]),
+                'minutes': round(float(minutes[i]), 1),
+                'accuracy': round(float(valid[i] / reps[i] * 100), 1) if reps[i] else 100.0,
+            } for i in np.flatnonzero(workouts)]
+        return self._cached(('weekly_volume', user, start, end), compute)
+
+    def accuracy_trend(self, user: Optional[str] = None, start: Optional[int] = None,
+                       end: Optional[int] = None) -> List[Dict]:
+        """Weekly valid-rep accuracy (%)"""
+        return [{'week': w['week'], 'accuracy': w['accuracy']}
+                for w in self.weekly_volume(user, start, end)]
+
+    def leaderboard(self, exercise: Optional[str] = None, metric: str = 'reps',
+                    start: Optional[int] = None, end: Optional[int] = None, limit: int = 10) -> List[Dict]:
+        """Users ranked by total reps, valid reps, workouts or minutes"""
+        if metric not in ('reps', 'valid_reps', 'workouts', 'minutes'):
+            raise ValueError(f"Unknown leaderboard metric: {metric}")
+
+        def compute(c):
+            mask = self._mask(c, None, start, end, exercise)
+            users = c['user'][mask]
+            size = len(c['usernames'])
+            if metric == 'reps':
+                weights = (c['reps'][mask] * c['sets'][mask]).astype(np.float64)
+            elif metric == 'valid_reps':
+                weights = c['valid_reps'][mask]
+            elif metric == 'minutes':
+                weights = c['duration'][mask]
+            else:
+                weights = None
+            totals = np.bincount(users, weights=weights, minlength=size)
+            order = np.argsort(-totals, kind='stable')[:limit]
+            return [{'user': c['usernames'][i], 'value': round(float(totals[i]), 1)}
+                    for i in order if totals[i] > 0]
+        return self._cached(('leaderboard', exercise, metric, start, end, limit), compute)
+
+    def calories(self, user: Optional[str] = None, start: Optional[int] = None,
+                 end: Optional[int] = None) -> Dict:
+        """Estimated calories (reps x calories_per_rep) in total and per exercise"""
+        def compute(c):
+            mask = self._mask(c, user, start, end)
+            codes = c['exercise'][mask]
+            per_row = (c['reps'][mask] * c['sets'][mask]) * self._calories_per_rep()[codes]
+            per_exercise = np.bincount(codes, weights=per_row, minlength=len(self.exercise_names))
+            names = {code: name for name, code in self.exercise_names.items()}
+            return {
+                'total': round(float(per_row.sum()), 1),
+                'by_exercise': {names[i]: round(float(v), 1) for i, v in enumerate(per_exercise) if v},
+            }
+        return self._cached(('calories', user, start, end), compute)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            columns = self.columns()
+            return {
+                'users': len(self.users),
+                'rows': int(len(columns['timestamp'])),
+                'rejected_rows': sum(c.rejects for c in self.users.values()),
+                'generation': self.generation,
+            }
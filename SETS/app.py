@@ -1,144 +1,469 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, g, Response
+import json
+import secrets
 import threading
+import time
 from datetime import datetime
-from config import HOST, PORT, EXERCISES
+from config import (HOST, PORT, SESSION_DEFAULT_STATION, EVENT_STREAM_KEEPALIVE, ADMIN_TOKEN,
+                    PROFILER_INTERVAL, STATION_ID, STATION_BIND_TOKENS)
 from serial_handler import SerialHandler
 from rfid_auth import RFIDAuth
 from database import UserDatabase
+from exercises import CATALOG
+from compression import (CompressedBody, CompressedCache, COMPRESSIBLE_TYPES, MIN_SIZE,
+                         choose_encoding, compress)
+from assets import AssetHashes
+from analytics import day_epoch
+from render_cache import RenderCache
+from event_bus import BUS, SlowConsumer, sse_stream
+from export import FORMATS, export_chunks
+import profiler
 import pathlib
+import metrics
+from event_log import get_logger
+
+# WebSockets are optional: without flask-sock the selection page polls instead
+try:
+    from flask_sock import Sock, ConnectionClosed
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+log = get_logger("app")
 
 app = Flask(__name__)
 app.secret_key = 'fitness_tracker_secret'
+sock = Sock(app) if WEBSOCKET_AVAILABLE else None
+
+# Per-route latency for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
 
-# Disable all caching (force fresh load every time)
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(
+            time.perf_counter() - start)
+    return response
+
+# Token the kiosk browser of this station is opened with (main.launch_browser); a new
+# one every start, so an old link cannot bind a browser again
+kiosk_token = secrets.token_urlsafe(16)
+
+def bind_token(station):
+    """Token that binds a browser to station (None: station cannot be bound)"""
+    return STATION_BIND_TOKENS.get(station) or (kiosk_token if station == STATION_ID else None)
+
+def kiosk_path(station=STATION_ID):
+    return f"/?station={station}&bind={bind_token(station)}"
+
+# Which station this browser is looking at, and who is logged in there.
+# Browsers are told apart by a random id in the Flask session cookie;
+# opening a page with ?station=<name>&bind=<token> binds the browser to that
+# station. Without the right token ?station= is ignored, so nobody can follow
+# a station's user just by naming it.
+@app.before_request
+def load_user_session():
+    g.station = None
+    g.user = None
+    if request.endpoint in ('static', 'prometheus_metrics') or not rfid_auth:
+        return
+    browser_id = session.get('browser')
+    if browser_id is None:
+        browser_id = session['browser'] = secrets.token_hex(8)
+    station = request.args.get('station')
+    if station:
+        token = bind_token(station)
+        if token and secrets.compare_digest(request.args.get('bind', ''), token):
+            rfid_auth.sessions.bind_browser(browser_id, station)
+            if request.method == 'GET':
+                return redirect(request.path)  # Keep the token out of the address bar and history
+        log.warning("station_bind_refused", station=station, addr=request.remote_addr)
+    g.station = rfid_auth.sessions.station_for(browser_id, SESSION_DEFAULT_STATION)
+    if g.station:
+        g.user = rfid_auth.get_current_user(g.station)
+
+def current_user():
+    """Username logged in at this request's station, or None"""
+    return g.get('user')
+
+# Static files: fingerprinted URLs (see static_url) never change, so browsers keep them for a year
+assets = AssetHashes(app.static_folder)
+
+@app.context_processor
+def inject_static_url():
+    """static_url('css/clean.css') -> /static/css/clean.css?h=<content hash>"""
+    def static_url(filename):
+        return url_for('static', filename=filename, h=assets.hash(filename))
+    return dict(static_url=static_url)
+
+# Disable caching of live pages and API responses (force fresh load every time),
+# except for responses that set their own policy (cached pages)
 @app.after_request
 def add_header(response):
     """Add headers to prevent caching"""
+    if request.endpoint == 'static':
+        filename = (request.view_args or {}).get('filename', '')
+        if response.status_code == 200 and assets.is_current(filename, request.args.get('h', '')):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    if 'Cache-Control' in response.headers:
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
     return response
 
-# Inject cache version into all templates
-@app.context_processor
-def inject_cache_version():
-    """Make cache version available to all templates"""
-    from config import CACHE_VERSION
-    return dict(v=CACHE_VERSION)
+# gzip/brotli for HTML, JSON and CSS. Static files are compressed once per
+# version (keyed by their ETag); pages from the render cache arrive pre-compressed.
+compressed_static = CompressedCache()
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or (response.is_streamed and request.endpoint != 'static')):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if not encoding:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    etag, weak = response.get_etag()
+    if etag and request.endpoint == 'static':
+        data = compressed_static.get(etag, encoding, data)
+    else:
+        data = compress(data, encoding)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Same resource, different bytes: only a weak validator is still correct
+        response.set_etag(etag, weak=True)
+    return response
+
+# Rendered dashboard/history pages, keyed on the user's data version
+render_cache = RenderCache()
+
+def send_cached(body: CompressedBody) -> Response:
+    """Serve a cached page: 304 if the browser has it, else the best encoding it accepts"""
+    etag = f'"{body.etag}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+    else:
+        data, encoding = body.body_for(request.headers.get('Accept-Encoding', ''))
+        response = Response(data, mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    # Browsers may keep the page but must revalidate (the user at this station can change)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Global components (initialized in main.py)
 serial_handler = None
 rfid_auth = None
 database = None
-
-# Workout state
-workout_state = {
-    'active': False,
-    'exercise': '',
-    'exerciseName': '',
-    'icon': '',
-    'caloriesPerRep': 0,
-    'targetReps': 0,
-    'totalSets': 0,
-    'currentSet': 1,
-    'currentReps': 0,
-    'totalCalories': 0,
-    'startTime': None,
-    'status': 'waiting',  # waiting, ready, active, completed
-    'validReps': 0
-}
-
-# OLED selection tracking (for hybrid mode)
-# User can select on OLED, frontend syncs in real-time
-oled_selection = {
-    'exercise': None,
-    'exerciseName': None,
-    'icon': None,
-    'caloriesPerRep': 0,
-    'reps': None,
-    'sets': None
-}
+analytics = None  # AnalyticsEngine, or None without numpy
+clock_sync = None  # ClockSync for the MCU link (set by main.py)
+timelines = None  # TimelineStore of finished workouts (set by main.py)
+imu_analyzer = None  # ImuAnalyzer, or None without numpy (set by main.py)
+sync_agent = None  # SyncAgent when SYNC_URL is set (set by main.py)
+
+WEB_SELECTION_COMMANDS = {'exercise': 'WEB_EXERCISE', 'reps': 'WEB_REPS', 'sets': 'WEB_SETS'}
+
+class StationState:
+    """Workout and OLED selection of one station (each station runs its own workout)"""
+
+    def __init__(self, station):
+        self.station = station
+        self.workout = {
+            'active': False,
+            'exercise': '',
+            'exerciseName': '',
+            'icon': '',
+            'caloriesPerRep': 0,
+            'targetReps': 0,
+            'totalSets': 0,
+            'currentSet': 1,
+            'currentReps': 0,
+            'totalCalories': 0,
+            'startTime': None,
+            'status': 'waiting',  # waiting, ready, active, completed
+            'validReps': 0
+        }
+        # OLED selection tracking (for hybrid mode)
+        # User can select on OLED, frontend syncs in real-time
+        self.selection = {
+            'exercise': None,
+            'exerciseName': None,
+            'icon': None,
+            'caloriesPerRep': 0,
+            'reps': None,
+            'sets': None
+        }
+        # Choices made on the web page and sent to the OLED ({'exercise': ..., 'reps': ..., 'sets': ...});
+        # OLED-made choices are only in selection, so they are never echoed back to the MCU
+        self.web_selection = {}
+        self.rep_timeline = None  # RepTimeline of the workout in progress
+
+    def topic(self, name):
+        """Event bus topic of this station ('workout' -> 'workout@station1')"""
+        return f"{name}@{self.station}"
+
+    def update_selection(self, **fields):
+        """Change the OLED selection and publish it to the station's selection pages"""
+        self.selection.update(fields)
+        BUS.publish(self.topic('selection'), dict(self.selection))
+
+    def reset_selection(self):
+        """Forget the current selection (logout, or a different user tapping in)"""
+        self.web_selection.clear()
+        self.update_selection(
+            exercise=None,
+            exerciseName=None,
+            icon=None,
+            caloriesPerRep=0,
+            reps=None,
+            sets=None
+        )
+
+    def selection_messages(self):
+        """WEB_EXERCISE/WEB_REPS/WEB_SETS that put the web page's selection back on the OLED"""
+        return [f"{command}|{self.web_selection[key]}\n"
+                for key, command in WEB_SELECTION_COMMANDS.items()
+                if self.web_selection.get(key) is not None]
+
+    def snapshot(self):
+        """What live viewers show of the workout in progress"""
+        workout = self.workout
+        return {
+            'status': workout['status'],
+            'reps': workout['currentReps'],
+            'currentSet': workout['currentSet'],
+            'calories': workout['totalCalories'],
+            'totalReps': workout['currentReps'],
+            'validReps': workout['validReps'],
+            'active': workout['active']
+        }
+
+    def publish_workout(self):
+        """Publish the workout state once; every viewer of the station reads the same event"""
+        BUS.publish(self.topic('workout'), self.snapshot())
+
+    def update_workout(self, status=None, reps=None, current_set=None, valid_reps=None, calories=None):
+        """Update progress from MCU messages (main.py)"""
+        if status is not None:
+            self.workout['status'] = status
+        if reps is not None:
+            self.workout['currentReps'] = reps
+        if current_set is not None:
+            self.workout['currentSet'] = current_set
+        if valid_reps is not None:
+            self.workout['validReps'] = valid_reps
+        if calories is not None:
+            self.workout['totalCalories'] = calories
+        self.publish_workout()
+
+    def complete_workout(self):
+        """Mark workout as completed"""
+        self.workout['status'] = 'completed'
+        self.workout['active'] = False
+        self.publish_workout()
+
+    def end_workout(self):
+        """Drop the workout in progress (cancel, logout)"""
+        self.workout['active'] = False
+        self.rep_timeline = None
+        self.publish_workout()
+
+_stations = {}
+_stations_lock = threading.Lock()
+
+def station_state(station=STATION_ID) -> StationState:
+    """State of a station, created on first use"""
+    state = _stations.get(station)
+    if state is None:
+        with _stations_lock:
+            state = _stations.setdefault(station, StationState(station))
+    return state
+
+# The station whose MCU this process talks to (main.py drives it from serial messages)
+local = station_state(STATION_ID)
+# What an unbound browser sees: no workout, no selection (never published to)
+_nobody = StationState(None)
+
+def viewed_state() -> StationState:
+    """State of the station this request's browser is bound to"""
+    return station_state(g.station) if g.get('station') else _nobody
+
+def mcu_for(station):
+    """SerialHandler of the station's MCU (only this station's is attached here)"""
+    return serial_handler if station == STATION_ID else None
+
+def end_session(station):
+    """Drop the station's workout and selection and log the MCU out (logout, session expiry)"""
+    state = station_state(station)
+    state.end_workout()
+    state.reset_selection()
+    mcu = mcu_for(station)
+    if mcu:
+        mcu.send_batch(["WORKOUT_CANCEL\n", "USER_LOGOUT\n"])
+
+def session_expired(user_session):
+    """SessionStore.on_expire: an idle session ends like a logout"""
+    end_session(user_session.station)
+
+def publish_imu(result):
+    """IMU window analysis from the worker pool (called on its result thread)"""
+    BUS.publish(local.topic('imu'), result)
 
 @app.route('/')
 def index():
-    if rfid_auth and rfid_auth.get_current_user():
+    if current_user():
         return redirect(url_for('dashboard'))
     return render_template('login.html')
 
 @app.route('/dashboard')
 def dashboard():
-    if not rfid_auth:
-        return redirect(url_for('index'))
-
-    user = rfid_auth.get_current_user()
+    user = current_user()
     if not user:
         return redirect(url_for('index'))
 
+    version = database.data_version(user)
+    page = render_cache.get('dashboard', user, version)
+    if page:
+        return send_cached(page)
+
     try:
         stats = database.get_total_stats(user)
     except Exception as e:
-        print(f"Error getting stats: {e}")
+        log.error("stats_failed", user=user, error=e)
         stats = {"total_workouts": 0, "total_reps": 0, "avg_accuracy": 0}
+        # Do not cache the fallback page
+        return render_template('dashboard.html', username=user, stats=stats, exercises=CATALOG.exercises)
 
-    return render_template('dashboard.html',
-                          username=user,
-                          stats=stats,
-                          exercises=EXERCISES)
+    html = render_template('dashboard.html',
+                           username=user,
+                           stats=stats,
+                           exercises=CATALOG.exercises)
+    return send_cached(render_cache.put('dashboard', user, version, html))
 
 @app.route('/select_workout')
 def select_workout():
-    if not rfid_auth or not rfid_auth.get_current_user():
+    if not current_user():
         return redirect(url_for('index'))
-    return render_template('select_workout.html')
+    return render_template('select_workout.html', websocket=WEBSOCKET_AVAILABLE)
 
 @app.route('/workout_monitor')
 def workout_monitor():
-    if not rfid_auth or not rfid_auth.get_current_user():
+    if not current_user():
         return redirect(url_for('index'))
-    if not workout_state['active']:
+    if not viewed_state().workout['active']:
         return redirect(url_for('dashboard'))
     return render_template('workout_monitor.html')
 
 @app.route('/history')
 def history():
-    if not rfid_auth:
-        return redirect(url_for('index'))
-
-    user = rfid_auth.get_current_user()
+    user = current_user()
     if not user:
         return redirect(url_for('index'))
 
+    version = database.data_version(user)
+    page = render_cache.get('history', user, version)
+    if page:
+        return send_cached(page)
+
     try:
         history_data = database.get_workout_history(user)
         # Reverse to show newest first
         history_data.reverse()
     except Exception as e:
-        print(f"Error getting history: {e}")
-        history_data = []
+        log.error("history_failed", user=user, error=e)
+        # Do not cache the fallback page
+        return render_template('history.html', username=user, history=[])
 
-    return render_template('history.html',
-                          username=user,
-                          history=history_data)
+    html = render_template('history.html',
+                           username=user,
+                           history=history_data)
+    return send_cached(render_cache.put('history', user, version, html))
 
 @app.route('/api/serial_status')
 def serial_status():
     try:
         return jsonify({
-            "connected": serial_handler.is_running if serial_handler else False,
-            "current_user": rfid_auth.get_current_user() if rfid_auth else None
+            "connected": serial_handler.is_connected if serial_handler else False,
+            "current_user": current_user(),
+            "clock": clock_sync.status() if clock_sync else None
         })
     except Exception as e:
-        print(f"Error in serial_status: {e}")
+        log.error("serial_status_failed", error=e)
         return jsonify({
             "connected": False,
             "current_user": None
         })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Counters and latency histograms in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def admin_allowed() -> bool:
+    """ADMIN_TOKEN in X-Admin-Token (no admin access while ADMIN_TOKEN is unset)"""
+    if not ADMIN_TOKEN:
+        return False
+    return secrets.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+@app.route('/admin/profile')
+def admin_profile():
+    """
+    Sample every thread's stack for a while and return folded stacks (flamegraph.pl input)
+
+    Query args: seconds (default 10), interval (seconds between samples),
+    threads (comma-separated name prefixes, e.g. serial,MainThread).
+    """
+    if not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', PROFILER_INTERVAL))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if seconds <= 0 or not 0.0005 <= interval <= 1:
+        return jsonify({"error": "seconds must be > 0 and interval between 0.0005 and 1"}), 400
+    threads = [t for t in request.args.get('threads', '').split(',') if t] or None
+    try:
+        result = profiler.profile(seconds, interval, threads)
+    except profiler.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    log.info("profile_served", samples=result.samples, seconds=f"{result.seconds:.1f}")
+    response = Response(result.folded(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(result.samples)
+    return response
+
+@app.route('/admin/sync')
+def admin_sync():
+    """Upload checkpoint per history file, consecutive failures and the last error"""
+    if not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    if sync_agent is None:
+        return jsonify({"error": "Sync not configured (SYNC_URL)"}), 404
+    return jsonify(sync_agent.status())
+
 @app.route('/api/start_workout', methods=['POST'])
 def start_workout():
     """Start a new workout session"""
-    if not rfid_auth or not rfid_auth.get_current_user():
+    if not current_user():
         return jsonify({"error": "Not logged in"}), 401
 
     data = request.json
@@ -147,12 +472,14 @@ def start_workout():
     sets = int(data.get('sets', 0))
 
     # Find exercise details
-    exercise_data = next((ex for ex in EXERCISES if ex['id'] == exercise_id), None)
+    exercise_data = CATALOG.get(exercise_id)
     if not exercise_data:
         return jsonify({"error": "Invalid exercise"}), 400
 
     # Reset workout state
-    workout_state.update({
+    state = station_state(g.station)
+    replaced = state.workout['active']
+    state.workout.update({
         'active': True,
         'exercise': exercise_id,
         'exerciseName': exercise_data['name'],
@@ -167,113 +494,292 @@ def start_workout():
         'status': 'waiting',
         'validReps': 0
     })
+    state.rep_timeline = None  # main.py starts a new one with the first rep
+    state.publish_workout()
 
-    # Send workout config to MCU
+    # Send workout config to MCU (cancelling the workout this one replaces)
     # Format: WORKOUT_START|exercise_id|reps|sets
-    if serial_handler:
-        message = f"WORKOUT_START|{exercise_id}|{reps}|{sets}\n"
-        serial_handler.send_message(message)
-        print(f"→ Sent to MCU: {message.strip()}")
+    mcu = mcu_for(g.station)
+    if mcu:
+        messages = ["WORKOUT_CANCEL\n"] if replaced else []
+        mcu.send_batch(messages + [f"WORKOUT_START|{exercise_id}|{reps}|{sets}\n"])
+        log.info("workout_start_sent", exercise=exercise_id, reps=reps, sets=sets)
 
     return jsonify({"success": True})
 
 @app.route('/api/workout_status')
 def get_workout_status():
     """Get current workout state"""
-    return jsonify(workout_state)
+    return jsonify(viewed_state().workout)
 
 @app.route('/api/workout_updates')
 def get_workout_updates():
-    """Poll for real-time workout updates"""
-    return jsonify({
-        'status': workout_state['status'],
-        'reps': workout_state['currentReps'],
-        'currentSet': workout_state['currentSet'],
-        'calories': workout_state['totalCalories'],
-        'totalReps': workout_state['currentReps'],
-        'validReps': workout_state['validReps']
-    })
+    """Poll for real-time workout updates (/api/events pushes the same data)"""
+    return jsonify(viewed_state().snapshot())
+
+# Topics a viewer may subscribe to on /api/events and /ws/events
+EVENT_TOPICS = ('workout', 'selection', 'imu')
+
+def requested_topics():
+    """
+    Bus topics of this browser's station for ?topics=workout,selection (default: all);
+    None if an unknown topic is asked for
+    """
+    topics = [t for t in request.args.get('topics', ','.join(EVENT_TOPICS)).split(',') if t]
+    if not topics or any(t not in EVENT_TOPICS for t in topics):
+        return None
+    state = viewed_state()
+    return [state.topic(t) for t in topics]
+
+@app.route('/api/events')
+def event_stream():
+    """
+    Live workout and selection events as Server-Sent Events
+
+    A new viewer first gets the latest event of each topic; a reconnecting
+    EventSource (Last-Event-ID) gets what it missed if it is still buffered.
+    """
+    topics = requested_topics()
+    if topics is None:
+        return jsonify({"error": f"topics must be among {', '.join(EVENT_TOPICS)}"}), 400
+    last_id = request.headers.get('Last-Event-ID', '')
+    if last_id.isdigit():
+        sub = BUS.subscribe(topics, after=int(last_id))
+        initial = []
+    else:
+        sub = BUS.subscribe(topics)
+        initial = [e for e in (BUS.latest(t) for t in topics) if e]
+    response = Response(sse_stream(sub, initial, EVENT_STREAM_KEEPALIVE), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Do not let a proxy hold events back
+    return response
+
+@app.route('/api/imu_analysis')
+def get_imu_analysis():
+    """Latest IMU window analysis (cadence, reps, smoothness) and the worker pool state"""
+    if imu_analyzer is None:
+        return jsonify({"error": "IMU analysis off (numpy not installed or IMU_ANALYSIS_WORKERS = 0)"}), 503
+    return jsonify({"latest": imu_analyzer.latest, "pool": imu_analyzer.status()})
+
+@app.route('/api/workout_timeline')
+def get_workout_timeline():
+    """Tempo, rest and fatigue per set of the workout in progress"""
+    timeline = viewed_state().rep_timeline
+    if timeline is None:
+        return jsonify({"error": "No workout in progress"}), 404
+    return jsonify(timeline.summary())
+
+@app.route('/api/timeline_history')
+def get_timeline_history():
+    """Per-set tempo, rest and fatigue of the user's last workouts (?limit=, default 10)"""
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Not logged in"}), 401
+    if timelines is None:
+        return jsonify([])
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(timelines.load(user, limit))
 
 @app.route('/api/cancel_workout', methods=['POST'])
 def cancel_workout():
     """Cancel current workout"""
-    workout_state['active'] = False
+    if not g.station:
+        return jsonify({"error": "No station"}), 400
+    state = station_state(g.station)
+    state.end_workout()
 
-    # Send cancel to MCU
-    if serial_handler:
-        serial_handler.send_message("WORKOUT_CANCEL\n")
+    # Send cancel to MCU; with batching the web selection goes back on the OLED in the same frame
+    mcu = mcu_for(g.station)
+    if mcu:
+        mcu.send_batch(["WORKOUT_CANCEL\n"] + (state.selection_messages() if mcu.batching else []))
 
     return jsonify({"success": True})
 
 @app.route('/api/oled_selection')
 def get_oled_selection():
     """Get current OLED selections (for frontend sync)"""
-    return jsonify(oled_selection)
+    return jsonify(viewed_state().selection)
 
 @app.route('/api/send_frontend_selection', methods=['POST'])
 def send_frontend_selection():
     """Send frontend selection to MCU/OLED display"""
-    if not serial_handler:
+    if not mcu_for(g.station):
         return jsonify({"error": "Serial not connected"}), 503
 
     data = request.json
-    selection_type = data.get('type')  # 'exercise', 'reps', 'sets'
-    value = data.get('value')
-
-    # Send to MCU so OLED can display it
-    if selection_type == 'exercise':
-        message = f"WEB_EXERCISE|{value}\n"
-        serial_handler.send_message(message)
-        print(f"→ Web selected exercise: {value}")
-    elif selection_type == 'reps':
-        message = f"WEB_REPS|{value}\n"
-        serial_handler.send_message(message)
-        print(f"→ Web selected reps: {value}")
-    elif selection_type == 'sets':
-        message = f"WEB_SETS|{value}\n"
-        serial_handler.send_message(message)
-        print(f"→ Web selected sets: {value}")
-
+    forward_selection(g.station, data.get('type'), data.get('value'))
     return jsonify({"success": True})
 
+# Selection type from the page -> MCU command that shows it on the OLED
+def forward_selection(station, selection_type, value) -> bool:
+    """Send a web selection ('exercise', 'reps' or 'sets') to the station's MCU so the OLED can display it"""
+    command = WEB_SELECTION_COMMANDS.get(selection_type)
+    mcu = mcu_for(station)
+    if not command or not mcu:
+        return False
+    mcu.send_message(f"{command}|{value}\n")
+    station_state(station).web_selection[selection_type] = value
+    log.info("web_selection", station=station, type=selection_type, value=value)
+    return True
+
+if WEBSOCKET_AVAILABLE:
+    @sock.route('/ws/selection')
+    def selection_socket(ws):
+        """
+        Hybrid selection sync over one connection
+
+        Server -> page: the station's full OLED selection on connect and after every change.
+        Page -> server: {"type": "exercise"|"reps"|"sets", "value": ...}, forwarded to the MCU.
+        """
+        state = viewed_state()
+        station = g.station
+        sub = BUS.subscribe((state.topic('selection'),))
+
+        def read_loop():
+            try:
+                while True:
+                    try:
+                        data = json.loads(ws.receive())
+                        forward_selection(station, data.get('type'), data.get('value'))
+                    except (ValueError, TypeError, AttributeError) as e:
+                        log.warning("ws_bad_message", error=e)
+            except ConnectionClosed:
+                pass
+            finally:
+                sub.close()  # Wakes the writer
+
+        threading.Thread(target=read_loop, daemon=True, name="ws-selection").start()
+        try:
+            ws.send(json.dumps(state.selection))
+            while not sub.closed:
+                events = sub.poll(EVENT_STREAM_KEEPALIVE)
+                if events:
+                    # Only the newest selection matters to the page
+                    ws.send(json.dumps(events[-1].data))
+        except (ConnectionClosed, SlowConsumer):
+            pass
+        finally:
+            sub.close()
+
+    @sock.route('/ws/events')
+    def event_socket(ws):
+        """
+        Same events as /api/events over a WebSocket (?topics=...), one
+        {"seq", "topic", "data"} JSON frame per event
+        """
+        topics = requested_topics() or [viewed_state().topic(t) for t in EVENT_TOPICS]
+        sub = BUS.subscribe(topics)
+        try:
+            for event in (BUS.latest(t) for t in topics):
+                if event:
+                    ws.send(event.json())
+            while ws.connected:
+                for event in sub.poll(EVENT_STREAM_KEEPALIVE):
+                    ws.send(event.json())
+        except SlowConsumer:
+            ws.close(reason=1008, message="Too far behind")
+        except ConnectionClosed:
+            pass
+        finally:
+            sub.close()
+
+@app.route('/api/analytics/<report>')
+def analytics_report(report):
+    """
+    Gym-wide reports: weekly_volume, accuracy, leaderboard, calories, summary
+
+    Query args: user, start/end (YYYY-MM-DD, end inclusive); leaderboard also
+    takes exercise, metric (reps, valid_reps, workouts, minutes) and limit.
+    Reports on another member (user) are only for admin requests.
+    """
+    me = current_user()
+    if not me:
+        return jsonify({"error": "Not logged in"}), 401
+    if analytics is None:
+        return jsonify({"error": "Analytics unavailable (numpy not installed)"}), 503
+
+    args = request.args
+    user = args.get('user')
+    if user and user.lower() != me.lower() and not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        start = day_epoch(args['start']) if args.get('start') else None
+        end = day_epoch(args['end']) + 86400 if args.get('end') else None
+        if report == 'weekly_volume':
+            data = analytics.weekly_volume(user, start, end)
+        elif report == 'accuracy':
+            data = analytics.accuracy_trend(user, start, end)
+        elif report == 'leaderboard':
+            limit = int(args.get('limit', 10))
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+            data = analytics.leaderboard(args.get('exercise'), args.get('metric', 'reps'),
+                                         start, end, limit)
+        elif report == 'calories':
+            data = analytics.calories(user, start, end)
+        elif report == 'summary':
+            data = analytics.summary()
+        else:
+            return jsonify({"error": f"Unknown report: {report}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+@app.route('/api/export')
+def export_history():
+    """
+    Workout history as a streamed download
+
+    Query args: format (csv or ndjson), user (default: the logged-in user;
+    "all" for the whole gym), start/end (YYYY-MM-DD, end inclusive), exercise.
+    Other members' history and "all" are only for admin requests (admin_allowed).
+    """
+    user = current_user()
+    args = request.args
+    target = args.get('user', user)
+    if not admin_allowed():
+        if not user:
+            return jsonify({"error": "Not logged in"}), 401
+        if target.lower() != user.lower():
+            return jsonify({"error": "Forbidden"}), 403
+    elif not target:
+        return jsonify({"error": "user is required"}), 400
+
+    fmt = args.get('format', 'csv')
+    filters = {
+        'user': None if target == 'all' else target,
+        'start': args.get('start'),
+        'end': args.get('end'),
+        'exercise': args.get('exercise'),
+    }
+    try:
+        chunks = export_chunks(database.data_dir, fmt, **filters)
+        # Run up to the first chunk now, so bad arguments still get a 400
+        first = next(chunks, '')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def stream():
+        yield first
+        yield from chunks
+
+    response = Response(stream(), mimetype=FORMATS[fmt])
+    name = ''.join(c for c in target if c.isalnum() or c in '-_') or 'export'
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}_workouts.{fmt}"'
+    return response
+
 @app.route('/api/logout')
 def logout():
-    if rfid_auth:
-        rfid_auth.logout()
-
-    # Cancel any active workout
-    workout_state['active'] = False
-
-    # Reset OLED selection
-    oled_selection.update({
-        'exercise': None,
-        'exerciseName': None,
-        'icon': None,
-        'caloriesPerRep': 0,
-        'reps': None,
-        'sets': None
-    })
+    if rfid_auth and g.station:
+        rfid_auth.logout(g.station)
+        # Cancel any active workout and reset the OLED selection
+        end_session(g.station)
 
     return redirect(url_for('index'))
 
-def update_workout_state(status=None, reps=None, current_set=None, valid_reps=None, calories=None):
-    """Helper function to update workout state from main.py"""
-    if status is not None:
-        workout_state['status'] = status
-    if reps is not None:
-        workout_state['currentReps'] = reps
-    if current_set is not None:
-        workout_state['currentSet'] = current_set
-    if valid_reps is not None:
-        workout_state['validReps'] = valid_reps
-    if calories is not None:
-        workout_state['totalCalories'] = calories
-
-def complete_workout():
-    """Mark workout as completed"""
-    workout_state['status'] = 'completed'
-    workout_state['active'] = False
-
 def run_flask():
     """Run Flask in a separate thread"""
     app.run(host=HOST, port=PORT, debug=False, use_reloader=False, threaded=True)
@@ -0,0 +1,296 @@
+# archive.py
+"""
+Columnar binary archive for completed workouts
+
+One directory per user, one fixed-width little-endian file per column:
+
+    timestamp.bin   int64   seconds since 1970 (wall-clock time, as in the CSV; whole seconds)
+    exercise.bin    uint16  code into exercises.txt (one name per line)
+    reps.bin        int32
+    sets.bin        int32
+    duration.bin    float32 minutes
+    valid_reps.bin  int32
+
+Appending is a write at the end of each file. Reads memory-map the files, so
+scans run on the OS page cache with no parsing, and rows are kept in time
+order so a time range is two binary searches. Row count is the shortest
+column: a crash mid-append leaves extra entries in some columns, which reads
+ignore and the next append cuts off before writing.
+
+This is a storage format with converters; the station itself still records
+to and reads from the *_workouts.csv files.
+
+    python archive.py import user_data/john_workouts.csv user_data/archive/john
+    python archive.py export user_data/archive/john john_workouts.csv
+"""
+import argparse
+import bisect
+import csv
+import mmap
+import pathlib
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from analytics import to_epoch
+
+# NumPy is optional: columns() returns zero-copy ndarrays when it is installed
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('timestamp', 'q'),
+    ('exercise', 'H'),
+    ('reps', 'i'),
+    ('sets', 'i'),
+    ('duration', 'f'),
+    ('valid_reps', 'i'),
+)
+CSV_HEADER = ["timestamp", "exercise", "reps", "sets", "duration_min", "valid_reps"]
+
+if sys.byteorder != 'little':
+    raise ImportError("archive.py stores little-endian columns and assumes a little-endian host")
+
+class WorkoutArchive:
+    """One user's archived workouts"""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._names_file = self.path / 'exercises.txt'
+        self.exercise_names: List[str] = []
+        if self._names_file.exists():
+            text = self._names_file.read_text(encoding='utf-8')
+            # A name cut short by a crash has no newline yet; rows never referenced it
+            self.exercise_names = text[:text.rfind('\n') + 1].splitlines()
+            if not text.endswith('\n'):
+                self._names_file.write_text(''.join(n + '\n' for n in self.exercise_names), encoding='utf-8')
+        self._codes: Dict[str, int] = {name: i for i, name in enumerate(self.exercise_names)}
+        self._maps: Dict[str, Tuple[int, Optional[mmap.mmap], Optional[memoryview]]] = {}
+
+    def _file(self, column: str) -> pathlib.Path:
+        return self.path / f"{column}.bin"
+
+    def __len__(self) -> int:
+        counts = []
+        for column, code in COLUMNS:
+            path = self._file(column)
+            counts.append(path.stat().st_size // array(code).itemsize if path.exists() else 0)
+        return min(counts)
+
+    # ==========================================
+    # WRITING
+    # ==========================================
+
+    def _exercise_code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            if '\n' in name:
+                raise ValueError(f"Exercise name contains a newline: {name!r}")
+            code = self._codes[name] = len(self.exercise_names)
+            self.exercise_names.append(name)
+            with open(self._names_file, 'a', encoding='utf-8') as f:
+                f.write(name + '\n')
+        return code
+
+    def last_timestamp(self) -> Optional[int]:
+        count = len(self)
+        return self.column('timestamp')[count - 1] if count else None
+
+    def append_many(self, rows: Iterable[Tuple[int, str, int, int, float, int]]) -> int:
+        """
+        Append (timestamp, exercise, reps, sets, duration_min, valid_reps) rows
+
+        Rows must not be older than what is already archived (range queries
+        rely on time order); sort before appending historical data.
+        """
+        buffers = {column: array(code) for column, code in COLUMNS}
+        last = self.last_timestamp()
+        for timestamp, exercise, reps, sets, duration, valid_reps in rows:
+            if last is not None and timestamp < last:
+                raise ValueError(f"Row at {timestamp} is older than the archive's last row ({last})")
+            last = timestamp
+            buffers['timestamp'].append(timestamp)
+            buffers['exercise'].append(self._exercise_code(exercise))
+            buffers['reps'].append(reps)
+            buffers['sets'].append(sets)
+            buffers['duration'].append(duration)
+            buffers['valid_reps'].append(valid_reps)
+
+        count = len(buffers['timestamp'])
+        if count:
+            # Entries past the row count are left over from a torn append: cut them
+            # off, or the new rows would land after them and every column would shift
+            rows = len(self)
+            for column, code in COLUMNS:
+                with open(self._file(column), 'ab') as f:
+                    f.truncate(rows * array(code).itemsize)
+                    buffers[column].tofile(f)
+        return count
+
+    def append(self, timestamp: int, exercise: str, reps: int, sets: int,
+               duration: float, valid_reps: int):
+        self.append_many([(timestamp, exercise, reps, sets, duration, valid_reps)])
+
+    # ==========================================
+    # READING
+    # ==========================================
+
+    def column(self, name: str) -> memoryview:
+        """Zero-copy view of a whole column (re-mapped when the file has grown)"""
+        code = dict(COLUMNS)[name]
+        path = self._file(name)
+        size = path.stat().st_size if path.exists() else 0
+        mapped = self._maps.get(name)
+        if mapped and mapped[0] == size:
+            return mapped[2]
+        # An older, shorter mapping is left to the garbage collector: views
+        # handed out earlier (e.g. to a running rows() scan) stay valid
+        if size == 0:
+            view = memoryview(array(code))
+            self._maps[name] = (0, None, view)
+            return view
+        with open(path, 'rb') as f:
+            region = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        usable = size - size % array(code).itemsize
+        view = memoryview(region)[:usable].cast(code)
+        self._maps[name] = (size, region, view)
+        return view
+
+    def index_range(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """Row indexes [lo, hi) with start <= timestamp < end (epoch seconds)"""
+        count = len(self)
+        timestamps = self.column('timestamp')
+        lo = bisect.bisect_left(timestamps, start, 0, count) if start is not None else 0
+        hi = bisect.bisect_left(timestamps, end, lo, count) if end is not None else count
+        return lo, hi
+
+    def columns(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """Column slices for a time range: ndarrays with NumPy, memoryviews without (no copying either way)"""
+        lo, hi = self.index_range(start, end)
+        result = {}
+        for name, code in COLUMNS:
+            view = self.column(name)[lo:hi]
+            result[name] = np.frombuffer(view, dtype=np.dtype(code)) if NUMPY_AVAILABLE else view
+        return result
+
+    def rows(self, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Dict]:
+        """Rows in the CSV history format (timestamp as ISO string)"""
+        lo, hi = self.index_range(start, end)
+        views = {name: self.column(name) for name, _ in COLUMNS}
+        names = self.exercise_names
+        for i in range(lo, hi):
+            yield {
+                'timestamp': datetime.fromtimestamp(views['timestamp'][i], timezone.utc)
+                             .replace(tzinfo=None).isoformat(),
+                'exercise': names[views['exercise'][i]],
+                'reps': views['reps'][i],
+                'sets': views['sets'][i],
+                'duration_min': round(views['duration'][i], 1),
+                'valid_reps': views['valid_reps'][i],
+            }
+
+    def summary(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """Same numbers as UserDatabase.get_total_stats, from the mapped columns"""
+        lo, hi = self.index_range(start, end)
+        if hi == lo:
+            return {"total_workouts": 0, "total_reps": 0, "avg_accuracy": 0}
+        if NUMPY_AVAILABLE:
+            c = self.columns(start, end)
+            done = c['reps'].astype(np.int64) * c['sets']
+            accuracy = np.where(done > 0, c['valid_reps'] / np.maximum(done, 1) * 100, 100.0)
+            return {
+                "total_workouts": hi - lo,
+                "total_reps": int(done.sum()),
+                "avg_accuracy": round(float(accuracy.mean()), 1),
+            }
+        reps, sets, valid = self.column('reps'), self.column('sets'), self.column('valid_reps')
+        total_reps = 0
+        total_accuracy = 0.0
+        for i in range(lo, hi):
+            done = reps[i] * sets[i]
+            total_reps += done
+            total_accuracy += valid[i] / done * 100 if done > 0 else 100
+        return {
+            "total_workouts": hi - lo,
+            "total_reps": total_reps,
+            "avg_accuracy": round(total_accuracy / (hi - lo), 1),
+        }
+
+    def close(self):
+        """Drop the mappings (they unmap once no view handed out by column() is left)"""
+        self._maps.clear()
+
+# ==========================================
+# CSV CONVERSION
+# ==========================================
+
+def read_csv_rows(csv_path) -> Tuple[List[Tuple[int, str, int, int, float, int]], int]:
+    """Current-schema history CSV -> (rows sorted by time, rejected row count)"""
+    rows = []
+    rejected = 0
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                reps, sets = int(row['reps']), int(row['sets'])
+                valid = row.get('valid_reps')
+                rows.append((
+                    to_epoch(datetime.fromisoformat(row['timestamp'])),
+                    row['exercise'],
+                    reps,
+                    sets,
+                    float(row['duration_min']),
+                    int(valid) if valid not in (None, '') else reps * sets,
+                ))
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+    rows.sort(key=lambda r: r[0])
+    return rows, rejected
+
+def csv_to_archive(csv_path, archive_path) -> Tuple[int, int]:
+    """Append a history CSV to an archive; returns (rows written, rows rejected)"""
+    rows, rejected = read_csv_rows(csv_path)
+    archive = WorkoutArchive(archive_path)
+    try:
+        return archive.append_many(rows), rejected
+    finally:
+        archive.close()
+
+def archive_to_csv(archive_path, csv_path) -> int:
+    """Write an archive back out as a current-schema history CSV; returns rows written"""
+    archive = WorkoutArchive(archive_path)
+    count = 0
+    try:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for row in archive.rows():
+                writer.writerow([row['timestamp'], row['exercise'], row['reps'], row['sets'],
+                                 f"{row['duration_min']:.1f}", row['valid_reps']])
+                count += 1
+    finally:
+        archive.close()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between history CSVs and the columnar archive")
+    sub = parser.add_subparsers(dest='command', required=True)
+    to_archive = sub.add_parser('import', help="CSV -> archive (appends)")
+    to_archive.add_argument('csv')
+    to_archive.add_argument('archive')
+    to_csv = sub.add_parser('export', help="archive -> CSV")
+    to_csv.add_argument('archive')
+    to_csv.add_argument('csv')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        written, rejected = csv_to_archive(args.csv, args.archive)
+        print(f"{written} rows archived, {rejected} rejected")
+    else:
+        print(f"{archive_to_csv(args.archive, args.csv)} rows exported")
+
+if __name__ == "__main__":
+    main()
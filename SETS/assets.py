@@ -0,0 +1,39 @@
+# assets.py
+import hashlib
+import pathlib
+import threading
+from typing import Dict, Optional, Tuple
+
+class AssetHashes:
+    """
+    Content hashes of static files, for cache-busting URLs
+
+    static_url('css/clean.css') -> /static/css/clean.css?h=<hash>. The hash
+    only changes when the file does, so browsers can cache the URL forever
+    and still pick up an edited stylesheet straight away. Hashes are cached
+    per (mtime, size), so a page render costs one stat per asset.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = pathlib.Path(static_folder)
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def hash(self, filename: str) -> Optional[str]:
+        path = self.static_folder / filename
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._hashes.get(filename)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        digest = hashlib.blake2b(path.read_bytes(), digest_size=6).hexdigest()
+        with self._lock:
+            self._hashes[filename] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def is_current(self, filename: str, digest: str) -> bool:
+        """True if digest is the hash of the file as it is now"""
+        return bool(digest) and self.hash(filename) == digest
@@ -0,0 +1,304 @@
+# bench.py
+"""
+Benchmarks for the serial-to-UI pipeline
+
+Runs against the in-memory LoopbackLink + VirtualMCU (no hardware) and prints
+JSON results, so runs can be diffed to catch regressions or compare hosts.
+
+    python bench.py                              # all cases, JSON to stdout
+    python bench.py --cases framing,dispatch     # subset
+    python bench.py --rows 1000,100000 --output bench.json
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import event_log
+import app as flask_app
+import main
+from database import UserDatabase
+from rfid_auth import RFIDAuth
+from serial_handler import LineFramer, SerialHandler
+from transport import LoopbackLink
+from virtual_mcu import VirtualMCU
+from exercises import CATALOG
+from config import BAUD_RATE, TIMEOUT
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p90/p99/max of latency samples, in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 4)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'p50_ms': pick(0.50),
+        'p90_ms': pick(0.90),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+def message_mix(count: int, seed: int = 1) -> List[str]:
+    """Realistic MCU traffic: mostly IMU_DATA, a rep every ~20 samples, some config/status"""
+    rng = random.Random(seed)
+    messages = []
+    rep = 0
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.90:
+            messages.append(f"IMU_DATA|Y|{rng.uniform(-15, 15):.2f}|{i}")
+        elif roll < 0.95:
+            rep = rep % 10 + 1
+            messages.append(f"REP_DETECT|{rep}|1|{i}")
+        elif roll < 0.97:
+            messages.append(f"HEARTBEAT|{i}")
+        elif roll < 0.98:
+            messages.append(f"CFG_REPS|{rng.randint(5, 15)}")
+        elif roll < 0.99:
+            messages.append("STATUS|active")
+        else:
+            messages.append("→ Frontend: debug line from the sketch")
+    return messages
+
+def setup_app(data_dir: pathlib.Path) -> LoopbackLink:
+    """Wire main/app globals to a loopback SerialHandler and a temp database"""
+    link = LoopbackLink()
+    handler = SerialHandler('bench', BAUD_RATE, TIMEOUT, transport_factory=link.open_host)
+    auth = RFIDAuth({"7D133721": "Bench"})
+    auth.sessions.on_expire = flask_app.session_expired
+    database = UserDatabase(data_dir)
+    main.serial_handler = flask_app.serial_handler = handler
+    main.rfid_auth = flask_app.rfid_auth = auth
+    main.database = flask_app.database = database
+    main.handle_serial_message("UID_REQ|7D 13 37 21")
+    main.handle_serial_message("WORKOUT_START|0|10|3|0")
+    return link
+
+# ==========================================
+# CASES
+# ==========================================
+
+def bench_framing(lines: int = 200000, chunk_size: int = 256) -> Dict:
+    """LineFramer throughput on a byte stream cut into serial-sized chunks"""
+    stream = ''.join(m + '\n' for m in message_mix(lines)).encode('utf-8')
+    chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    framer = LineFramer()
+
+    start = time.perf_counter()
+    framed = 0
+    for chunk in chunks:
+        framed += len(framer.feed(chunk))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'lines': framed,
+        'bytes': len(stream),
+        'seconds': round(elapsed, 4),
+        'lines_per_sec': round(framed / elapsed),
+        'mb_per_sec': round(len(stream) / elapsed / 1e6, 2),
+    }
+
+def bench_dispatch(messages: int = 100000) -> Dict:
+    """handle_serial_message throughput and per-type latency on a traffic mix"""
+    batch = message_mix(messages)
+    per_type: Dict[str, List[float]] = {}
+    handle = main.handle_serial_message
+
+    start = time.perf_counter()
+    for message in batch:
+        t0 = time.perf_counter()
+        handle(message)
+        per_type.setdefault(main.message_type(message), []).append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    main.serial_handler.tx_queue.queue.clear()
+    return {
+        'messages': len(batch),
+        'seconds': round(elapsed, 4),
+        'messages_per_sec': round(len(batch) / elapsed),
+        'per_type': {t: percentiles(s) for t, s in sorted(per_type.items())},
+    }
+
+def bench_state_updates(updates: int = 200000) -> Dict:
+    """StationState.update_workout calls per second (the REP_DETECT write path)"""
+    update = flask_app.local.update_workout
+    start = time.perf_counter()
+    for i in range(updates):
+        update(reps=i % 20, current_set=1 + i % 3, calories=i * 0.5)
+    elapsed = time.perf_counter() - start
+    return {
+        'updates': updates,
+        'seconds': round(elapsed, 4),
+        'updates_per_sec': round(updates / elapsed),
+    }
+
+def bench_rx_to_ui(reps: int = 500, imu_rate: float = 2000, rep_interval: float = 0.02) -> Dict:
+    """
+    Latency from the MCU writing REP_DETECT to /api/workout_updates showing it
+
+    Full stack: VirtualMCU -> LoopbackLink -> SerialHandler RX thread ->
+    main loop dispatch -> station workout state -> Flask test client poll.
+    IMU_DATA background traffic runs at imu_rate messages/s.
+    """
+    link = LoopbackLink()
+    mcu = VirtualMCU(link.open_device(), speed=1.0, seed=1)
+    handler = SerialHandler('bench', BAUD_RATE, TIMEOUT, transport_factory=link.open_host)
+    main.serial_handler = flask_app.serial_handler = handler
+    mcu.start()
+    handler.start()
+
+    stop = threading.Event()
+
+    def dispatch_loop():
+        while not stop.is_set():
+            message = handler.get_message(timeout=0.05)
+            if message:
+                main.handle_serial_message(message)
+
+    sent_at: Dict[int, float] = {}
+    seen_at: Dict[int, float] = {}
+
+    def poll_loop():
+        client = flask_app.app.test_client()
+        client.get(flask_app.kiosk_path())  # Follow the station like the kiosk does
+        while not stop.is_set():
+            rep = client.get('/api/workout_updates').get_json()['reps']
+            if rep and rep not in seen_at:
+                seen_at[rep] = time.perf_counter()
+
+    threads = [threading.Thread(target=dispatch_loop, daemon=True),
+               threading.Thread(target=poll_loop, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    main.handle_serial_message("WORKOUT_START|0|10|3|0")
+    for rep in range(1, reps + 1):
+        mcu.flood("IMU_DATA", rate=imu_rate, seconds=rep_interval)
+        sent_at[rep] = time.perf_counter()
+        mcu.send(f"REP_DETECT|{rep}|1|{mcu.millis()}")
+    time.sleep(0.5)
+
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=1.0)
+    handler.stop()
+    mcu.stop()
+
+    latencies = [seen_at[r] - sent_at[r] for r in sent_at if r in seen_at]
+    result = percentiles(latencies)
+    result.update({'reps_sent': reps, 'reps_seen': len(latencies),
+                   'imu_rate': imu_rate, 'mcu_messages': mcu.sent_count})
+    return result
+
+def write_history(database: UserDatabase, username: str, rows: int):
+    """Bulk-create a history file in the current schema"""
+    database.create_user_file(username)
+    rng = random.Random(rows)
+    start = datetime(2024, 1, 1)
+    with open(database.get_user_file(username), 'a', newline='') as f:
+        for i in range(rows):
+            reps, sets = rng.randint(5, 15), rng.randint(1, 5)
+            f.write(f"{(start + timedelta(minutes=i)).isoformat()},"
+                    f"{rng.choice(CATALOG.exercises)['name']},{reps},{sets},"
+                    f"{rng.uniform(1, 20):.1f},{rng.randint(0, reps * sets)}\n")
+
+def bench_database(sizes: List[int], data_dir: pathlib.Path) -> Dict:
+    """UserDatabase write/read/stats cost at several history sizes"""
+    database = UserDatabase(data_dir)
+    results = {}
+    for rows in sizes:
+        username = f"bench{rows}"
+        write_history(database, username, rows)
+
+        writes = []
+        for _ in range(50):
+            t0 = time.perf_counter()
+            database.record_workout(username, "Bicep Curl", 10, 3, 5.0, 28)
+            writes.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        history = database.get_workout_history(username)
+        read_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        database.get_total_stats(username)
+        stats_time = time.perf_counter() - t0
+
+        results[str(rows)] = {
+            'rows': len(history),
+            'file_mb': round(database.get_user_file(username).stat().st_size / 1e6, 2),
+            'record_workout': percentiles(writes),
+            'get_workout_history_ms': round(read_time * 1000, 2),
+            'get_total_stats_ms': round(stats_time * 1000, 2),
+        }
+        database.get_user_file(username).unlink()
+    return results
+
+# ==========================================
+# RUNNER
+# ==========================================
+
+CASES = ['framing', 'dispatch', 'state', 'rx_to_ui', 'database']
+
+def run(cases: List[str], sizes: List[int]) -> Dict:
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = pathlib.Path(tmp)
+        setup_app(data_dir)
+        for case in cases:
+            if case == 'framing':
+                outcome = bench_framing()
+            elif case == 'dispatch':
+                outcome = bench_dispatch()
+            elif case == 'state':
+                outcome = bench_state_updates()
+            elif case == 'rx_to_ui':
+                outcome = bench_rx_to_ui()
+            elif case == 'database':
+                outcome = bench_database(sizes, data_dir)
+            else:
+                raise SystemExit(f"Unknown case: {case} (choose from {', '.join(CASES)})")
+            results['cases'][case] = outcome
+            print(f"done: {case}", file=sys.stderr)
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="SETS serial-to-UI pipeline benchmarks")
+    parser.add_argument('--cases', default=','.join(CASES), help="Comma-separated subset of: " + ', '.join(CASES))
+    parser.add_argument('--rows', default='1000,100000,1000000', help="History sizes for the database case")
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep handler logging out of the measurements (and out of stdout)
+    event_log.set_level('ERROR')
+
+    results = run([c.strip() for c in args.cases.split(',') if c.strip()],
+                  [int(n) for n in args.rows.split(',')])
+    text = json.dumps(results, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main_cli()
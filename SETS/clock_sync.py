@@ -0,0 +1,153 @@
+# clock_sync.py
+"""
+Map MCU millis() timestamps onto the host clock
+
+The host sends PING every CLOCK_SYNC_INTERVAL and the MCU answers PONG|millis.
+Each exchange gives one sample: the MCU time sits somewhere between the host
+write and the host read, so offset = mcu_ms - midpoint with an error of at most
+half the round trip. Exchanges that were slowed down by USB or scheduler
+jitter have long round trips, so only the fastest samples are used: their
+offsets are fitted against host time, which gives the current offset and the
+drift of the MCU crystal relative to the host clock.
+
+All host times are time.monotonic() seconds; to_wall() converts to epoch seconds.
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+from config import CLOCK_SYNC_SAMPLES, CLOCK_SYNC_MIN_SPAN, CLOCK_SYNC_PONG_TIMEOUT, CLOCK_SYNC_STEP_MS
+from event_log import get_logger
+
+log = get_logger("clock")
+
+class Sample(NamedTuple):
+    host: float        # Midpoint of the exchange (monotonic seconds)
+    rtt: float         # Round trip (seconds)
+    offset_ms: float   # MCU ms - host ms at that midpoint
+
+class ClockSync:
+    """
+    Offset and drift of the MCU clock, from PING/PONG round trips
+
+    ping_sent() is called with the time the PING actually left the host (see
+    SerialHandler.on_transmit), pong_received() with the time the answer was
+    read. PONGs are matched to PINGs in order; unanswered PINGs expire after
+    CLOCK_SYNC_PONG_TIMEOUT.
+    """
+
+    def __init__(self, max_samples: int = CLOCK_SYNC_SAMPLES, min_span: float = CLOCK_SYNC_MIN_SPAN,
+                 clock=time.monotonic):
+        self.min_span = min_span
+        self.clock = clock
+        self._pending: Deque[float] = deque(maxlen=16)
+        self._samples: Deque[Sample] = deque(maxlen=max_samples)
+        # Model: mcu_ms = host_ms + offset_ms + drift * (host_ms - ref_ms)
+        self._ref_ms = 0.0
+        self._offset_ms = 0.0
+        self.drift = 0.0
+        self.synced = False
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget everything (the MCU rebooted, so millis() started again from 0)"""
+        with self._lock:
+            self._pending.clear()
+            self._samples.clear()
+            self.drift = 0.0
+            self.synced = False
+
+    def clear_pending(self):
+        """Drop unanswered PINGs (e.g. after a reconnect, whose handshake PONGs must not match them)"""
+        with self._lock:
+            self._pending.clear()
+
+    # ==========================================
+    # SAMPLES
+    # ==========================================
+
+    def ping_sent(self, host_time: Optional[float] = None):
+        with self._lock:
+            self._pending.append(self.clock() if host_time is None else host_time)
+
+    def pong_received(self, mcu_ms: int, host_time: Optional[float] = None) -> Optional[Sample]:
+        """Pair a PONG with the oldest outstanding PING; returns the sample, or None if unmatched"""
+        received = self.clock() if host_time is None else host_time
+        with self._lock:
+            while self._pending and received - self._pending[0] > CLOCK_SYNC_PONG_TIMEOUT:
+                self._pending.popleft()
+            if not self._pending:
+                return None
+            sent = self._pending.popleft()
+            if received < sent:
+                return None
+            midpoint = (sent + received) / 2
+            sample = Sample(midpoint, received - sent, mcu_ms - midpoint * 1000)
+
+            if self.synced and abs(sample.offset_ms - self._offset_at(midpoint * 1000)) > CLOCK_SYNC_STEP_MS:
+                # millis() jumped: the MCU restarted without us seeing MCU_READY
+                log.warning("mcu_clock_step", step_ms=round(sample.offset_ms - self._offset_at(midpoint * 1000)))
+                self._samples.clear()
+                self.drift = 0.0
+            self._samples.append(sample)
+            self._fit()
+            return sample
+
+    def _offset_at(self, host_ms: float) -> float:
+        return self._offset_ms + self.drift * (host_ms - self._ref_ms)
+
+    def _fit(self):
+        """Least-squares line through the fastest quarter of the samples"""
+        best = sorted(self._samples, key=lambda s: s.rtt)[:max(2, len(self._samples) // 4)]
+        first = min(best, key=lambda s: s.host)
+        if len(best) < 2 or max(s.host for s in best) - first.host < self.min_span:
+            # Too short a baseline for drift: use the single fastest exchange
+            fastest = best[0]
+            self._ref_ms = fastest.host * 1000
+            self._offset_ms = fastest.offset_ms
+            self.drift = 0.0
+        else:
+            n = len(best)
+            mean_h = sum(s.host for s in best) * 1000 / n
+            mean_o = sum(s.offset_ms for s in best) / n
+            var = sum((s.host * 1000 - mean_h) ** 2 for s in best)
+            cov = sum((s.host * 1000 - mean_h) * (s.offset_ms - mean_o) for s in best)
+            self.drift = cov / var
+            self._ref_ms = mean_h
+            self._offset_ms = mean_o
+        self.synced = True
+
+    # ==========================================
+    # MAPPING
+    # ==========================================
+
+    def to_host(self, mcu_ms: int) -> Optional[float]:
+        """Host monotonic time (seconds) at which the MCU clock read mcu_ms; None until synced"""
+        with self._lock:
+            if not self.synced:
+                return None
+            # mcu = h + offset + drift * (h - ref)  =>  solve for h
+            host_ms = (mcu_ms - self._offset_ms + self.drift * self._ref_ms) / (1 + self.drift)
+            return host_ms / 1000
+
+    def to_wall(self, mcu_ms: int) -> Optional[float]:
+        """Epoch seconds for an MCU timestamp; None until synced"""
+        host = self.to_host(mcu_ms)
+        if host is None:
+            return None
+        return time.time() - (self.clock() - host)
+
+    def duration(self, start_ms: int, end_ms: int) -> float:
+        """Host seconds between two MCU timestamps (drift-corrected; works before sync too)"""
+        return (end_ms - start_ms) / 1000 / (1 + self.drift)
+
+    def status(self) -> Dict:
+        with self._lock:
+            best: Tuple[Sample, ...] = tuple(sorted(self._samples, key=lambda s: s.rtt)[:1])
+            return {
+                'synced': self.synced,
+                'samples': len(self._samples),
+                'offset_ms': round(self._offset_at(self.clock() * 1000), 3) if self.synced else None,
+                'drift_ppm': round(self.drift * 1e6, 2),
+                'best_rtt_ms': round(best[0].rtt * 1000, 3) if best else None,
+            }
@@ -6,17 +6,67 @@ from datetime import datetime
 SERIAL_PORT = 'COM5'
 BAUD_RATE = 115200
 TIMEOUT = 0.5
+SERIAL_TRANSPORT = 'serial'   # 'serial' = real port, 'virtual' = in-process simulated MCU (no hardware)
+VIRTUAL_MCU_SCRIPT = None     # JSON step list for the simulated MCU (None = built-in demo)
+SERIAL_RECORD_FILE = None     # Capture all serial traffic to this file (replay with serial_recorder.py)
+SERIAL_RECORD_OVERWRITE = False  # Replace an existing capture (False = start a timestamped file next to it)
 
 # MCU Communication Delays (in seconds)
 # Increase these if your MCU is slower or experiencing buffer overflow
-MCU_INIT_DELAY = 3.0        # Wait after serial connection (MCU reset time)
+MCU_INIT_DELAY = 3.0        # Max wait after serial connection (MCU reset time)
+MCU_HANDSHAKE = True        # Wait for MCU_READY / PONG instead of always sleeping MCU_INIT_DELAY
+MCU_PING_INTERVAL = 0.25    # PING resend interval while waiting for the handshake
 MCU_MSG_DELAY = 0.2         # Minimum delay between messages (200ms)
 MCU_SEND_DELAY = 0.15       # Delay after sending message (150ms)
+MCU_BATCH = False           # Send multi-command sequences as one BATCH| frame (firmware must support it)
+MCU_BATCH_MAX_BYTES = 200   # Longest BATCH| line; longer sequences are split over several frames
 POLLING_INTERVAL = 0.1      # How often to check for messages (100ms)
 
+# Reconnect after the USB serial link drops (exponential backoff)
+RECONNECT_MIN_DELAY = 0.05          # First retry after 50ms
+RECONNECT_MAX_DELAY = 0.5           # Never wait longer than 500ms between retries
+RECONNECT_HANDSHAKE_TIMEOUT = 0.3   # Max wait for MCU_READY/PONG after reopening
+
+# MCU clock sync (PING/PONG round trips map MCU millis() onto host time)
+CLOCK_SYNC_INTERVAL = 5.0      # Seconds between sync PINGs (each costs one paced TX slot)
+CLOCK_SYNC_SAMPLES = 60        # Round trips kept; the fastest quarter is used for the fit
+CLOCK_SYNC_MIN_SPAN = 30.0     # Seconds of samples needed before estimating drift
+CLOCK_SYNC_PONG_TIMEOUT = 2.0  # Forget a PING not answered within this many seconds
+CLOCK_SYNC_STEP_MS = 1000      # Offset jump that means the MCU clock restarted
+
+# Logging (written by a background thread, never blocks the serial path)
+LOG_LEVEL = 'INFO'          # DEBUG, INFO, WARNING, ERROR
+LOG_SERIAL_LINES = False    # Log every raw RX/TX line (noisy, for protocol debugging)
+LOG_SAMPLE_EVERY = {        # Keep 1 in N log events for high-rate message types
+    'IMU_DATA': 100,
+    'REP_DETECT': 5,
+}
+
 # Application
 DATA_DIR = pathlib.Path("user_data")
 DATA_DIR.mkdir(exist_ok=True)
+ANALYTICS_REFRESH_INTERVAL = 2.0   # Min seconds between re-scans of the history files for gym-wide stats
+EXPORT_CHUNK_BYTES = 64 * 1024     # /api/export is streamed in pieces of about this size
+CONVERT_HISTORY_ON_START = False   # Run importer.py over DATA_DIR when main.py starts (else: python importer.py)
+
+# Store-and-forward upload of finished workouts to a central service (see sync_agent.py)
+SYNC_URL = None                  # e.g. 'http://central.example:5050/ingest' (None = no sync)
+SYNC_TOKEN = None                # Sent as "Authorization: Bearer <token>"
+SYNC_INTERVAL = 30.0             # Seconds between checks for new workouts (also the first retry delay)
+SYNC_BATCH_ROWS = 500            # Workouts per upload
+SYNC_MAX_BYTES_PER_SEC = 50_000  # Upload bandwidth cap (compressed bytes; 0 = no cap)
+SYNC_RETRY_MAX = 600.0           # Longest wait between retries while the service is down
+SYNC_TIMEOUT = 10.0              # Seconds per upload request
+
+# Host-side IMU_DATA analysis in worker processes (needs numpy, see imu_pool.py)
+IMU_ANALYSIS_WORKERS = None    # Worker processes (None = one per CPU core, 0 = no IMU analysis)
+IMU_WINDOW_SAMPLES = 256       # Samples per analyzed window (per axis)
+IMU_MIN_SAMPLES = 32           # Shortest partial window analyzed at the end of a set
+
+# Live event fan-out to viewers (SSE / WebSocket, see event_bus.py)
+EVENT_BUS_CAPACITY = 1024      # Recent events kept in the shared ring
+EVENT_BUS_MAX_LAG = 256        # A viewer this many events behind is disconnected (it reconnects)
+EVENT_STREAM_KEEPALIVE = 15.0  # Seconds between keepalives on idle streams
 
 # Dumbbell exercises
 EXERCISES = [
@@ -24,18 +74,30 @@ EXERCISES = [
     {"id": "shoulder_press", "name": "Seated Shoulder Press", "icon": "🏋️", "calories_per_rep": 0.7},
     {"id": "lateral_raise", "name": "Lateral Raise", "icon": "💥", "calories_per_rep": 0.6}
 ]
+EXERCISES_FILE = None        # JSON list in the same format (optional "mcu_index") to replace EXERCISES
 
-# RFID Users (move to CSV later)
+# RFID Users (used when RFID_USERS_FILE is not set or cannot be read)
 RFID_USERS = {
     "7D133721": "John",
     "00000000": "Sarah",
 }
+RFID_USERS_FILE = None      # CSV with uid,username columns, or SQLite .db with a users(uid, username) table
+RFID_RELOAD_INTERVAL = 1.0  # How often to check RFID_USERS_FILE for changes (seconds)
+
+# Stations and sessions
+STATION_ID = 'station1'           # Name of the station whose MCU is on SERIAL_PORT
+SESSION_DEFAULT_STATION = None    # Station shown to browsers that were never bound to one (None = no user)
+STATION_BIND_TOKENS = {}          # {station: token}: ?station=<name>&bind=<token> binds a browser (phones, other screens)
+SESSION_IDLE_TIMEOUT = 300        # Log a station out after this many seconds without activity
 
 # Web Server
 HOST = '0.0.0.0'  # Listen on all interfaces
 PORT = 5000
 DISPLAY_URL = 'localhost'  # User-friendly display name
+ADMIN_TOKEN = None  # X-Admin-Token for /admin/* routes and other users' exports (None = admin access disabled)
 
-# Cache busting
-import time
-CACHE_VERSION = int(time.time())  # Unix timestamp for cache busting
\ No newline at end of file
+# Sampling profiler (/admin/profile, or SIGUSR1 on Linux/macOS; see profiler.py)
+PROFILER_INTERVAL = 0.005        # Seconds between stack samples
+PROFILER_MAX_SECONDS = 60        # Longest profile a request may ask for
+PROFILER_SIGNAL_SECONDS = 10     # Length of a SIGUSR1-triggered profile
+PROFILE_DIR = pathlib.Path("profiles")  # Where SIGUSR1 profiles are written
@@ -1,13 +1,30 @@
 # database.py
 import csv
 import pathlib
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from datetime import datetime
+import metrics
+from event_log import get_logger
+
+log = get_logger("database")
 
 class UserDatabase:
     def __init__(self, data_dir: pathlib.Path):
         self.data_dir = data_dir
     
+    def data_version(self, username: str) -> Tuple[int, int]:
+        """
+        (mtime_ns, size) of the user's history file (render cache key)
+
+        Taken from the file itself, so it also changes when another writer
+        (importer, sync, a restored backup) replaces or appends to it.
+        """
+        try:
+            stat = self.get_user_file(username).stat()
+        except FileNotFoundError:
+            return (0, 0)
+        return (stat.st_mtime_ns, stat.st_size)
+    
     def get_user_file(self, username: str) -> pathlib.Path:
         return self.data_dir / f"{username.lower()}_workouts.csv"
     
@@ -21,19 +38,20 @@ class UserDatabase:
     def record_workout(self, username: str, exercise: str, reps: int, 
                       sets: int, duration: float, valid_reps: int):
         """Record workout with tempo-validated reps"""
-        self.create_user_file(username)
-        
-        file_path = self.get_user_file(username)
-        with open(file_path, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().isoformat(),
-                exercise,
-                reps,
-                sets,
-                f"{duration:.1f}",
-                valid_reps
-            ])
+        with metrics.DB_WRITE_SECONDS.time():
+            self.create_user_file(username)
+
+            file_path = self.get_user_file(username)
+            with open(file_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([
+                    datetime.now().isoformat(),
+                    exercise,
+                    reps,
+                    sets,
+                    f"{duration:.1f}",
+                    valid_reps
+                ])
     
     def get_workout_history(self, username: str) -> List[Dict]:
         file_path = self.get_user_file(username)
@@ -57,6 +75,7 @@ class UserDatabase:
         total_accuracy = 0
         valid_entries = 0
 
+        skipped = 0
         for row in history:
             try:
                 reps = int(row.get("reps", 0))
@@ -69,9 +88,13 @@ class UserDatabase:
                 valid_entries += 1
             except (ValueError, KeyError, ZeroDivisionError) as e:
                 # Skip invalid rows
-                print(f"Warning: Skipping invalid workout row: {e}")
+                skipped += 1
                 continue
 
+        if skipped:
+            # One summary line instead of one print per bad row
+            log.warning("invalid_rows_skipped", user=username, count=skipped)
+
         avg_accuracy = total_accuracy / valid_entries if valid_entries > 0 else 0
 
         return {
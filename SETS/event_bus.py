@@ -0,0 +1,203 @@
+# event_bus.py
+"""
+In-process pub/sub for live events (workout progress, OLED selections)
+
+Publishing appends to one shared ring of recent events and sets a flag;
+nothing on the publisher's side depends on how many viewers are connected.
+A pump thread wakes the waiting subscribers, and each subscriber reads the
+ring from its own cursor. A subscriber that falls more than max_lag events
+behind (or off the end of the ring) is evicted instead of holding events
+back for everyone else.
+
+    sub = BUS.subscribe(('workout',))
+    for event in sub.poll(timeout=15):
+        ...
+    sub.close()
+
+A topic may be scoped with '@' ('workout@station1'): subscribers ask for
+the scoped topic, and it goes on the wire under its plain name ('workout').
+
+sse_stream() and the /ws/events route in app.py put this on the wire.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
+import metrics
+from config import EVENT_BUS_CAPACITY, EVENT_BUS_MAX_LAG
+from event_log import get_logger
+
+log = get_logger("events")
+
+class SlowConsumer(Exception):
+    """The subscriber fell too far behind and was dropped"""
+
+class BusEvent:
+    """One published event; its wire formats are built once, by the first subscriber that needs them"""
+    __slots__ = ('seq', 'topic', 'name', 'data', '_json', '_sse')
+
+    def __init__(self, seq: int, topic: str, data):
+        self.seq = seq
+        self.topic = topic
+        self.name = topic.split('@', 1)[0]  # Without the scope
+        self.data = data
+        self._json = None
+        self._sse = None
+
+    def json(self) -> str:
+        """{"seq", "topic", "data"} as one JSON text (WebSocket frames)"""
+        if self._json is None:
+            self._json = json.dumps({'seq': self.seq, 'topic': self.name, 'data': self.data})
+        return self._json
+
+    def sse(self) -> str:
+        if self._sse is None:
+            self._sse = f"id: {self.seq}\nevent: {self.name}\ndata: {json.dumps(self.data)}\n\n"
+        return self._sse
+
+class Subscriber:
+    def __init__(self, bus: 'EventBus', topics: Optional[Iterable[str]], cursor: int, max_lag: int):
+        self.bus = bus
+        self.topics = frozenset(topics) if topics else None
+        self.cursor = cursor
+        self.max_lag = max_lag
+        self.evicted = False
+        self.closed = False
+
+    def poll(self, timeout: Optional[float] = None) -> List[BusEvent]:
+        """
+        Events on our topics since the last poll; waits up to timeout for the first one
+
+        Returns [] on timeout or once closed; raises SlowConsumer if evicted.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = self._take()
+            if events or self.closed:
+                return events
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return events
+            with self.bus._cond:
+                if self.cursor >= self.bus._next_seq:
+                    self.bus._cond.wait(remaining)
+
+    def _take(self) -> List[BusEvent]:
+        bus = self.bus
+        if self.closed:
+            if self.evicted:
+                raise SlowConsumer("subscriber evicted")
+            return []
+        with bus._publish_lock:
+            head = bus._next_seq
+            oldest = head - len(bus._events)
+            if self.cursor < oldest or head - self.cursor > self.max_lag:
+                pending = head - self.cursor
+                self._evict(pending)
+                raise SlowConsumer(f"{pending} events behind")
+            events = list(itertools.islice(bus._events, self.cursor - oldest, None))
+        self.cursor = head
+        if self.topics is not None:
+            events = [e for e in events if e.topic in self.topics]
+        return events
+
+    def _evict(self, pending: int):
+        self.evicted = True
+        self.close()
+        metrics.EVENT_BUS_EVICTIONS.inc()
+        log.warning("subscriber_evicted", pending=pending, topics=','.join(sorted(self.topics or ())))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.bus._unsubscribe(self)
+
+class EventBus:
+    def __init__(self, capacity: int = EVENT_BUS_CAPACITY, max_lag: int = EVENT_BUS_MAX_LAG):
+        self.max_lag = min(max_lag, capacity)
+        self._events: deque = deque(maxlen=capacity)
+        self._next_seq = 0
+        self._latest: Dict[str, BusEvent] = {}
+        self._publish_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._pump = None
+
+    def publish(self, topic: str, data):
+        """O(1) whatever the number of subscribers: append to the ring, flag the pump"""
+        with self._publish_lock:
+            event = BusEvent(self._next_seq, topic, data)
+            self._events.append(event)
+            self._latest[topic] = event
+            self._next_seq += 1
+        if self._subscribers:
+            self._wake.set()
+        metrics.EVENTS_PUBLISHED.inc()
+
+    def latest(self, topic: str) -> Optional[BusEvent]:
+        """Most recent event on a topic (new viewers start from it)"""
+        return self._latest.get(topic)
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None, after: Optional[int] = None,
+                  max_lag: Optional[int] = None) -> Subscriber:
+        """
+        Receive events published from now on (or, with after=seq, from
+        the event following that one if it is still in the ring)
+        """
+        max_lag = max_lag or self.max_lag
+        with self._publish_lock:
+            # Resuming never starts further back than the subscriber could keep up with
+            oldest = self._next_seq - min(len(self._events), max_lag)
+            cursor = self._next_seq if after is None else max(after + 1, oldest)
+        subscriber = Subscriber(self, topics, cursor, max_lag)
+        with self._subscribers_lock:
+            self._subscribers.add(subscriber)
+            if self._pump is None:
+                self._pump = threading.Thread(target=self._run_pump, daemon=True, name="event-pump")
+                self._pump.start()
+        return subscriber
+
+    def _unsubscribe(self, subscriber: Subscriber):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+        with self._cond:
+            self._cond.notify_all()  # Let a poll() blocked in another thread see it is closed
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _run_pump(self):
+        """Background thread: does the per-subscriber wake-ups so publish() never has to"""
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._cond:
+                self._cond.notify_all()
+
+# ==========================================
+# SERVER-SENT EVENTS
+# ==========================================
+
+def sse_stream(subscriber: Subscriber, initial: Iterable[BusEvent] = (),
+               keepalive: float = 15.0) -> Iterator[str]:
+    """text/event-stream lines for a subscriber (ends when it is evicted; the browser reconnects)"""
+    try:
+        for event in initial:
+            yield event.sse()
+        while True:
+            events = subscriber.poll(keepalive)
+            if not events:
+                yield ": keepalive\n\n"  # Also how we notice the browser has gone
+            for event in events:
+                yield event.sse()
+    except SlowConsumer:
+        yield "event: evicted\ndata: {}\n\n"
+    finally:
+        subscriber.close()
+
+BUS = EventBus()
+metrics.EVENT_BUS_SUBSCRIBERS.set_function(BUS.subscriber_count)
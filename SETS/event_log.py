@@ -0,0 +1,121 @@
+# event_log.py
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Dict, Optional
+from config import LOG_LEVEL, LOG_SAMPLE_EVERY
+
+# Serial path code must never wait on stdout: records go into this queue and a
+# listener thread does the formatting and the (possibly slow) terminal/pipe write.
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=10000)
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+class _DropWhenFullHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread; only render the traceback
+        # here, while the frames it refers to still exist
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+class _KeyValueFormatter(logging.Formatter):
+    """time level logger event key=value ..."""
+
+    def format(self, record):
+        fields = getattr(record, 'fields', None)
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name} {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{k}={_quote(v)}" for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+def _quote(value) -> str:
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+def setup(level: str = LOG_LEVEL, stream=None):
+    """Start the background log writer (idempotent)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(_KeyValueFormatter())
+
+        root = logging.getLogger('sets')
+        root.setLevel(level)
+        root.propagate = False
+        root.addHandler(_DropWhenFullHandler(_queue))
+
+        _listener = logging.handlers.QueueListener(_queue, output)
+        _listener.start()
+        atexit.register(shutdown)
+
+def set_level(level: str):
+    """Change the level at runtime, e.g. 'DEBUG' while chasing a protocol problem"""
+    logging.getLogger('sets').setLevel(level)
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+class EventLogger:
+    """
+    Leveled structured logger: log.info("user_login", user="John")
+
+    Level checks happen before any formatting, so disabled calls cost one
+    comparison. sample= keeps only 1 in N events of that key (see LOG_SAMPLE_EVERY).
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"sets.{name}")
+        self._sample_counts: Dict[str, int] = {}
+
+    def _log(self, level: int, event: str, sample: Optional[str], exc_info, fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample is not None:
+            every = LOG_SAMPLE_EVERY.get(sample, 1)
+            if every > 1:
+                count = self._sample_counts.get(sample, 0)
+                self._sample_counts[sample] = count + 1
+                if count % every:
+                    return
+                fields['sampled'] = f"1/{every}"
+        self._logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event: str, sample: Optional[str] = None, **fields):
+        self._log(logging.DEBUG, event, sample, None, fields)
+
+    def info(self, event: str, sample: Optional[str] = None, **fields):
+        self._log(logging.INFO, event, sample, None, fields)
+
+    def warning(self, event: str, sample: Optional[str] = None, **fields):
+        self._log(logging.WARNING, event, sample, None, fields)
+
+    def error(self, event: str, sample: Optional[str] = None, exc_info=None, **fields):
+        self._log(logging.ERROR, event, sample, exc_info, fields)
+
+def get_logger(name: str) -> EventLogger:
+    setup()
+    return EventLogger(name)
@@ -0,0 +1,73 @@
+# exercises.py
+import json
+import pathlib
+from types import MappingProxyType
+from typing import Iterator, Mapping, Optional, Tuple
+from config import EXERCISES, EXERCISES_FILE
+
+REQUIRED_FIELDS = ('id', 'name', 'icon', 'calories_per_rep')
+
+class ExerciseCatalog:
+    """
+    Read-only exercise list with O(1) lookup by id and by MCU menu index
+
+    The MCU identifies exercises by their position in its OLED menu
+    (CFG_EXERCISE|1, WORKOUT_START|1|...); an entry may set "mcu_index"
+    explicitly, otherwise its position in the list is used. Both indexes are
+    built once, so message handlers never scan the list.
+    """
+
+    def __init__(self, exercises):
+        entries = []
+        by_id = {}
+        by_index = {}
+        for position, exercise in enumerate(exercises):
+            missing = [field for field in REQUIRED_FIELDS if field not in exercise]
+            if missing:
+                raise ValueError(f"Exercise {exercise!r} is missing {', '.join(missing)}")
+            entry = MappingProxyType(dict(exercise, mcu_index=int(exercise.get('mcu_index', position))))
+            if entry['id'] in by_id:
+                raise ValueError(f"Duplicate exercise id: {entry['id']}")
+            if entry['mcu_index'] in by_index:
+                raise ValueError(f"Duplicate MCU index {entry['mcu_index']} ({entry['id']})")
+            entries.append(entry)
+            by_id[entry['id']] = entry
+            by_index[entry['mcu_index']] = entry
+        if not entries:
+            raise ValueError("Exercise catalog is empty")
+
+        self.exercises: Tuple[Mapping, ...] = tuple(entries)
+        self.by_id: Mapping[str, Mapping] = MappingProxyType(by_id)
+        self.by_index: Mapping[int, Mapping] = MappingProxyType(by_index)
+        self.default = self.exercises[0]
+
+    def get(self, exercise_id: str) -> Optional[Mapping]:
+        return self.by_id.get(exercise_id)
+
+    def from_mcu(self, index: int) -> Mapping:
+        """Exercise for an MCU menu index (unknown indexes fall back to the first exercise)"""
+        return self.by_index.get(index, self.default)
+
+    def mcu_index(self, exercise_id: str) -> int:
+        exercise = self.by_id.get(exercise_id, self.default)
+        return exercise['mcu_index']
+
+    def name(self, exercise_id: str) -> str:
+        """Display name, or the id itself for exercises the catalog does not know"""
+        exercise = self.by_id.get(exercise_id)
+        return exercise['name'] if exercise else exercise_id
+
+    def __iter__(self) -> Iterator[Mapping]:
+        return iter(self.exercises)
+
+    def __len__(self) -> int:
+        return len(self.exercises)
+
+def load_catalog(path=EXERCISES_FILE) -> ExerciseCatalog:
+    """Catalog from a JSON file, or from config.EXERCISES when path is None"""
+    if path is None:
+        return ExerciseCatalog(EXERCISES)
+    with open(pathlib.Path(path), encoding='utf-8') as f:
+        return ExerciseCatalog(json.load(f))
+
+CATALOG = load_catalog()
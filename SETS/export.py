@@ -0,0 +1,111 @@
+# export.py
+"""
+Stream workout history out as CSV or NDJSON, one user or the whole gym
+
+Rows are read lazily from the *_workouts.csv files (any schema importer.py
+knows), filtered and written into chunks of about EXPORT_CHUNK_BYTES, so
+memory stays flat however many rows there are. Each file is read up to its
+size when the export reaches it: a workout recorded meanwhile is either
+complete in the export or not in it at all.
+
+    for chunk in export_chunks(data_dir, 'csv', user='john', start='2024-03-01'):
+        ...
+"""
+import csv
+import io
+import json
+import pathlib
+import time
+from datetime import date, timedelta
+from typing import Iterator, List, Optional
+from config import EXPORT_CHUNK_BYTES
+from exercises import CATALOG
+from importer import Reject, detect_schema, normalize
+from event_log import get_logger
+
+log = get_logger("export")
+
+FILE_SUFFIX = "_workouts.csv"
+FIELDS = ["user", "timestamp", "exercise", "reps", "sets", "duration_min", "valid_reps"]
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def _lines(path: pathlib.Path, size: int) -> Iterator[str]:
+    """Complete lines in the first `size` bytes of the file"""
+    with open(path, 'rb') as f:
+        pos = 0
+        while pos < size:
+            line = f.readline(size - pos)
+            if not line.endswith(b'\n'):
+                return  # Row still being appended
+            pos += len(line)
+            yield line.decode('utf-8', errors='replace')
+
+def history_files(data_dir: pathlib.Path, user: Optional[str] = None) -> List[pathlib.Path]:
+    if user:
+        path = pathlib.Path(data_dir) / f"{user.lower()}{FILE_SUFFIX}"
+        return [path] if path.exists() else []
+    return sorted(pathlib.Path(data_dir).glob(f"*{FILE_SUFFIX}"))
+
+def export_rows(data_dir: pathlib.Path, user: Optional[str] = None, start: Optional[str] = None,
+                end: Optional[str] = None, exercise: Optional[str] = None) -> Iterator[List]:
+    """
+    [user, timestamp, exercise, reps, sets, duration_min, valid_reps] rows
+
+    start and end are YYYY-MM-DD, end inclusive. exercise is a catalog id
+    (history files hold display names). Rows that cannot be read are
+    skipped and counted in one log line per file.
+    """
+    # ISO timestamps sort as text, so the date filter needs no parsing
+    end_bound = (date.fromisoformat(end) + timedelta(days=1)).isoformat() if end else None
+    if start:
+        start = date.fromisoformat(start).isoformat()
+    if exercise:
+        exercise = CATALOG.name(exercise)
+    for path in history_files(data_dir, user):
+        name = path.name[:-len(FILE_SUFFIX)]
+        lines = _lines(path, path.stat().st_size)
+        reader = csv.reader(lines)
+        schema = detect_schema(next(reader, None) or [])
+        if schema is None:
+            log.warning("export_unknown_schema", file=path.name)
+            continue
+        skipped = 0
+        for row in normalize(reader, schema):
+            if isinstance(row, Reject):
+                skipped += 1
+                continue
+            if ((start and row[0] < start) or (end_bound and row[0] >= end_bound)
+                    or (exercise and row[1] != exercise)):
+                continue
+            yield [name] + row
+        if skipped:
+            log.warning("export_rows_skipped", file=path.name, count=skipped)
+
+def export_chunks(data_dir: pathlib.Path, fmt: str = 'csv', chunk_bytes: int = EXPORT_CHUNK_BYTES,
+                  **filters) -> Iterator[str]:
+    """The export as text chunks of about chunk_bytes (fmt: 'csv' or 'ndjson')"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(FIELDS)
+    rows = 0
+    started = time.perf_counter()
+    for row in export_rows(data_dir, **filters):
+        if writer:
+            writer.writerow(row)
+        else:
+            row[5] = float(row[5])
+            buffer.write(json.dumps(dict(zip(FIELDS, row))))
+            buffer.write('\n')
+        rows += 1
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    log.info("export_finished", format=fmt, rows=rows,
+             seconds=f"{time.perf_counter() - started:.2f}",
+             **{k: v for k, v in filters.items() if v})
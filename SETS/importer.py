@@ -0,0 +1,180 @@
+# importer.py
+"""
+Convert workout history files of any known schema to the current one
+
+Each *_workouts.csv is checked by its header only. Files already in the
+current schema are left alone; older ones are streamed row by row through a
+normalizer and written in batches to a temp file. The original is then kept
+as <name>.legacy (.legacy.1, .legacy.2, ... if that exists already) before
+the temp file is swapped in with one atomic rename, so the history file is
+never missing. Rows that cannot be converted go to <name>.rejects.csv and
+are reported in one log line per file.
+
+    python importer.py user_data              # convert in place
+    python importer.py user_data --dry-run    # only report what would change
+"""
+import argparse
+import csv
+import itertools
+import os
+import pathlib
+import shutil
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from event_log import get_logger
+
+log = get_logger("importer")
+
+CURRENT_HEADER = ["timestamp", "exercise", "reps", "sets", "duration_min", "valid_reps"]
+BATCH_ROWS = 5000
+
+class Schema(NamedTuple):
+    name: str
+    header: Tuple[str, ...]
+    convert: Callable[[List[str]], List]
+
+def _current(row: List[str]) -> List:
+    datetime.fromisoformat(row[0])
+    reps, sets = int(row[2]), int(row[3])
+    valid = int(row[5]) if len(row) > 5 and row[5] != '' else reps * sets
+    return [row[0], row[1], reps, sets, f"{float(row[4]):.1f}", valid]
+
+def _no_valid_reps(row: List[str]) -> List:
+    # Before tempo validation: every rep counted as valid
+    return _current(row[:5])
+
+def _legacy(row: List[str]) -> List:
+    # Date,Time,Exercise,Reps,Sets,Duration_Min
+    timestamp = datetime.fromisoformat(f"{row[0]}T{row[1]}").isoformat()
+    reps, sets = int(row[3]), int(row[4])
+    return [timestamp, row[2], reps, sets, f"{float(row[5]):.1f}", reps * sets]
+
+SCHEMAS = (
+    Schema('current', tuple(CURRENT_HEADER), _current),
+    Schema('no_valid_reps', tuple(CURRENT_HEADER[:5]), _no_valid_reps),
+    Schema('legacy_date_time', ('date', 'time', 'exercise', 'reps', 'sets', 'duration_min'), _legacy),
+)
+
+def detect_schema(header: List[str]) -> Optional[Schema]:
+    normalized = tuple(h.strip().lower() for h in header)
+    for schema in SCHEMAS:
+        if normalized == schema.header:
+            return schema
+    return None
+
+class Reject(NamedTuple):
+    line: int
+    row: List[str]
+    reason: str
+
+def normalize(rows: Iterable[List[str]], schema: Schema, first_line: int = 2) -> Iterator[Union[List, Reject]]:
+    """Current-schema rows, or Reject entries, one at a time"""
+    for line, row in enumerate(rows, first_line):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        try:
+            yield schema.convert(row)
+        except (ValueError, IndexError) as e:
+            yield Reject(line, row, f"{type(e).__name__}: {e}")
+
+class ImportResult(NamedTuple):
+    path: pathlib.Path
+    schema: str
+    rows: int
+    rejects: int
+    converted: bool
+
+def backup_original(path: pathlib.Path) -> pathlib.Path:
+    """Hard-link (or copy) path to the first free <name>.legacy[.N]; never overwrites"""
+    for n in itertools.count():
+        backup = path.with_name(path.name + '.legacy' + (f'.{n}' if n else ''))
+        try:
+            os.link(path, backup)
+            return backup
+        except FileExistsError:
+            continue
+        except OSError:
+            # No hard links on this filesystem: copy into a file that must not exist yet
+            try:
+                with open(path, 'rb') as src, open(backup, 'xb') as dst:
+                    shutil.copyfileobj(src, dst)
+                return backup
+            except FileExistsError:
+                continue
+
+def convert_file(path: pathlib.Path, dry_run: bool = False) -> ImportResult:
+    path = pathlib.Path(path)
+    with open(path, 'r', newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        schema = detect_schema(header or [])
+        if schema is None:
+            log.warning("import_unknown_schema", file=path.name, header=','.join(header or []))
+            return ImportResult(path, 'unknown', 0, 0, False)
+        if schema.name == 'current' and not dry_run:
+            return ImportResult(path, schema.name, 0, 0, False)
+
+        rows = rejects = 0
+        tmp_path = path.with_name(path.name + '.tmp')
+        rejects_path = path.with_name(path.stem + '.rejects.csv')
+        out = None if dry_run else open(tmp_path, 'w', newline='', encoding='utf-8')
+        reject_file = None
+        try:
+            writer = csv.writer(out) if out else None
+            if writer:
+                writer.writerow(CURRENT_HEADER)
+            stream = normalize(reader, schema)
+            while True:
+                batch = list(itertools.islice(stream, BATCH_ROWS))
+                if not batch:
+                    break
+                good = [r for r in batch if not isinstance(r, Reject)]
+                bad = [r for r in batch if isinstance(r, Reject)]
+                rows += len(good)
+                rejects += len(bad)
+                if writer:
+                    writer.writerows(good)
+                if bad and not dry_run:
+                    if reject_file is None:
+                        reject_file = open(rejects_path, 'w', newline='', encoding='utf-8')
+                        csv.writer(reject_file).writerow(['line', 'reason'] + list(header))
+                    csv.writer(reject_file).writerows([r.line, r.reason] + r.row for r in bad)
+        finally:
+            if out:
+                out.close()
+            if reject_file:
+                reject_file.close()
+
+    if rejects:
+        details = {} if dry_run else {'details': rejects_path.name}
+        log.warning("import_rows_rejected", file=path.name, schema=schema.name, rejected=rejects,
+                    kept=rows, **details)
+    if dry_run:
+        return ImportResult(path, schema.name, rows, rejects, False)
+
+    backup = backup_original(path)
+    os.replace(tmp_path, path)
+    log.info("history_converted", file=path.name, schema=schema.name, rows=rows, rejected=rejects,
+             original=backup.name)
+    return ImportResult(path, schema.name, rows, rejects, True)
+
+def convert_all(data_dir: pathlib.Path, dry_run: bool = False) -> List[ImportResult]:
+    """Bring every *_workouts.csv in data_dir to the current schema"""
+    return [convert_file(path, dry_run) for path in sorted(pathlib.Path(data_dir).glob('*_workouts.csv'))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert workout history CSVs to the current schema")
+    parser.add_argument('data_dir', nargs='?', default='user_data')
+    parser.add_argument('--dry-run', action='store_true', help="Report schemas and rejects without writing")
+    args = parser.parse_args()
+
+    counts: Dict[str, int] = {}
+    for result in convert_all(pathlib.Path(args.data_dir), args.dry_run):
+        counts[result.schema] = counts.get(result.schema, 0) + 1
+        action = 'converted' if result.converted else ('would convert' if args.dry_run and result.schema
+                                                        not in ('current', 'unknown') else 'unchanged')
+        print(f"{result.path.name}: {result.schema}, {action}, {result.rows} rows, {result.rejects} rejected")
+    print(', '.join(f"{n} {schema}" for schema, n in sorted(counts.items())) or "no history files")
+
+if __name__ == "__main__":
+    main()
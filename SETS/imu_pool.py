@@ -0,0 +1,253 @@
+# imu_pool.py
+"""
+IMU_DATA analysis in worker processes, off the serial and dispatch threads
+
+The dispatch loop only appends each sample to the current window (O(1)).
+A full window is copied into a free slot of one shared-memory block and its
+slot number is sent to a ProcessPoolExecutor; the worker reads the samples
+straight from shared memory, so only a few integers are pickled each way.
+Results come back through a future callback:
+
+    window   samples, seconds, sample rate
+    signal   mean, RMS (about the mean) and range, in g
+    rhythm   dominant frequency as cadence (reps/min), reps found by
+             hysteresis zero-crossings of the smoothed signal
+    form     smoothness: share of the signal's power near the cadence
+
+When every slot is busy the window is dropped and counted; the protocol
+side never waits for the pool. If a worker dies the pool is broken for good,
+so it is replaced and the window resubmitted once.
+
+Workers are spawned, so each one imports the parent's main script as
+__mp_main__; main.py therefore only defines things at import time and
+starts everything from main().
+
+Slot layout: float32 values[window], then uint32 MCU ms[window].
+"""
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional
+import metrics
+from config import IMU_ANALYSIS_WORKERS, IMU_WINDOW_SAMPLES, IMU_MIN_SAMPLES
+from event_log import get_logger
+
+# NumPy is optional: without it there is no IMU analysis (main.py skips the pool)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+log = get_logger("imu")
+
+SAMPLE_BYTES = 8                  # float32 value + uint32 timestamp
+HYSTERESIS = 0.25                 # Crossing threshold, in standard deviations
+MIN_CADENCE_HZ, MAX_CADENCE_HZ = 0.1, 5.0
+FFT_PADDING = 8
+
+def slot_bytes(window: int) -> int:
+    return window * SAMPLE_BYTES
+
+# ==========================================
+# WORKER SIDE (runs in the pool processes)
+# ==========================================
+
+_attached: Dict[str, SharedMemory] = {}
+
+def _warm_up(_=None) -> int:
+    return os.getpid()
+
+def analyze_window(shm_name: str, slot: int, count: int, window: int) -> Dict:
+    """Analyze `count` samples of one slot; returns a small dict of results"""
+    started = time.perf_counter()
+    shm = _attached.get(shm_name)
+    if shm is None:
+        shm = _attached[shm_name] = SharedMemory(name=shm_name)
+    base = slot * slot_bytes(window)
+    values = np.frombuffer(shm.buf, np.float32, count, base).astype(np.float64)
+    times = np.frombuffer(shm.buf, np.uint32, count, base + window * 4).astype(np.float64) / 1000
+
+    seconds = times[-1] - times[0]
+    rate = (count - 1) / seconds if seconds > 0 else 0.0
+    mean = values.mean()
+    centered = values - mean
+    std = centered.std()
+    result = {
+        'samples': count,
+        'seconds': round(float(seconds), 3),
+        'rate_hz': round(float(rate), 1),
+        'mean_g': round(float(mean), 3),
+        'rms_g': round(float(std), 3),
+        'range_g': round(float(values.max() - values.min()), 3),
+        'cadence_rpm': None,
+        'reps_est': 0,
+        'smoothness_pct': None,
+    }
+    if rate > 0 and std > 0:
+        # Dominant frequency within plausible rep rates
+        # Zero-padded so a few-second window still resolves cadence to about 1 rpm
+        size = FFT_PADDING * count
+        spectrum = np.abs(np.fft.rfft(centered * np.hanning(count), size)) ** 2
+        freqs = np.fft.rfftfreq(size, 1 / rate)
+        band = (freqs >= MIN_CADENCE_HZ) & (freqs <= MAX_CADENCE_HZ)
+        if band.any():
+            peak = freqs[band][np.argmax(spectrum[band])]
+            near = (freqs >= peak * 0.75) & (freqs <= peak * 1.25)
+            result['cadence_rpm'] = round(float(peak * 60), 1)
+            result['smoothness_pct'] = round(float(spectrum[near].sum() / spectrum[1:].sum() * 100), 1)
+        # Reps: upward crossings of +threshold after having been below -threshold
+        width = max(1, int(rate * 0.1))
+        smooth = np.convolve(centered, np.ones(width) / width, mode='same')
+        state = np.zeros(count, dtype=np.int8)
+        state[smooth > HYSTERESIS * std] = 1
+        state[smooth < -HYSTERESIS * std] = -1
+        levels = state[state != 0]
+        result['reps_est'] = int(np.count_nonzero((levels[1:] == 1) & (levels[:-1] == -1)))
+    result['analysis_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+# ==========================================
+# PROTOCOL SIDE
+# ==========================================
+
+class ImuAnalyzer:
+    """Collects IMU_DATA samples per axis and hands full windows to the worker pool"""
+
+    def __init__(self, workers: Optional[int] = IMU_ANALYSIS_WORKERS, window: int = IMU_WINDOW_SAMPLES,
+                 on_result: Optional[Callable[[Dict], None]] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.window = window
+        self.on_result = on_result
+        self.latest: Optional[Dict] = None
+        self.dropped = 0
+        self.restarts = 0
+        self.slots = 0
+        self._seq = 0
+        self._buffers: Dict[str, tuple] = {}
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+        self._shm: Optional[SharedMemory] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        # Two slots per worker: one being analyzed, one queued behind it
+        self.slots = self.workers * 2
+        self._shm = SharedMemory(create=True, size=self.slots * slot_bytes(self.window))
+        self._free = list(range(self.slots))
+        self._executor = self._new_executor()
+        try:
+            # Start every worker now rather than on the first window (the pool
+            # only spawns while it has fewer workers than asked for)
+            pids = set(self._executor.map(_warm_up, range(self.workers)))
+        except Exception:
+            self.close()
+            raise
+        log.info("imu_pool_started", workers=len(pids), window=self.window, slots=self.slots)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: workers must not inherit the serial/Flask threads of this process
+        return ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'))
+
+    def add(self, axis: str, value: float, mcu_ms: int):
+        """One IMU_DATA sample (called from the dispatch loop)"""
+        buffer = self._buffers.get(axis)
+        if buffer is None:
+            buffer = self._buffers[axis] = (array('f'), array('I'))
+        buffer[0].append(value)
+        buffer[1].append(mcu_ms & 0xFFFFFFFF)
+        if len(buffer[0]) >= self.window:
+            self._submit(axis)
+
+    def flush(self):
+        """Analyze what has been collected so far (end of a set or workout)"""
+        for axis in list(self._buffers):
+            if len(self._buffers[axis][0]) >= IMU_MIN_SAMPLES:
+                self._submit(axis)
+            else:
+                del self._buffers[axis]
+
+    def _submit(self, axis: str):
+        values, times = self._buffers.pop(axis)
+        if self._executor is None:
+            return
+        with self._lock:
+            slot = self._free.pop() if self._free else None
+        if slot is None:
+            self.dropped += 1
+            metrics.IMU_WINDOWS.labels('dropped').inc()
+            return
+        count = len(values)
+        base = slot * slot_bytes(self.window)
+        self._shm.buf[base:base + count * 4] = values.tobytes()
+        self._shm.buf[base + self.window * 4:base + self.window * 4 + count * 4] = times.tobytes()
+        self._seq += 1
+        seq = self._seq
+        submitted = time.perf_counter()
+        try:
+            try:
+                future = self._executor.submit(analyze_window, self._shm.name, slot, count, self.window)
+            except BrokenProcessPool as e:
+                self._restart(e)
+                future = self._executor.submit(analyze_window, self._shm.name, slot, count, self.window)
+        except BrokenProcessPool as e:
+            self._release(slot)
+            metrics.IMU_WINDOWS.labels('failed').inc()
+            log.error("imu_window_lost", window=seq, error=e)
+            return
+        except RuntimeError:
+            self._release(slot)  # Pool shut down (close())
+            return
+        future.add_done_callback(lambda f: self._done(f, slot, seq, axis, submitted))
+
+    def _restart(self, error: Exception):
+        """Replace a broken pool: after a worker dies (killed, out of memory) it takes no more work"""
+        self.restarts += 1
+        metrics.IMU_POOL_RESTARTS.inc()
+        log.error("imu_pool_broken", error=error, restarts=self.restarts)
+        broken, self._executor = self._executor, self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, slot: int):
+        with self._lock:
+            self._free.append(slot)
+
+    def _done(self, future, slot: int, seq: int, axis: str, submitted: float):
+        """Runs on the executor's result thread"""
+        self._release(slot)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            metrics.IMU_WINDOWS.labels('failed').inc()
+            log.warning("imu_analysis_failed", window=seq, error=error)
+            return
+        metrics.IMU_WINDOWS.labels('analyzed').inc()
+        metrics.IMU_ANALYSIS_SECONDS.observe(time.perf_counter() - submitted)
+        result = dict(future.result(), window=seq, axis=axis)
+        self.latest = result
+        if self.on_result:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                log.error("imu_result_callback_failed", error=e)
+
+    def status(self) -> Dict:
+        with self._lock:
+            busy = self.slots - len(self._free)
+        return {'workers': self.workers, 'window': self.window, 'busy_slots': busy,
+                'windows': self._seq, 'dropped': self.dropped, 'restarts': self.restarts}
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._shm:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,217 @@
+# loadtest.py
+"""
+HTTP load generator: N kiosk and phone clients polling a running SETS server
+
+Each simulated client is a thread with its own cookie jar that requests its
+endpoints at the same rates the pages use (see PROFILES). Reports p50/p99
+latency and throughput per endpoint, plus server CPU per request (read from
+process_cpu_seconds_total on /metrics).
+
+    python loadtest.py --kiosks 4 --phones 40 --duration 30
+    python loadtest.py --ramp 10,25,50,100,200 --slo-ms 100   # "how many screens?"
+
+Run it from another machine when possible, so the load generator does not
+compete with the server for CPU. Start the server with a user logged in
+(e.g. SERIAL_TRANSPORT = 'virtual' runs a demo RFID tap) and pass --bind with
+the station's bind path (the kiosk URL main.py logs at startup, or one of
+STATION_BIND_TOKENS) so /dashboard and /history render instead of redirecting.
+
+    python loadtest.py --bind '/?station=station1&bind=<token>'
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+# (path, seconds between requests) - rates taken from the templates:
+# workout_monitor.html polls /api/workout_updates every 500ms, select_workout.html
+# polls /api/oled_selection every 500ms, login.html polls /api/serial_status every 1s
+PROFILES: Dict[str, List[Tuple[str, float]]] = {
+    # Station screen, worst case: all three polling pages' traffic plus a dashboard visit per minute
+    'kiosk': [
+        ('/api/workout_updates', 0.5),
+        ('/api/oled_selection', 0.5),
+        ('/api/serial_status', 1.0),
+        ('/dashboard', 60.0),
+    ],
+    # Member phone / trainer tablet following a workout and browsing stats
+    'phone': [
+        ('/api/workout_updates', 0.5),
+        ('/dashboard', 30.0),
+        ('/history', 30.0),
+    ],
+}
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Results:
+    """Latency samples per endpoint, shared by all client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes = 0
+        self.late = 0  # Requests that started after their slot (client could not keep up)
+
+    def record(self, path: str, seconds: float, size: int, ok: bool, late: bool):
+        with self.lock:
+            self.samples.setdefault(path, []).append(seconds)
+            self.bytes += size
+            if not ok:
+                self.errors[path] = self.errors.get(path, 0) + 1
+            if late:
+                self.late += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        endpoints = {}
+        everything: List[float] = []
+        for path, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            everything.extend(ordered)
+            endpoints[path] = {
+                'requests': len(ordered),
+                'errors': self.errors.get(path, 0),
+                'req_per_sec': round(len(ordered) / elapsed, 1),
+                'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+                'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+                'max_ms': round(ordered[-1] * 1000, 2),
+            }
+        everything.sort()
+        return {
+            'requests': len(everything),
+            'errors': sum(self.errors.values()),
+            'late_requests': self.late,
+            'req_per_sec': round(len(everything) / elapsed, 1),
+            'mb_per_sec': round(self.bytes / elapsed / 1e6, 3),
+            'p50_ms': round(percentile(everything, 0.50) * 1000, 2),
+            'p99_ms': round(percentile(everything, 0.99) * 1000, 2),
+            'endpoints': endpoints,
+        }
+
+class Client(threading.Thread):
+    """One browser: own cookies, fixed-rate schedule per endpoint"""
+
+    def __init__(self, base_url: str, profile: List[Tuple[str, float]],
+                 results: Results, stop: threading.Event, seed: int, bind: Optional[str] = None):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.bind = bind
+        self.results = results
+        self.stop_event = stop
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        rng = random.Random(seed)
+        now = time.perf_counter()
+        # Random phase so clients do not all fire on the same tick
+        self.schedule = [[now + rng.uniform(0, interval), path, interval]
+                         for path, interval in profile]
+
+    def run(self):
+        if self.bind:
+            try:
+                self.opener.open(self.base_url + self.bind, timeout=10).close()
+            except (urllib.error.URLError, OSError):
+                pass  # Shows up as redirects/errors in the results
+        while not self.stop_event.is_set():
+            slot = min(self.schedule, key=lambda entry: entry[0])
+            due, path, interval = slot
+            delay = due - time.perf_counter()
+            if delay > 0 and self.stop_event.wait(delay):
+                return
+            late = delay < -interval
+            self.request(path, late)
+            # Fixed rate like setInterval; skip missed slots rather than bursting
+            slot[0] = max(due + interval, time.perf_counter())
+
+    def request(self, path: str, late: bool):
+        start = time.perf_counter()
+        size, ok = 0, True
+        try:
+            with self.opener.open(self.base_url + path, timeout=10) as response:
+                size = len(response.read())
+        except (urllib.error.URLError, OSError):
+            ok = False
+        self.results.record(path, time.perf_counter() - start, size, ok, late)
+
+def server_cpu_seconds(base_url: str) -> Optional[float]:
+    """process_cpu_seconds_total from the server's /metrics (None if unavailable)"""
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + '/metrics', timeout=5) as response:
+            text = response.read().decode('utf-8')
+    except (urllib.error.URLError, OSError):
+        return None
+    match = re.search(r'^process_cpu_seconds_total (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+def run_load(base_url: str, kiosks: int, phones: int, duration: float, seed: int = 1,
+             bind: Optional[str] = None) -> Dict:
+    results = Results()
+    stop = threading.Event()
+    clients = ([Client(base_url, PROFILES['kiosk'], results, stop, seed + i, bind) for i in range(kiosks)] +
+               [Client(base_url, PROFILES['phone'], results, stop, seed + 10000 + i, bind)
+                for i in range(phones)])
+
+    cpu_before = server_cpu_seconds(base_url)
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(duration)
+    stop.set()
+    for client in clients:
+        client.join(timeout=10)
+    elapsed = time.perf_counter() - start
+    cpu_after = server_cpu_seconds(base_url)
+
+    summary = results.summary(elapsed)
+    summary.update({'kiosks': kiosks, 'phones': phones, 'seconds': round(elapsed, 1)})
+    if cpu_before is not None and cpu_after is not None and summary['requests']:
+        cpu = cpu_after - cpu_before
+        summary['server_cpu_percent'] = round(cpu / elapsed * 100, 1)
+        summary['server_cpu_ms_per_request'] = round(cpu / summary['requests'] * 1000, 3)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SETS Flask API")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--kiosks', type=int, default=1)
+    parser.add_argument('--phones', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per run")
+    parser.add_argument('--ramp', help="Comma-separated phone counts to step through (kiosks stay fixed)")
+    parser.add_argument('--slo-ms', type=float, default=100.0, help="p99 target for --ramp")
+    parser.add_argument('--output', help="Write JSON here as well as printing it")
+    parser.add_argument('--bind', help="Path that binds a client to a station, e.g. '/?station=station1&bind=<token>'")
+    args = parser.parse_args()
+
+    if args.ramp:
+        steps = []
+        capacity = 0
+        for phones in (int(n) for n in args.ramp.split(',')):
+            summary = run_load(args.url, args.kiosks, phones, args.duration, bind=args.bind)
+            steps.append(summary)
+            print(f"{args.kiosks} kiosks + {phones} phones: {summary['req_per_sec']} req/s, "
+                  f"p99 {summary['p99_ms']}ms, errors {summary['errors']}")
+            if summary['p99_ms'] > args.slo_ms or summary['errors']:
+                break
+            capacity = phones
+        report = {'slo_p99_ms': args.slo_ms, 'max_phones_within_slo': capacity, 'steps': steps}
+    else:
+        report = run_load(args.url, args.kiosks, args.phones, args.duration, bind=args.bind)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
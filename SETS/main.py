@@ -1,13 +1,33 @@
 # main.py
-from config import SERIAL_PORT, BAUD_RATE, TIMEOUT, RFID_USERS, PORT, EXERCISES, DISPLAY_URL
+from config import (SERIAL_PORT, BAUD_RATE, TIMEOUT, RFID_USERS, RFID_USERS_FILE, PORT, DISPLAY_URL,
+                    POLLING_INTERVAL, SERIAL_TRANSPORT, VIRTUAL_MCU_SCRIPT, STATION_ID, CLOCK_SYNC_INTERVAL,
+                    SERIAL_RECORD_FILE, SERIAL_RECORD_OVERWRITE, IMU_ANALYSIS_WORKERS, SYNC_URL,
+                    CONVERT_HISTORY_ON_START)
 from serial_handler import SerialHandler
+from clock_sync import ClockSync
+from rep_timeline import RepTimeline, TimelineStore
 from rfid_auth import RFIDAuth
+from user_directory import UserDirectory
 from database import UserDatabase
+from analytics import AnalyticsEngine, NUMPY_AVAILABLE
+from imu_pool import ImuAnalyzer
+import importer
+import profiler
+from exercises import CATALOG
+from transport import LoopbackLink, open_serial
+from serial_recorder import SerialRecorder
+from sync_agent import SyncAgent
+from virtual_mcu import VirtualMCU, DEMO_SCRIPT
 from datetime import datetime
+import json
 import pathlib
 import threading
 import time
 import app as flask_app
+import metrics
+from event_log import get_logger
+
+log = get_logger("main")
 
 # Browser auto-launch
 try:
@@ -20,21 +40,19 @@ except ImportError:
 
 def launch_browser():
     """Auto-launch Chrome browser with Selenium"""
+    url = f"http://{DISPLAY_URL}:{PORT}{flask_app.kiosk_path()}"
     if not SELENIUM_AVAILABLE:
-        print("ℹ️ Selenium not available. Please open browser manually.")
+        # Opening this URL is what binds a browser to the station
+        log.info("browser_manual", reason="selenium not available", url=url)
         return None
 
     try:
-        print("🌐 Launching Chrome browser...")
+        log.info("browser_launching")
         chrome_options = Options()
         chrome_options.add_argument('--start-maximized')
         chrome_options.add_argument('--disable-blink-features=AutomationControlled')
 
-        # CACHE-BUSTING: Disable all caching
-        chrome_options.add_argument('--disable-cache')
-        chrome_options.add_argument('--disable-application-cache')
-        chrome_options.add_argument('--disable-offline-load-stale-cache')
-        chrome_options.add_argument('--disk-cache-size=0')
+        # Caching is safe: static files use content-hashed URLs (app.static_url)
         chrome_options.add_argument('--incognito')  # Use incognito mode for fresh session
 
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
@@ -42,19 +60,62 @@ def launch_browser():
 
         # Try to create driver
         driver = webdriver.Chrome(options=chrome_options)
-        driver.get(f'http://{DISPLAY_URL}:{PORT}')
-        print(f"✓ Browser opened: http://{DISPLAY_URL}:{PORT}")
+        # Bind the kiosk browser to this station's sessions
+        driver.get(url)
+        log.info("browser_opened", url=f"http://{DISPLAY_URL}:{PORT}", station=STATION_ID)
         return driver
     except Exception as e:
-        print(f"⚠️ Could not auto-launch browser: {e}")
-        print(f"📊 Please open manually: http://{DISPLAY_URL}:{PORT}")
+        log.warning("browser_launch_failed", error=e, url=f"http://{DISPLAY_URL}:{PORT}")
         return None
 
+def create_virtual_mcu():
+    """Simulated MCU on an in-memory link; returns (mcu, SerialHandler transport_factory)"""
+    link = LoopbackLink()
+    mcu = VirtualMCU(link.open_device(),
+                     auto_workout={'rep_interval': 1.5, 'rest': 3.0, 'jitter': 0.2, 'imu_rate': 20})
+    mcu.start()
+    log.info("virtual_mcu_started")
+    return mcu, link.open_host
+
 def main():
     # Initialize components
+    if CONVERT_HISTORY_ON_START:
+        # Bring older history files to the current schema (converted files are skipped)
+        importer.convert_all(pathlib.Path("user_data"))
     flask_app.database = UserDatabase(pathlib.Path("user_data"))
-    flask_app.rfid_auth = RFIDAuth(RFID_USERS)
-    flask_app.serial_handler = SerialHandler(SERIAL_PORT, BAUD_RATE, TIMEOUT)
+    flask_app.timelines = TimelineStore(pathlib.Path("user_data"))
+    if NUMPY_AVAILABLE:
+        flask_app.analytics = AnalyticsEngine(pathlib.Path("user_data"))
+    else:
+        log.info("analytics_disabled", reason="numpy not available")
+    global imu_analyzer
+    if NUMPY_AVAILABLE and IMU_ANALYSIS_WORKERS != 0:
+        imu_analyzer = ImuAnalyzer(on_result=flask_app.publish_imu)
+        imu_analyzer.start()
+        flask_app.imu_analyzer = imu_analyzer
+    global sync_agent
+    if SYNC_URL:
+        sync_agent = SyncAgent(pathlib.Path("user_data"))
+        sync_agent.start()
+        flask_app.sync_agent = sync_agent
+    users = UserDirectory(RFID_USERS_FILE, RFID_USERS)
+    users.start()  # Reload RFID_USERS_FILE when it changes
+    flask_app.rfid_auth = RFIDAuth(users)
+    flask_app.rfid_auth.sessions.on_expire = flask_app.session_expired
+    virtual_mcu = None
+    if SERIAL_TRANSPORT == 'virtual':
+        virtual_mcu, transport_factory = create_virtual_mcu()
+        port = 'virtual'
+    else:
+        transport_factory = lambda: open_serial(SERIAL_PORT, BAUD_RATE, TIMEOUT)
+        port = SERIAL_PORT
+    recorder = None
+    if SERIAL_RECORD_FILE:
+        # Capture everything on the link for replay (serial_recorder.py)
+        recorder = SerialRecorder(SERIAL_RECORD_FILE, overwrite=SERIAL_RECORD_OVERWRITE)
+        transport_factory = recorder.wrap(transport_factory)
+        log.info("serial_recording", file=str(recorder.path))
+    flask_app.serial_handler = SerialHandler(port, BAUD_RATE, TIMEOUT, transport_factory=transport_factory)
 
     # Store references for easy access
     global serial_handler, rfid_auth, database
@@ -62,8 +123,18 @@ def main():
     rfid_auth = flask_app.rfid_auth
     database = flask_app.database
 
+    # Bring the MCU back in sync if the serial link drops and comes back
+    serial_handler.on_reconnect = reconnect_messages
+    # PING write times for the clock sync
+    serial_handler.on_transmit = note_transmit
+    flask_app.clock_sync = clock
+    metrics.MCU_CLOCK_DRIFT.set_function(lambda: clock.drift * 1e6)
+
+    # kill -USR1 <pid> writes a profile to PROFILE_DIR
+    profiler.install_signal_handler()
+
     # Start Flask in background thread
-    print("🚀 Starting Flask server...")
+    log.info("flask_starting")
     flask_thread = threading.Thread(target=flask_app.run_flask, daemon=True)
     flask_thread.start()
     time.sleep(2)  # Give Flask time to start
@@ -72,45 +143,145 @@ def main():
     browser = launch_browser()
 
     # Start serial communication
-    print(f"📡 Connecting to {SERIAL_PORT}...")
+    log.info("serial_connecting", port=SERIAL_PORT)
     if not serial_handler.start():
-        print("✗ Failed to start serial. Running in web-only mode...")
-        print(f"📊 URL: http://{DISPLAY_URL}:{PORT}")
+        log.error("serial_unavailable", mode="web-only", url=f"http://{DISPLAY_URL}:{PORT}")
         # Keep running for web interface
         try:
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
-            print("\n👋 Shutting down...")
+            log.info("shutting_down")
             if browser:
                 browser.quit()
         return
 
-    print(f"✓ Serial connected: {SERIAL_PORT} @ {BAUD_RATE}")
-    print(f"📊 URL: http://{DISPLAY_URL}:{PORT}")
-    print("\n" + "="*50)
-    print("🏋️ SETS - SmartDumbbell System Running!")
-    print("="*50 + "\n")
+    log.info("serial_connected", port=serial_handler.port, baud=BAUD_RATE)
+    log.info("sets_running", url=f"http://{DISPLAY_URL}:{PORT}")
+
+    if virtual_mcu:
+        steps = DEMO_SCRIPT
+        if VIRTUAL_MCU_SCRIPT:
+            with open(VIRTUAL_MCU_SCRIPT) as f:
+                steps = json.load(f)
+        threading.Thread(target=virtual_mcu.run_script, args=(steps,), daemon=True).start()
 
     # Main serial processing loop
-    # Slower polling to give MCU time to process
+    # Blocks on the RX queue, so messages are handled as soon as they arrive
+    next_clock_sync = time.monotonic()
     try:
         while True:
-            message = serial_handler.get_message()
-            if message:
-                handle_serial_message(message)
-
-            # Poll every 100ms (MCU-friendly, prevents buffer overflow)
-            time.sleep(0.1)
+            if time.monotonic() >= next_clock_sync:
+                if serial_handler.is_connected:
+                    serial_handler.send_message("PING")
+                next_clock_sync = time.monotonic() + CLOCK_SYNC_INTERVAL
+
+            timed = serial_handler.get_timed_message(timeout=POLLING_INTERVAL)
+            if timed:
+                message, received = timed
+                start = time.perf_counter()
+                handle_serial_message(message, received)
+                metrics.HANDLER_SECONDS.labels(message_type(message)).observe(time.perf_counter() - start)
     except KeyboardInterrupt:
-        print("\n👋 Shutting down...")
+        log.info("shutting_down")
         if browser:
             browser.quit()
     finally:
         serial_handler.stop()
-
-def handle_serial_message(message: str):
-    """Process messages from MCU - Full Protocol Implementation"""
+        if recorder:
+            recorder.close()
+        if imu_analyzer:
+            imu_analyzer.close()
+        if sync_agent:
+            sync_agent.stop()
+
+# Message types we label handler timings with (anything else is "other")
+MESSAGE_TYPES = {
+    "UID_REQ", "CFG_EXERCISE", "CFG_REPS", "CFG_SETS",
+    "WORKOUT_START", "WORKOUT_PAUSE", "WORKOUT_RESUME", "WORKOUT_STOP", "WORKOUT_END",
+    "REP_DETECT", "SET_COMPLETE", "IMU_DATA", "HEARTBEAT", "PING", "PONG", "ERROR",
+    "MCU_READY", "EXERCISE_SELECTED", "REPS_SELECTED", "SETS_SELECTED",
+    "WORKOUT_START_CONFIRMED", "STATUS", "REP_COUNT", "SET_PROGRESS", "CALORIES",
+    "WORKOUT_COMPLETE", "POSITION", "BATCH_ACK"
+}
+
+def message_type(message: str) -> str:
+    msg_type = message.split('|', 1)[0]
+    return msg_type if msg_type in MESSAGE_TYPES else "other"
+
+# MCU clock -> host clock, fed by our PINGs and the MCU's PONG|millis answers
+clock = ClockSync()
+
+# IMU_DATA windows go to worker processes for analysis (set in main() when numpy is installed)
+imu_analyzer = None
+# Uploads saved workouts to SYNC_URL (set in main() when configured)
+sync_agent = None
+
+def note_transmit(message: str, sent: float):
+    if message.startswith("PING"):
+        clock.ping_sent(sent)
+
+def reconnect_messages() -> list:
+    # PONGs to the reconnect handshake PINGs must not be paired with our sync PINGs
+    clock.clear_pending()
+    return session_resync_messages()
+
+def observe_mcu_latency(mcu_timestamp: int, received: float):
+    """Record link and MCU-to-UI latency for a message that just updated the workout state"""
+    event = clock.to_host(mcu_timestamp) if mcu_timestamp else None
+    if event is None:
+        return  # Not synced yet
+    # Both can come out slightly negative within the sync error (half the best round trip)
+    metrics.MCU_LINK_LATENCY.observe(max(received - event, 0.0))
+    metrics.MCU_TO_UI_LATENCY.observe(max(time.monotonic() - event, 0.0))
+
+def start_timeline(exercise: str, mcu_timestamp: int = 0, started_at: datetime = None) -> RepTimeline:
+    """New per-rep timeline for the workout that is starting"""
+    flask_app.local.rep_timeline = RepTimeline(exercise, mcu_timestamp, started_at, rate=1 / (1 + clock.drift))
+    return flask_app.local.rep_timeline
+
+def mcu_datetime(mcu_timestamp: int) -> datetime:
+    """Host wall-clock time of an MCU timestamp (now, if the clock is not synced yet)"""
+    wall = clock.to_wall(mcu_timestamp) if mcu_timestamp else None
+    return datetime.fromtimestamp(wall) if wall is not None else datetime.now()
+
+def selection_messages() -> list:
+    """
+    WEB_EXERCISE/WEB_REPS/WEB_SETS that put the web page's selection back on the OLED
+
+    Only with batching on: sent one by one, each would cost a paced TX slot.
+    """
+    if not serial_handler.batching:
+        return []
+    return flask_app.local.selection_messages()
+
+def session_resync_messages() -> list:
+    """Messages that restore the current login/workout on a freshly (re)connected MCU"""
+    messages = []
+
+    username = rfid_auth.get_current_user()
+    if username:
+        messages.append(f"USER_OK|{username}\n")
+
+    state = flask_app.local.workout
+    if state['active']:
+        # WORKOUT_SYNC|exercise_id|reps|sets|current_set|current_reps
+        messages.append(
+            f"WORKOUT_SYNC|{state['exercise']}|{state['targetReps']}|{state['totalSets']}"
+            f"|{state['currentSet']}|{state['currentReps']}\n"
+        )
+    elif username:
+        messages.extend(selection_messages())
+    return messages
+
+def handle_serial_message(message: str, received: float = None):
+    """Process messages from MCU - Full Protocol Implementation
+
+    received is the time.monotonic() the line was read from the port
+    (SerialHandler.get_timed_message); defaults to now.
+    """
+    if received is None:
+        received = time.monotonic()
 
     # Filter out Arduino debug/display messages
     debug_keywords = [
@@ -127,7 +298,7 @@ def handle_serial_message(message: str):
     if any(keyword in message for keyword in debug_keywords):
         return
 
-    # Only print actual protocol messages
+    # Only log actual protocol messages
     protocol_messages = [
         "UID_REQ|", "USER_OK|", "USER_FAIL",
         "CFG_EXERCISE|", "CFG_REPS|", "CFG_SETS|",
@@ -135,7 +306,7 @@ def handle_serial_message(message: str):
         "WORKOUT_START|", "WORKOUT_PAUSE|", "WORKOUT_RESUME|",
         "WORKOUT_STOP|", "WORKOUT_END|",
         "REP_DETECT|", "SET_COMPLETE|", "IMU_DATA|",
-        "HEARTBEAT|", "PING", "PONG|", "ERROR|",
+        "HEARTBEAT|", "PING", "PONG|", "ERROR|", "BATCH_ACK|",
         # Legacy messages for backward compatibility
         "EXERCISE_SELECTED|", "REPS_SELECTED|", "SETS_SELECTED|",
         "WORKOUT_START_CONFIRMED", "STATUS|", "REP_COUNT|",
@@ -143,7 +314,7 @@ def handle_serial_message(message: str):
     ]
 
     if any(message.startswith(protocol) for protocol in protocol_messages):
-        print(f"← MCU: {message}")
+        log.debug("mcu_message", sample=message_type(message), message=message)
 
     # ==========================================
     # A. AUTHENTICATION
@@ -152,13 +323,17 @@ def handle_serial_message(message: str):
     # UID_REQ|7D 13 37 21 78
     uid = rfid_auth.parse_uid_message(message)
     if uid:
+        previous = rfid_auth.get_current_user()
         is_valid, username = rfid_auth.login(uid)
         if is_valid:
-            serial_handler.send_message(f"USER_OK|{username}\n")
-            print(f"✅ User logged in: {username}")
+            if previous and username != previous:
+                flask_app.local.reset_selection()  # Tap replaced another user's session: not their choices
+            # With MCU_BATCH on, the greeting and any web selection go out as one frame
+            serial_handler.send_batch([f"USER_OK|{username}\n"] + selection_messages())
+            log.info("user_login", user=username, station=STATION_ID)
         else:
             serial_handler.send_message("USER_FAIL\n")
-            print(f"❌ Invalid RFID card")
+            log.warning("user_login_failed", uid=uid)
         return
 
     # ==========================================
@@ -172,46 +347,37 @@ def handle_serial_message(message: str):
             exercise_id = int(parts[1])
             exercise_name = parts[2] if len(parts) > 2 else ""
 
-            # Map exercise ID to our system
-            exercise_map = {
-                0: "bicep_curl",
-                1: "shoulder_press",  # Or map to squats if you have it
-                2: "lateral_raise"     # Or map to overhead press
-            }
-
-            mapped_id = exercise_map.get(exercise_id, "bicep_curl")
-            exercise_data = next((ex for ex in EXERCISES if ex['id'] == mapped_id), None)
-
-            if exercise_data:
-                flask_app.oled_selection.update({
-                    'exercise': mapped_id,
-                    'exerciseName': exercise_data['name'],
-                    'icon': exercise_data['icon'],
-                    'caloriesPerRep': exercise_data['calories_per_rep']
-                })
-                print(f"🎮 OLED: Exercise configured - {exercise_data['name']} (ID: {exercise_id})")
+            # Map the OLED menu index to our exercise
+            exercise_data = CATALOG.from_mcu(exercise_id)
+            flask_app.local.update_selection(
+                exercise=exercise_data['id'],
+                exerciseName=exercise_data['name'],
+                icon=exercise_data['icon'],
+                caloriesPerRep=exercise_data['calories_per_rep']
+            )
+            log.info("oled_exercise", exercise=exercise_data['name'], mcu_id=exercise_id)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid CFG_EXERCISE message: {e}")
+            log.warning("invalid_message", type="CFG_EXERCISE", error=e)
         return
 
     # CFG_REPS|15
     if message.startswith("CFG_REPS|"):
         try:
             reps = int(message.split('|')[1])
-            flask_app.oled_selection['reps'] = reps
-            print(f"🎮 OLED: Reps configured - {reps}")
+            flask_app.local.update_selection(reps=reps)
+            log.info("oled_reps", reps=reps)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid CFG_REPS message: {e}")
+            log.warning("invalid_message", type="CFG_REPS", error=e)
         return
 
     # CFG_SETS|3
     if message.startswith("CFG_SETS|"):
         try:
             sets = int(message.split('|')[1])
-            flask_app.oled_selection['sets'] = sets
-            print(f"🎮 OLED: Sets configured - {sets}")
+            flask_app.local.update_selection(sets=sets)
+            log.info("oled_sets", sets=sets)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid CFG_SETS message: {e}")
+            log.warning("invalid_message", type="CFG_SETS", error=e)
         return
 
     # ==========================================
@@ -228,73 +394,74 @@ def handle_serial_message(message: str):
             mcu_timestamp = int(parts[4]) if len(parts) > 4 else 0
 
             # Map exercise ID
-            exercise_map = {0: "bicep_curl", 1: "shoulder_press", 2: "lateral_raise"}
-            mapped_id = exercise_map.get(exercise_id, "bicep_curl")
-            exercise_data = next((ex for ex in EXERCISES if ex['id'] == mapped_id), None)
-
-            if exercise_data:
-                flask_app.workout_state.update({
-                    'active': True,
-                    'exercise': mapped_id,
-                    'exerciseName': exercise_data['name'],
-                    'icon': exercise_data['icon'],
-                    'caloriesPerRep': exercise_data['calories_per_rep'],
-                    'targetReps': reps,
-                    'totalSets': sets,
-                    'currentSet': 1,
-                    'currentReps': 0,
-                    'totalCalories': 0,
-                    'startTime': datetime.now().isoformat(),
-                    'mcuStartTimestamp': mcu_timestamp,
-                    'status': 'active',
-                    'validReps': 0
-                })
-                print(f"🚀 WORKOUT STARTED:")
-                print(f"   Exercise: {exercise_data['name']}")
-                print(f"   Target: {reps} reps × {sets} sets")
-                print(f"   MCU Time: {mcu_timestamp}ms")
+            exercise_data = CATALOG.from_mcu(exercise_id)
+            mapped_id = exercise_data['id']
+            started_at = mcu_datetime(mcu_timestamp)
+            start_timeline(mapped_id, mcu_timestamp, started_at)
+
+            flask_app.local.workout.update({
+                'active': True,
+                'exercise': mapped_id,
+                'exerciseName': exercise_data['name'],
+                'icon': exercise_data['icon'],
+                'caloriesPerRep': exercise_data['calories_per_rep'],
+                'targetReps': reps,
+                'totalSets': sets,
+                'currentSet': 1,
+                'currentReps': 0,
+                'totalCalories': 0,
+                'startTime': started_at.isoformat(),
+                'mcuStartTimestamp': mcu_timestamp,
+                'status': 'active',
+                'validReps': 0
+            })
+            flask_app.local.publish_workout()
+            log.info("workout_started", exercise=exercise_data['name'],
+                     reps=reps, sets=sets, mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_START message: {e}")
+            log.warning("invalid_message", type="WORKOUT_START", error=e)
         return
 
     # WORKOUT_PAUSE|12389456
     if message.startswith("WORKOUT_PAUSE|"):
         try:
             mcu_timestamp = int(message.split('|')[1])
-            flask_app.update_workout_state(status='paused')
-            print(f"⏸️ Workout paused at {mcu_timestamp}ms")
+            flask_app.local.update_workout(status='paused')
+            if flask_app.local.rep_timeline:
+                flask_app.local.rep_timeline.pause()
+            log.info("workout_paused", mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_PAUSE message: {e}")
+            log.warning("invalid_message", type="WORKOUT_PAUSE", error=e)
         return
 
     # WORKOUT_RESUME|12401234
     if message.startswith("WORKOUT_RESUME|"):
         try:
             mcu_timestamp = int(message.split('|')[1])
-            flask_app.update_workout_state(status='active')
-            print(f"▶️ Workout resumed at {mcu_timestamp}ms")
+            flask_app.local.update_workout(status='active')
+            log.info("workout_resumed", mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_RESUME message: {e}")
+            log.warning("invalid_message", type="WORKOUT_RESUME", error=e)
         return
 
     # WORKOUT_STOP|12567890
     if message.startswith("WORKOUT_STOP|"):
         try:
             mcu_timestamp = int(message.split('|')[1])
-            flask_app.complete_workout()
-            print(f"🛑 Workout stopped at {mcu_timestamp}ms")
+            flask_app.local.complete_workout()
+            log.info("workout_stopped", mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_STOP message: {e}")
+            log.warning("invalid_message", type="WORKOUT_STOP", error=e)
         return
 
     # WORKOUT_END|12567890
     if message.startswith("WORKOUT_END|"):
         try:
             mcu_timestamp = int(message.split('|')[1])
-            flask_app.complete_workout()
-            print(f"✅ Workout completed at {mcu_timestamp}ms")
+            flask_app.local.complete_workout()
+            log.info("workout_ended", mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_END message: {e}")
+            log.warning("invalid_message", type="WORKOUT_END", error=e)
         return
 
     # ==========================================
@@ -310,16 +477,22 @@ def handle_serial_message(message: str):
             mcu_timestamp = int(parts[3]) if len(parts) > 3 else 0
 
             # Calculate calories
-            calories = rep_num * flask_app.workout_state.get('caloriesPerRep', 0.5)
+            calories = rep_num * flask_app.local.workout.get('caloriesPerRep', 0.5)
 
-            flask_app.update_workout_state(
+            flask_app.local.update_workout(
                 reps=rep_num,
                 current_set=set_num,
                 calories=calories
             )
-            print(f"🏋️ Rep {rep_num} of Set {set_num} at {mcu_timestamp}ms | Calories: {calories:.1f}")
+            observe_mcu_latency(mcu_timestamp, received)
+            # Tempo from the MCU's own timestamps: no serial or queueing jitter
+            timeline = flask_app.local.rep_timeline or start_timeline(flask_app.local.workout.get('exercise') or '')
+            set_stats = timeline.rep(rep_num, set_num, mcu_timestamp)
+            log.info("rep", sample="REP_DETECT", rep=rep_num, set=set_num, mcu_ms=mcu_timestamp,
+                     tempo_s=set_stats['tempo_s'], fatigue_pct=set_stats['fatigue_pct'],
+                     calories=f"{calories:.1f}")
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid REP_DETECT message: {e}")
+            log.warning("invalid_message", type="REP_DETECT", error=e)
         return
 
     # SET_COMPLETE|2|15|12380000
@@ -330,22 +503,25 @@ def handle_serial_message(message: str):
             total_reps = int(parts[2])
             mcu_timestamp = int(parts[3]) if len(parts) > 3 else 0
 
-            flask_app.update_workout_state(current_set=set_num + 1, reps=0)
-            print(f"📈 Set {set_num} complete: {total_reps} reps at {mcu_timestamp}ms")
+            flask_app.local.update_workout(current_set=set_num + 1, reps=0)
+            if imu_analyzer:
+                imu_analyzer.flush()
+            log.info("set_complete", set=set_num, reps=total_reps, mcu_ms=mcu_timestamp)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid SET_COMPLETE message: {e}")
+            log.warning("invalid_message", type="SET_COMPLETE", error=e)
         return
 
-    # IMU_DATA|Y|1.5|12345678 (optional - for debugging)
+    # IMU_DATA|Y|1.5|12345678 (optional)
     if message.startswith("IMU_DATA|"):
-        # This is optional - just log it if present
         try:
             parts = message.split('|')
             axis = parts[1]
             value = float(parts[2])
             mcu_timestamp = int(parts[3]) if len(parts) > 3 else 0
-            # Just log, don't process
-            # print(f"📊 IMU {axis}: {value}g at {mcu_timestamp}ms")
+            log.debug("imu", sample="IMU_DATA", axis=axis, g=value, mcu_ms=mcu_timestamp)
+            # Only buffered here; the analysis runs in the worker pool
+            if imu_analyzer:
+                imu_analyzer.add(axis, value, mcu_timestamp)
         except (ValueError, IndexError):
             pass
         return
@@ -354,6 +530,28 @@ def handle_serial_message(message: str):
     # E. SYSTEM STATUS
     # ==========================================
 
+    # MCU_READY (MCU rebooted after the handshake window, e.g. reset on reconnect)
+    if message == "MCU_READY":
+        clock.reset()  # millis() restarted
+        serial_handler.send_batch(session_resync_messages())
+        return
+
+    # BATCH_ACK|7|OK;OK;ERR (one result per command of BATCH|7|...)
+    if message.startswith("BATCH_ACK|"):
+        try:
+            _, batch_id, results = (message.split('|', 2) + [''])[:3]
+            answers = serial_handler.batch_acked(int(batch_id), results)
+            if answers is None:
+                log.warning("batch_ack_unknown", batch=batch_id)
+                return
+            failed = [(command, result) for command, result in answers if result != "OK"]
+            log.info("batch_acked", batch=batch_id, commands=len(answers), failed=len(failed))
+            for command, result in failed:
+                log.warning("batch_command_failed", batch=batch_id, command=command, result=result)
+        except (ValueError, IndexError) as e:
+            log.warning("invalid_message", type="BATCH_ACK", error=e)
+        return
+
     # HEARTBEAT|12345678
     if message.startswith("HEARTBEAT|"):
         # Just acknowledge heartbeat, no action needed
@@ -364,15 +562,27 @@ def handle_serial_message(message: str):
         serial_handler.send_message(f"PONG|{int(datetime.now().timestamp() * 1000)}\n")
         return
 
+    # PONG|12345678 (answer to our clock sync PING)
+    if message.startswith("PONG|"):
+        try:
+            sample = clock.pong_received(int(message.split('|')[1]), received)
+            if sample:
+                metrics.MCU_CLOCK_RTT.observe(sample.rtt)
+                log.debug("clock_sample", rtt_ms=round(sample.rtt * 1000, 2),
+                          offset_ms=round(sample.offset_ms, 1), drift_ppm=round(clock.drift * 1e6, 1))
+        except (ValueError, IndexError) as e:
+            log.warning("invalid_message", type="PONG", error=e)
+        return
+
     # ERROR|E001|IMU initialization failed
     if message.startswith("ERROR|"):
         try:
             parts = message.split('|')
             error_code = parts[1]
             error_msg = parts[2] if len(parts) > 2 else "Unknown error"
-            print(f"❌ MCU ERROR [{error_code}]: {error_msg}")
+            log.error("mcu_error", code=error_code, error=error_msg)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid ERROR message: {e}")
+            log.warning("invalid_message", type="ERROR", error=e)
         return
 
     # ==========================================
@@ -384,20 +594,19 @@ def handle_serial_message(message: str):
     if message.startswith("EXERCISE_SELECTED|"):
         try:
             exercise_id = message.split('|')[1].strip()
-            exercise_data = next((ex for ex in EXERCISES if ex['id'] == exercise_id), None)
+            exercise_data = CATALOG.get(exercise_id)
             if exercise_data:
-                flask_app.oled_selection.update({
-                    'exercise': exercise_id,
-                    'exerciseName': exercise_data['name'],
-                    'icon': exercise_data['icon'],
-                    'caloriesPerRep': exercise_data['calories_per_rep']
-                })
-                print(f"🎮 OLED: User selected {exercise_data['name']}")
-                print(f"   Frontend will update in real-time!")
+                flask_app.local.update_selection(
+                    exercise=exercise_id,
+                    exerciseName=exercise_data['name'],
+                    icon=exercise_data['icon'],
+                    caloriesPerRep=exercise_data['calories_per_rep']
+                )
+                log.info("oled_exercise", exercise=exercise_data['name'])
             else:
-                print(f"⚠️ Unknown exercise ID: {exercise_id}")
+                log.warning("unknown_exercise", exercise=exercise_id)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid EXERCISE_SELECTED message: {e}")
+            log.warning("invalid_message", type="EXERCISE_SELECTED", error=e)
         return
 
     # ==========================================
@@ -408,10 +617,10 @@ def handle_serial_message(message: str):
     if message.startswith("REPS_SELECTED|"):
         try:
             reps = int(message.split('|')[1])
-            flask_app.oled_selection['reps'] = reps
-            print(f"🎮 OLED: User selected {reps} reps")
+            flask_app.local.update_selection(reps=reps)
+            log.info("oled_reps", reps=reps)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid REPS_SELECTED message: {e}")
+            log.warning("invalid_message", type="REPS_SELECTED", error=e)
         return
 
     # ==========================================
@@ -422,10 +631,10 @@ def handle_serial_message(message: str):
     if message.startswith("SETS_SELECTED|"):
         try:
             sets = int(message.split('|')[1])
-            flask_app.oled_selection['sets'] = sets
-            print(f"🎮 OLED: User selected {sets} sets")
+            flask_app.local.update_selection(sets=sets)
+            log.info("oled_sets", sets=sets)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid SETS_SELECTED message: {e}")
+            log.warning("invalid_message", type="SETS_SELECTED", error=e)
         return
 
     # ==========================================
@@ -436,17 +645,17 @@ def handle_serial_message(message: str):
     # and user confirms "START" on OLED or Frontend
     if message.startswith("WORKOUT_START_CONFIRMED"):
         # Check if we have all required data (from OLED selections or Frontend)
-        oled = flask_app.oled_selection
+        oled = flask_app.local.selection
 
-        # Use OLED selections if available, otherwise use what's already in workout_state
-        exercise_id = oled.get('exercise') or flask_app.workout_state.get('exercise')
-        reps = oled.get('reps') or flask_app.workout_state.get('targetReps')
-        sets = oled.get('sets') or flask_app.workout_state.get('totalSets')
+        # Use OLED selections if available, otherwise use what's already in the workout state
+        exercise_id = oled.get('exercise') or flask_app.local.workout.get('exercise')
+        reps = oled.get('reps') or flask_app.local.workout.get('targetReps')
+        sets = oled.get('sets') or flask_app.local.workout.get('totalSets')
 
         if exercise_id and reps and sets:
-            exercise_data = next((ex for ex in EXERCISES if ex['id'] == exercise_id), None)
+            exercise_data = CATALOG.get(exercise_id)
             if exercise_data:
-                flask_app.workout_state.update({
+                flask_app.local.workout.update({
                     'active': True,
                     'exercise': exercise_id,
                     'exerciseName': exercise_data['name'],
@@ -461,14 +670,14 @@ def handle_serial_message(message: str):
                     'status': 'waiting',
                     'validReps': 0
                 })
-                print(f"🚀 WORKOUT STARTED:")
-                print(f"   Exercise: {exercise_data['name']}")
-                print(f"   Target: {reps} reps × {sets} sets")
-                print(f"   Both OLED & Frontend synchronized!")
+                flask_app.local.publish_workout()
+                start_timeline(exercise_id)
+                log.info("workout_started", exercise=exercise_data['name'],
+                         reps=reps, sets=sets, source="oled+frontend")
             else:
-                print(f"⚠️ Unknown exercise: {exercise_id}")
+                log.warning("unknown_exercise", exercise=exercise_id)
         else:
-            print(f"⚠️ Missing workout parameters (exercise/reps/sets)")
+            log.warning("workout_params_missing", exercise=exercise_id, reps=reps, sets=sets)
         return
 
     # ==========================================
@@ -477,8 +686,8 @@ def handle_serial_message(message: str):
     # Format from MCU: STATUS|waiting (or ready, or active)
     if message.startswith("STATUS|"):
         status = message.split('|')[1].strip()
-        flask_app.update_workout_state(status=status)
-        print(f"📊 Workout status: {status}")
+        flask_app.local.update_workout(status=status)
+        log.info("workout_status", status=status)
         return
 
     # ==========================================
@@ -489,11 +698,11 @@ def handle_serial_message(message: str):
         try:
             reps = int(message.split('|')[1])
             # Calculate calories
-            calories = reps * flask_app.workout_state['caloriesPerRep']
-            flask_app.update_workout_state(reps=reps, calories=calories)
-            print(f"🏋️ Rep count: {reps} | Calories: {calories:.1f}")
+            calories = reps * flask_app.local.workout['caloriesPerRep']
+            flask_app.local.update_workout(reps=reps, calories=calories)
+            log.info("rep_count", sample="REP_DETECT", reps=reps, calories=f"{calories:.1f}")
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid REP_COUNT message: {e}")
+            log.warning("invalid_message", type="REP_COUNT", error=e)
         return
 
     # ==========================================
@@ -503,10 +712,10 @@ def handle_serial_message(message: str):
     if message.startswith("SET_PROGRESS|"):
         try:
             current_set = int(message.split('|')[1])
-            flask_app.update_workout_state(current_set=current_set)
-            print(f"📈 Current set: {current_set}")
+            flask_app.local.update_workout(current_set=current_set)
+            log.info("set_progress", set=current_set)
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid SET_PROGRESS message: {e}")
+            log.warning("invalid_message", type="SET_PROGRESS", error=e)
         return
 
     # ==========================================
@@ -516,10 +725,10 @@ def handle_serial_message(message: str):
     if message.startswith("CALORIES|"):
         try:
             calories = float(message.split('|')[1])
-            flask_app.update_workout_state(calories=calories)
-            print(f"🔥 Calories burned: {calories:.1f}")
+            flask_app.local.update_workout(calories=calories)
+            log.info("calories", calories=f"{calories:.1f}")
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid CALORIES message: {e}")
+            log.warning("invalid_message", type="CALORIES", error=e)
         return
 
     # ==========================================
@@ -528,6 +737,8 @@ def handle_serial_message(message: str):
     # Format from MCU: WORKOUT_COMPLETE|exercise|reps|sets|duration|valid_reps
     # Example: WORKOUT_COMPLETE|bicep_curl|10|3|5.2|28
     if message.startswith("WORKOUT_COMPLETE|"):
+        if imu_analyzer:
+            imu_analyzer.flush()
         try:
             parts = message.split('|')
             if len(parts) >= 6:
@@ -540,8 +751,7 @@ def handle_serial_message(message: str):
                     valid_reps = int(parts[5])
 
                     # Find exercise name
-                    exercise_data = next((ex for ex in EXERCISES if ex['id'] == exercise_id), None)
-                    exercise_name = exercise_data['name'] if exercise_data else exercise_id
+                    exercise_name = CATALOG.name(exercise_id)
 
                     # Save to database
                     database.record_workout(
@@ -552,18 +762,24 @@ def handle_serial_message(message: str):
                         duration=duration,
                         valid_reps=valid_reps
                     )
+                    if sync_agent:
+                        sync_agent.notify()
+
+                    # Keep the per-rep timeline next to the totals
+                    if flask_app.local.rep_timeline:
+                        flask_app.local.rep_timeline.exercise = flask_app.local.rep_timeline.exercise or exercise_id
+                        flask_app.timelines.save(username, flask_app.local.rep_timeline)
+                        flask_app.local.rep_timeline = None
 
                     # Update workout state
-                    flask_app.update_workout_state(valid_reps=valid_reps)
-                    flask_app.complete_workout()
-
-                    print(f"💾 Workout saved for {username}")
-                    print(f"   Exercise: {exercise_name}")
-                    print(f"   Reps: {reps} × {sets} = {reps * sets} total")
-                    print(f"   Valid reps: {valid_reps} ({valid_reps / (reps * sets) * 100:.0f}%)")
-                    print(f"   Duration: {duration:.1f} min")
+                    flask_app.local.update_workout(valid_reps=valid_reps)
+                    flask_app.local.complete_workout()
+
+                    log.info("workout_saved", user=username, exercise=exercise_name,
+                             reps=reps, sets=sets, valid_reps=valid_reps,
+                             duration_min=f"{duration:.1f}")
         except (ValueError, IndexError) as e:
-            print(f"⚠️ Invalid WORKOUT_COMPLETE message: {e}")
+            log.warning("invalid_message", type="WORKOUT_COMPLETE", error=e)
         return
 
     # ==========================================
@@ -573,11 +789,11 @@ def handle_serial_message(message: str):
     if message.startswith("POSITION|"):
         position = message.split('|')[1].strip()
         if position == "at_start":
-            flask_app.update_workout_state(status='ready')
-            print(f"✅ User at starting position")
+            flask_app.local.update_workout(status='ready')
+            log.info("position", position="at_start")
         else:
-            flask_app.update_workout_state(status='waiting')
-            print(f"⏳ Moving to starting position...")
+            flask_app.local.update_workout(status='waiting')
+            log.info("position", position=position)
         return
 
     # ==========================================
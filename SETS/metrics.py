@@ -0,0 +1,226 @@
+# metrics.py
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds: 100us .. 10s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base for a metric family; unlabeled families act as their own single child"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> '_Metric':
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> '_Metric':
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        if not self.labelnames:
+            return self._child_samples(())
+        lines = []
+        for key, child in list(self._children.items()):
+            lines.extend(child._child_samples(key))
+        return lines
+
+    def _child_samples(self, key: Tuple[str, ...]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + ''.join(line + '\n' for line in self._samples())
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+    def _new_child(self) -> 'Counter':
+        child = Counter(self.name, self.documentation)
+        child.labelnames = self.labelnames
+        return child
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def _child_samples(self, key):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(self.value)}"]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str,
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value at scrape time instead of on every change"""
+        self.function = function
+
+    def _child_samples(self, key):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float('nan')
+        return [f"{self.name} {_format_value(value)}"]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def _new_child(self) -> 'Histogram':
+        child = Histogram(self.name, self.documentation, buckets=self.buckets)
+        child.labelnames = self.labelnames
+        return child
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> '_Timer':
+        """Context manager that observes the elapsed wall time"""
+        return _Timer(self)
+
+    def _child_samples(self, key):
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        return ''.join(metric.render() for metric in self._metrics)
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ==========================================
+# SERIAL LINK
+# ==========================================
+SERIAL_RX_BYTES = REGISTRY.register(Counter('sets_serial_rx_bytes_total', 'Bytes received from the MCU'))
+SERIAL_RX_LINES = REGISTRY.register(Counter('sets_serial_rx_lines_total', 'Lines received from the MCU'))
+SERIAL_TX_BYTES = REGISTRY.register(Counter('sets_serial_tx_bytes_total', 'Bytes sent to the MCU'))
+SERIAL_TX_LINES = REGISTRY.register(Counter('sets_serial_tx_lines_total', 'Lines sent to the MCU'))
+SERIAL_RECONNECTS = REGISTRY.register(Counter('sets_serial_reconnects_total', 'Serial link reconnects'))
+SERIAL_RX_QUEUE_DEPTH = REGISTRY.register(Gauge('sets_serial_rx_queue_depth', 'Lines waiting in the RX queue'))
+SERIAL_TX_BACKLOG = REGISTRY.register(Gauge('sets_serial_tx_backlog', 'Messages waiting in the TX queue'))
+SERIAL_TX_PACING_WAIT = REGISTRY.register(Histogram(
+    'sets_serial_tx_pacing_wait_seconds', 'Time spent in MCU pacing delays per transmitted message'))
+SERIAL_BATCH_SECONDS = REGISTRY.register(Histogram(
+    'sets_serial_batch_seconds', 'BATCH frame queued to its BATCH_ACK received'))
+
+# ==========================================
+# PROTOCOL HANDLING
+# ==========================================
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'sets_handler_seconds', 'handle_serial_message time per message type', ['type']))
+MCU_TO_UI_LATENCY = REGISTRY.register(Histogram(
+    'sets_mcu_to_ui_latency_seconds', 'REP_DETECT MCU time (synced to host) to workout state update'))
+MCU_LINK_LATENCY = REGISTRY.register(Histogram(
+    'sets_mcu_link_latency_seconds', 'REP_DETECT MCU time (synced to host) to the line being read'))
+MCU_CLOCK_RTT = REGISTRY.register(Histogram(
+    'sets_mcu_clock_rtt_seconds', 'Clock sync PING/PONG round trip'))
+MCU_CLOCK_DRIFT = REGISTRY.register(Gauge('sets_mcu_clock_drift_ppm', 'MCU clock rate relative to the host clock'))
+IMU_WINDOWS = REGISTRY.register(Counter(
+    'sets_imu_windows_total', 'IMU sample windows by outcome (analyzed, dropped, failed)', ['result']))
+IMU_POOL_RESTARTS = REGISTRY.register(Counter(
+    'sets_imu_pool_restarts_total', 'IMU worker pools replaced after a worker died'))
+IMU_ANALYSIS_SECONDS = REGISTRY.register(Histogram(
+    'sets_imu_analysis_seconds', 'IMU window handed to the worker pool to result received'))
+
+# ==========================================
+# STORAGE / HTTP / PROCESS
+# ==========================================
+DB_WRITE_SECONDS = REGISTRY.register(Histogram('sets_db_write_seconds', 'UserDatabase.record_workout time'))
+SYNC_ROWS = REGISTRY.register(Counter('sets_sync_rows_total', 'Workouts uploaded to the central service'))
+SYNC_BYTES = REGISTRY.register(Counter('sets_sync_bytes_total', 'Compressed bytes uploaded to the central service'))
+SYNC_ERRORS = REGISTRY.register(Counter('sets_sync_errors_total', 'Failed uploads to the central service'))
+SYNC_DEAD_LETTER_ROWS = REGISTRY.register(Counter(
+    'sets_sync_dead_letter_rows_total', 'Workouts in batches the central service rejected (kept in sync_dead_letter/)'))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'sets_http_request_seconds', 'Flask request latency per route', ['route', 'method', 'status']))
+RENDER_CACHE = REGISTRY.register(Counter(
+    'sets_render_cache_total', 'Rendered page cache lookups', ['page', 'result']))
+EVENTS_PUBLISHED = REGISTRY.register(Counter('sets_events_published_total', 'Events published on the live event bus'))
+EVENT_BUS_SUBSCRIBERS = REGISTRY.register(Gauge('sets_event_bus_subscribers', 'Connected live event viewers'))
+EVENT_BUS_EVICTIONS = REGISTRY.register(Counter(
+    'sets_event_bus_evictions_total', 'Viewers dropped for falling too far behind'))
+PROCESS_CPU_SECONDS = REGISTRY.register(Gauge(
+    'process_cpu_seconds_total', 'User and system CPU time of this process', function=time.process_time))
@@ -0,0 +1,138 @@
+# profiler.py
+"""
+Sampling profiler for the running service (serial threads, dispatch loop, Flask workers)
+
+Nothing runs until a profile is asked for: /admin/profile in app.py, or
+SIGUSR1 (POSIX), which profiles PROFILER_SIGNAL_SECONDS in the background and
+writes the result to PROFILE_DIR. While it runs, a thread wakes every
+`interval` seconds and records the Python stack of every other thread.
+
+Output is folded stacks, one line per distinct stack with its sample count,
+rooted at the thread name, ready for flamegraph.pl or speedscope:
+
+    serial-tx;_bootstrap (threading.py:995);...;_run (serial_handler.py:140) 812
+
+Samples are wall-clock: a thread blocked on a queue or socket shows up in
+the frame that is waiting, which is also what "why is this slow" needs.
+"""
+import collections
+import os
+import pathlib
+import signal
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import PROFILER_INTERVAL, PROFILER_MAX_SECONDS, PROFILER_SIGNAL_SECONDS, PROFILE_DIR
+from event_log import get_logger
+
+log = get_logger("profiler")
+
+class ProfilerBusy(Exception):
+    """Another profile is already running"""
+
+_running = threading.Lock()
+_labels: Dict[object, str] = {}
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+class Profile:
+    """Stack counts from one profiling run"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.seconds = 0.0
+        self.stacks: Dict[Tuple, int] = collections.Counter()
+
+    def folded(self) -> str:
+        """flamegraph.pl input: 'thread;outer;...;inner count' per line, most samples first"""
+        lines = []
+        for (thread, *codes), count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            lines.append(';'.join([thread.replace(';', ':')] + [_label(c) for c in codes]) + f" {count}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+def profile(seconds: float, interval: float = PROFILER_INTERVAL,
+            threads: Optional[Iterable[str]] = None) -> Profile:
+    """
+    Sample for `seconds` (blocks the calling thread)
+
+    threads: only threads whose name starts with one of these prefixes
+    (e.g. ['serial', 'MainThread']); default all. Raises ProfilerBusy if a
+    profile is already running.
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        seconds = min(max(seconds, interval), PROFILER_MAX_SECONDS)
+        prefixes = tuple(threads) if threads else None
+        me = threading.get_ident()
+        names: Dict[int, str] = {}
+        result = Profile(interval)
+        stacks = result.stacks
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+        while True:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                    name = names.setdefault(ident, f"thread-{ident}")
+                if prefixes and not name.startswith(prefixes):
+                    continue
+                codes: List = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.append(name)
+                stacks[tuple(reversed(codes))] += 1
+            del frames, frame
+            result.samples += 1
+            next_sample += interval
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if next_sample > now:
+                time.sleep(next_sample - now)
+            else:
+                next_sample = now  # Fell behind: do not burst to catch up
+        result.seconds = time.perf_counter() - started
+        return result
+    finally:
+        _running.release()
+
+# ==========================================
+# SIGNAL TRIGGER
+# ==========================================
+
+def profile_to_file(seconds: float = PROFILER_SIGNAL_SECONDS) -> Optional[pathlib.Path]:
+    """Profile in this thread and write PROFILE_DIR/profile-<time>.folded"""
+    try:
+        result = profile(seconds)
+    except ProfilerBusy:
+        log.warning("profile_skipped", reason="already running")
+        return None
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    path.write_text(result.folded())
+    log.info("profile_written", file=str(path), samples=result.samples, seconds=f"{result.seconds:.1f}")
+    return path
+
+def install_signal_handler() -> bool:
+    """SIGUSR1 starts a background profile (call from the main thread; no-op where there is no SIGUSR1)"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+
+    def on_signal(signum, frame):
+        threading.Thread(target=profile_to_file, daemon=True, name="profiler").start()
+
+    signal.signal(signal.SIGUSR1, on_signal)
+    return True
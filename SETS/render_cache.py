@@ -0,0 +1,45 @@
+# render_cache.py
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+from compression import CompressedBody
+import metrics
+
+class RenderCache:
+    """
+    Rendered pages per (page, user), valid for one version of the user's data
+
+    UserDatabase.data_version() changes whenever the history file changes, so a
+    stale entry is simply never matched again and gets replaced on the next
+    render. Entries keep their gzip/brotli variants, so a cache hit does no
+    template or compression work at all.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (page, user) -> (data version, CompressedBody)
+        self._lock = threading.Lock()
+
+    def get(self, page: str, username: str, version: Hashable) -> Optional[CompressedBody]:
+        key = (page, username)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                metrics.RENDER_CACHE.labels(page, 'miss').inc()
+                return None
+            self._entries.move_to_end(key)
+        metrics.RENDER_CACHE.labels(page, 'hit').inc()
+        return entry[1]
+
+    def put(self, page: str, username: str, version: Hashable, html: str) -> CompressedBody:
+        body = CompressedBody(html.encode('utf-8'))
+        with self._lock:
+            self._entries[(page, username)] = (version, body)
+            self._entries.move_to_end((page, username))
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
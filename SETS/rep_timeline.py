@@ -0,0 +1,306 @@
+# rep_timeline.py
+"""
+Per-rep timeline of a workout, with tempo, rest and fatigue kept up to date per rep
+
+Every REP_DETECT is recorded as (set, rep, ms since the workout started) and
+folded into running per-set statistics, so each rep costs O(1) no matter how
+long the workout is:
+
+    tempo     mean / min / max / stdev of the rep-to-rep interval (Welford)
+    rest      first rep of a set minus the last rep of the previous one
+    fatigue   smoothed recent interval vs the set's first intervals, in % slower
+
+Finished workouts are appended to user_data/timelines/<user>.reps:
+
+    header  <4s q I B   magic b'REP2', start (epoch ms), rep count, exercise id length
+            exercise id (utf-8)
+    body    rep count x uint8 set (bit 7: first rep after a pause),
+            then x uint16 rep, then x uint32 offset ms
+            (0xFFFFFFFF = rep had no MCU timestamp)
+    trailer <I          length of header + exercise id + body
+
+The trailer lets the newest records be found from the end of the file, so
+saving checks only the last record and loading reads only what it returns.
+Older b'REP1' records have no trailer; a file holding them is scanned from
+the start once, on the next save.
+"""
+import itertools
+import math
+import pathlib
+import struct
+import sys
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from event_log import get_logger
+
+log = get_logger("timeline")
+
+MAGIC = b'REP2'
+LEGACY_MAGIC = b'REP1'  # Same record without the trailer
+HEADER = struct.Struct('<4sqIB')
+TRAILER = struct.Struct('<I')
+NO_TIME = 0xFFFFFFFF
+AFTER_PAUSE = 0x80
+EARLY_REPS = 3        # Intervals that define a set's starting tempo
+FATIGUE_SMOOTHING = 0.3  # EMA weight of the newest interval
+
+if sys.byteorder != 'little':
+    raise ImportError("rep_timeline.py stores little-endian arrays and assumes a little-endian host")
+
+class SetStats:
+    """Running tempo statistics for one set"""
+    __slots__ = ('set', 'reps', 'last_ms', 'rest', 'intervals',
+                 'mean', '_m2', 'min', 'max', '_early_sum', 'recent')
+
+    def __init__(self, set_num: int, rest: Optional[float]):
+        self.set = set_num
+        self.reps = 0
+        self.last_ms: Optional[int] = None
+        self.rest = rest
+        self.intervals = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._early_sum = 0.0
+        self.recent = 0.0
+
+    def add_interval(self, seconds: float):
+        self.intervals += 1
+        delta = seconds - self.mean
+        self.mean += delta / self.intervals
+        self._m2 += delta * (seconds - self.mean)
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if self.intervals <= EARLY_REPS:
+            self._early_sum += seconds
+            self.recent = self._early_sum / self.intervals
+        else:
+            self.recent += FATIGUE_SMOOTHING * (seconds - self.recent)
+
+    @property
+    def fatigue_pct(self) -> Optional[float]:
+        """How much slower the recent reps are than the first ones (None until there are more than EARLY_REPS)"""
+        if self.intervals <= EARLY_REPS:
+            return None
+        early = self._early_sum / EARLY_REPS
+        return (self.recent / early - 1) * 100 if early > 0 else None
+
+    def to_dict(self) -> Dict:
+        fatigue = self.fatigue_pct
+        return {
+            'set': self.set,
+            'reps': self.reps,
+            'tempo_s': round(self.mean, 3) if self.intervals else None,
+            'tempo_min_s': round(self.min, 3) if self.intervals else None,
+            'tempo_max_s': round(self.max, 3) if self.intervals else None,
+            'tempo_stdev_s': round(math.sqrt(self._m2 / self.intervals), 3) if self.intervals else None,
+            'rest_s': round(self.rest, 1) if self.rest is not None else None,
+            'fatigue_pct': round(fatigue, 1) if fatigue is not None else None,
+        }
+
+class RepTimeline:
+    """
+    One workout's reps, fed straight from the serial handler
+
+    Timestamps are MCU milliseconds; rate converts MCU ms to host ms (clock
+    drift, see ClockSync.duration). Reps without a timestamp are counted but
+    add no tempo sample.
+    """
+
+    def __init__(self, exercise: str, start_ms: int = 0, started_at: Optional[datetime] = None,
+                 rate: float = 1.0):
+        self.exercise = exercise
+        self.started_at = started_at or datetime.now()
+        self.rate = rate
+        self._base_ms: Optional[int] = start_ms or None
+        self.sets: List[SetStats] = []
+        self.set_nums = array('B')
+        self.rep_nums = array('H')
+        self.offsets = array('I')
+        self._after_pause = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _offset(self, mcu_ms: int) -> int:
+        if self._base_ms is None:
+            self._base_ms = mcu_ms
+        return max(0, round((mcu_ms - self._base_ms) * self.rate))
+
+    def rep(self, rep_num: int, set_num: int, mcu_ms: int = 0) -> Dict:
+        """Record one REP_DETECT; returns the metrics of the set it belongs to"""
+        with self._lock:
+            return self._add(rep_num, set_num, self._offset(mcu_ms) if mcu_ms else None)
+
+    def _add(self, rep_num: int, set_num: int, offset: Optional[int]) -> Dict:
+        current = self.sets[-1] if self.sets else None
+
+        if current is None or set_num != current.set:
+            rest = None
+            if current is not None and offset is not None and current.last_ms is not None:
+                rest = (offset - current.last_ms) / 1000
+            current = SetStats(set_num, rest)
+            self.sets.append(current)
+        elif offset is not None and current.last_ms is not None and not self._after_pause:
+            current.add_interval((offset - current.last_ms) / 1000)
+
+        current.reps += 1
+        if offset is not None:
+            current.last_ms = offset
+        self.set_nums.append(min(set_num, AFTER_PAUSE - 1) | (AFTER_PAUSE if self._after_pause else 0))
+        self._after_pause = False
+        self.rep_nums.append(min(rep_num, 0xFFFF))
+        self.offsets.append(NO_TIME if offset is None else min(offset, NO_TIME - 1))
+        return current.to_dict()
+
+    def pause(self):
+        """The next interval spans a pause, so it is not a tempo sample"""
+        with self._lock:
+            self._after_pause = True
+
+    def summary(self) -> Dict:
+        with self._lock:
+            sets = [s.to_dict() for s in self.sets]
+        first_tempo = sets[0]['tempo_s'] if sets else None
+        for s in sets:
+            # Slow-down of each set against the first one (fatigue across sets)
+            s['tempo_change_pct'] = (round((s['tempo_s'] / first_tempo - 1) * 100, 1)
+                                     if s['tempo_s'] and first_tempo else None)
+        return {
+            'exercise': self.exercise,
+            'startTime': self.started_at.isoformat(),
+            'reps': len(self),
+            'sets': sets,
+        }
+
+    def to_bytes(self) -> bytes:
+        name = self.exercise.encode('utf-8')[:255]
+        header = HEADER.pack(MAGIC, int(self.started_at.timestamp() * 1000), len(self), len(name))
+        record = header + name + self.set_nums.tobytes() + self.rep_nums.tobytes() + self.offsets.tobytes()
+        return record + TRAILER.pack(len(record))
+
+    @classmethod
+    def replay(cls, exercise: str, started_at: datetime, set_nums, rep_nums, offsets) -> 'RepTimeline':
+        """Rebuild a stored workout (offsets are already host ms from the start)"""
+        timeline = cls(exercise, started_at=started_at)
+        timeline._base_ms = 0
+        for set_num, rep_num, offset in zip(set_nums, rep_nums, offsets):
+            timeline._after_pause = bool(set_num & AFTER_PAUSE)
+            timeline._add(rep_num, set_num & ~AFTER_PAUSE, None if offset == NO_TIME else offset)
+        return timeline
+
+def _record_end(data: memoryview, pos: int) -> Optional[int]:
+    """End offset of the record at pos, or None if it is cut short or not a record"""
+    if pos + HEADER.size > len(data):
+        return None
+    magic, _, count, name_len = HEADER.unpack_from(data, pos)
+    end = pos + HEADER.size + name_len + count * 7
+    if magic == MAGIC:
+        if end + TRAILER.size > len(data) or TRAILER.unpack_from(data, end)[0] != end - pos:
+            return None
+        end += TRAILER.size
+    elif magic != LEGACY_MAGIC:
+        return None
+    return end if end <= len(data) else None
+
+def _valid_end(data: memoryview) -> int:
+    """Length of the leading run of complete records"""
+    pos = 0
+    while True:
+        end = _record_end(data, pos)
+        if end is None:
+            return pos
+        pos = end
+
+def _parse(data: memoryview, pos: int) -> RepTimeline:
+    """The record at pos (already checked with _record_end)"""
+    _, start_ms, count, name_len = HEADER.unpack_from(data, pos)
+    pos += HEADER.size
+    exercise = bytes(data[pos:pos + name_len]).decode('utf-8', errors='replace')
+    pos += name_len
+    set_nums = data[pos:pos + count]
+    pos += count
+    rep_nums = data[pos:pos + count * 2].cast('H')
+    pos += count * 2
+    offsets = data[pos:pos + count * 4].cast('I')
+    return RepTimeline.replay(exercise, datetime.fromtimestamp(start_ms / 1000),
+                              set_nums, rep_nums, offsets)
+
+def _read_last(f, end: int) -> Optional[memoryview]:
+    """The trailer-framed record that ends at offset end of f, or None"""
+    if end < HEADER.size + TRAILER.size:
+        return None
+    f.seek(end - TRAILER.size)
+    length = TRAILER.unpack(f.read(TRAILER.size))[0]
+    start = end - TRAILER.size - length
+    if start < 0:
+        return None
+    f.seek(start)
+    data = memoryview(f.read(end - start))
+    return data if _record_end(data, 0) == len(data) else None
+
+class TimelineStore:
+    """Append-only per-user files of finished workout timelines"""
+
+    def __init__(self, data_dir: pathlib.Path):
+        self.path = pathlib.Path(data_dir) / 'timelines'
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _file(self, username: str) -> pathlib.Path:
+        return self.path / f"{username.lower()}.reps"
+
+    def save(self, username: str, timeline: RepTimeline):
+        if not len(timeline):
+            return
+        data = timeline.to_bytes()
+        path = self._file(username)
+        with self._lock, open(path, 'a+b') as f:
+            # A crash mid-write leaves a partial record at the end; appending after it
+            # would hide every later workout, so cut it off first. Only the last
+            # record is checked; the whole file is scanned only when that fails.
+            size = f.seek(0, 2)
+            if size and _read_last(f, size) is None:
+                f.seek(0)
+                valid = _valid_end(memoryview(f.read()))
+                if valid != size:
+                    log.warning("timeline_file_repaired", user=username, dropped_bytes=size - valid)
+                    f.truncate(valid)
+            f.write(data)
+
+    def _records(self, username: str) -> Iterator[RepTimeline]:
+        """Stored workouts, newest first, read from the end of the file"""
+        path = self._file(username)
+        if not path.exists():
+            return
+        with open(path, 'rb') as f:
+            end = f.seek(0, 2)
+            while end:
+                record = _read_last(f, end)
+                if record is None:
+                    break
+                yield _parse(record, 0)
+                end -= len(record)
+            if not end:
+                return
+            # Legacy records without a trailer, or a partial record at the end
+            f.seek(0)
+            data = memoryview(f.read(end))
+        valid = _valid_end(data)
+        if valid != len(data):
+            log.warning("timeline_file_truncated", user=username, offset=valid)
+        starts = []
+        pos = 0
+        while pos < valid:
+            starts.append(pos)
+            pos = _record_end(data, pos)
+        for pos in reversed(starts):
+            yield _parse(data, pos)
+
+    def load(self, username: str, limit: int = 10) -> List[Dict]:
+        """Summaries of the user's last `limit` workouts, newest first"""
+        return [timeline.summary() for timeline in itertools.islice(self._records(username), max(limit, 0))]
@@ -1,10 +1,16 @@
 # rfid_auth.py
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
+from config import STATION_ID
+from sessions import SessionStore
+from user_directory import UserDirectory
 
 class RFIDAuth:
-    def __init__(self, rfid_users: dict):
-        self.rfid_users = rfid_users
-        self.current_user: Optional[str] = None
+    def __init__(self, rfid_users: Union[UserDirectory, dict], sessions: Optional[SessionStore] = None):
+        # A plain {uid: name} dict still works (tools, benchmarks)
+        if isinstance(rfid_users, dict):
+            rfid_users = UserDirectory(None, rfid_users)
+        self.users = rfid_users
+        self.sessions = sessions or SessionStore()
     
     def parse_uid_message(self, message: str) -> Optional[str]:
         if message.startswith("UID_REQ|"):
@@ -12,20 +18,20 @@ class RFIDAuth:
         return None
     
     def validate_user(self, uid_with_spaces: str) -> Tuple[bool, Optional[str]]:
-        uid_clean = uid_with_spaces.replace(' ', '')[:8]
-        if uid_clean in self.rfid_users:
-            return True, self.rfid_users[uid_clean]
+        username = self.users.lookup(uid_with_spaces)
+        if username:
+            return True, username
         return False, None
     
-    def login(self, uid_with_spaces: str) -> Tuple[bool, Optional[str]]:
+    def login(self, uid_with_spaces: str, station: str = STATION_ID) -> Tuple[bool, Optional[str]]:
         is_valid, username = self.validate_user(uid_with_spaces)
         if is_valid:
-            self.current_user = username
+            self.sessions.login(station, username)
             return True, username
         return False, None
     
-    def logout(self):
-        self.current_user = None
+    def logout(self, station: str = STATION_ID):
+        self.sessions.logout(station)
     
-    def get_current_user(self) -> Optional[str]:
-        return self.current_user
\ No newline at end of file
+    def get_current_user(self, station: str = STATION_ID) -> Optional[str]:
+        return self.sessions.user(station)
\ No newline at end of file
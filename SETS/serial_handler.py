@@ -2,107 +2,318 @@
 import serial
 import threading
 import queue
+import re
 import time
+from typing import Callable, Dict, List, Optional, Tuple
+import metrics
+from event_log import get_logger
+from transport import Transport, open_serial
+from config import (MCU_INIT_DELAY, MCU_HANDSHAKE, MCU_PING_INTERVAL, LOG_SERIAL_LINES,
+                    RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, RECONNECT_HANDSHAKE_TIMEOUT,
+                    MCU_BATCH, MCU_BATCH_MAX_BYTES)
+
+# Boot banner the MCU prints at the end of setup()
+READY_BANNER = "MCU_READY"
+
+# Anything shaped like MESSAGE_TYPE or MESSAGE_TYPE|fields is a protocol line.
+# Used to tell real early messages apart from garbage printed while the MCU resets.
+PROTOCOL_LINE = re.compile(r'^[A-Z][A-Z0-9_]*(\|.*)?$')
+
+# BATCH|<id>|cmd1;cmd2;... is answered with BATCH_ACK|<id>|OK;ERR;...
+BATCH_ACK_TIMEOUT = 30.0  # Seconds an unanswered batch is remembered
+
+log = get_logger("serial")
+
+class LineFramer:
+    """Split a byte stream into lines, keeping a partial line until its newline arrives"""
+
+    def __init__(self, max_line: int = 1024):
+        self.max_line = max_line
+        self._partial = b''
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if b'\n' not in data:
+            self._partial += data
+            if len(self._partial) > self.max_line:
+                self._partial = b''  # Noise with no newline, drop it
+            return []
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        return lines
 
 class SerialHandler:
-    def __init__(self, port: str, baudrate: int, timeout: float):
+    def __init__(self, port: str, baudrate: int, timeout: float,
+                 init_delay: float = MCU_INIT_DELAY, handshake: bool = MCU_HANDSHAKE,
+                 transport_factory: Optional[Callable[[], Transport]] = None, batching: bool = MCU_BATCH):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
-        self.serial_conn = None
+        self.init_delay = init_delay
+        self.handshake = handshake
+        # Opens the link; defaults to the real serial port (see transport.py)
+        self.transport_factory = transport_factory or (lambda: open_serial(port, baudrate, timeout))
+        self.serial_conn: Optional[Transport] = None
+        self._conn_lock = threading.Lock()  # Pairs serial_conn with is_connected for the RX thread
+        self._framer = LineFramer()
+        self._last_tx_time = 0
 
         self.rx_queue = queue.Queue()
         self.tx_queue = queue.Queue()
-        self.is_running = False
-        self.thread = None
+        self.is_running = False      # Background threads alive
+        self.is_connected = False    # Serial link actually up
+        self.thread = None           # TX + reconnect supervisor
+        self.rx_thread = None        # Reads and frames incoming lines
+        self.batching = batching     # send_batch() packs commands into BATCH| frames
+        self._batch_id = 0
+        self._batches: Dict[int, Tuple[List[str], float]] = {}  # Sent, not yet acknowledged
+        self._batch_lock = threading.Lock()
+
+        # Called after a reconnect; returns messages that bring the MCU back
+        # in sync with the current session (sent before anything queued)
+        self.on_reconnect: Optional[Callable[[], List[str]]] = None
+        # Called with (message, time.monotonic()) right after a message is flushed
+        # to the port, i.e. when it actually left the host (clock sync uses this)
+        self.on_transmit: Optional[Callable[[str, float], None]] = None
+
+        metrics.SERIAL_RX_QUEUE_DEPTH.set_function(self.rx_queue.qsize)
+        metrics.SERIAL_TX_BACKLOG.set_function(self.tx_queue.qsize)
 
     def start(self) -> bool:
         try:
-            self.serial_conn = serial.Serial(
-                port=self.port,
-                baudrate=self.baudrate,
-                timeout=self.timeout,
-                write_timeout=2.0  # 2 second write timeout
-            )
-            # Give MCU time to reset after serial connection
-            print("⏳ Waiting for MCU to initialize (3 seconds)...")
-            time.sleep(3)
-
-            # Clear any garbage data in buffer
-            self.serial_conn.reset_input_buffer()
-            self.serial_conn.reset_output_buffer()
+            self._open()
+            if self.handshake:
+                # Wait until the MCU says it is ready (capped at init_delay)
+                log.info("mcu_handshake", max_wait=self.init_delay)
+                if self._wait_for_ready(self.init_delay):
+                    log.info("mcu_ready")
+                else:
+                    log.warning("mcu_handshake_timeout", action="continuing")
+            else:
+                # Give MCU time to reset after serial connection
+                log.info("mcu_init_wait", seconds=self.init_delay)
+                time.sleep(self.init_delay)
+
+                # Clear any garbage data in buffer
+                self.serial_conn.reset_input_buffer()
+                self.serial_conn.reset_output_buffer()
 
+            self.is_connected = True
             self.is_running = True
-            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread = threading.Thread(target=self._run, daemon=True, name="serial-tx")
             self.thread.start()
+            self.rx_thread = threading.Thread(target=self._rx_loop, daemon=True, name="serial-rx")
+            self.rx_thread.start()
             return True
-        except serial.SerialException as e:
-            print(f"✗ Serial connection failed: {e}")
+        except (serial.SerialException, OSError) as e:
+            log.error("serial_open_failed", port=self.port, error=e)
             return False
 
+    def _open(self):
+        self.serial_conn = self.transport_factory()
+        self._framer = LineFramer()
+
+    def _close(self):
+        try:
+            if self.serial_conn and self.serial_conn.is_open:
+                self.serial_conn.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def _wait_for_ready(self, max_wait: float, ping_now: bool = False) -> bool:
+        """
+        Wait for the MCU boot banner or a PING/PONG round trip
+
+        Protocol messages that arrive before the MCU is confirmed ready
+        (e.g. a UID_REQ from an early RFID tap) are kept in rx_queue instead
+        of being flushed. Partial or garbage lines from the reset are dropped.
+
+        Returns True if the MCU answered, False if max_wait ran out.
+        """
+        conn = self.serial_conn
+        original_timeout = conn.timeout
+        # Short reads so we can keep pinging while waiting
+        conn.timeout = MCU_PING_INTERVAL / 2
+
+        deadline = time.time() + max_wait
+        # First PING after one interval - after a reset the banner usually beats it.
+        # On reconnect the MCU has usually not reset, so ping straight away.
+        next_ping = time.time() + (0 if ping_now else MCU_PING_INTERVAL)
+        ready = False
+
+        try:
+            while not ready and time.time() < deadline:
+                if time.time() >= next_ping:
+                    conn.write(b"PING\n")
+                    conn.flush()
+                    next_ping = time.time() + MCU_PING_INTERVAL
+
+                chunk = conn.read(conn.in_waiting or 1)
+                received = time.monotonic()
+                metrics.SERIAL_RX_BYTES.inc(len(chunk))
+                for raw in self._framer.feed(chunk):
+                    metrics.SERIAL_RX_LINES.inc()
+                    line = raw.decode('utf-8', errors='ignore').strip()
+
+                    if line == READY_BANNER or line.startswith("PONG"):
+                        ready = True  # Keep going: later lines in this chunk are real messages
+                    elif PROTOCOL_LINE.match(line):
+                        self.rx_queue.put((line, received))
+                        if LOG_SERIAL_LINES:
+                            log.info("rx_early", line=line)
+            return ready
+        finally:
+            conn.timeout = original_timeout
+
     def stop(self):
         self.is_running = False
         if self.thread:
             self.thread.join(timeout=2.0)
-        if self.serial_conn and self.serial_conn.is_open:
-            self.serial_conn.close()
+        self._close()
+        if self.rx_thread:
+            self.rx_thread.join(timeout=2.0)
+        self.is_connected = False
 
     def _run(self):
-        """Background thread for serial communication with MCU-friendly delays"""
-        last_tx_time = 0
+        """Background thread: sends queued messages with MCU-friendly delays, reopens lost links"""
+        backoff = RECONNECT_MIN_DELAY
 
         while self.is_running:
+            if not self.is_connected:
+                if self._reconnect():
+                    backoff = RECONNECT_MIN_DELAY
+                else:
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, RECONNECT_MAX_DELAY)
+                continue
+
             # ==========================================
-            # RECEIVE FROM MCU
+            # SEND TO MCU (with generous delays)
             # ==========================================
-            if self.serial_conn.in_waiting > 0:
-                try:
-                    line = self.serial_conn.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        self.rx_queue.put(line)
-                        print(f"← RX: {line}")  # Debug: show received
-                except Exception as e:
-                    print(f"✗ RX Error: {e}")
+            try:
+                message = self.tx_queue.get(timeout=0.02)
+            except queue.Empty:
+                continue
+
+            conn = self.serial_conn
+            try:
+                self._transmit(message)
+            except (serial.SerialException, OSError) as e:
+                # Not sent - keep it for after the reconnect
+                self._requeue(message)
+                self._link_lost(conn, e)
+
+    def _rx_loop(self):
+        """Background thread: read whatever has arrived and queue complete lines"""
+        while self.is_running:
+            with self._conn_lock:
+                conn = self.serial_conn if self.is_connected else None
+            if conn is None:
+                time.sleep(0.01)  # Supervisor is reconnecting
+                continue
 
             # ==========================================
-            # SEND TO MCU (with generous delays)
+            # RECEIVE FROM MCU
             # ==========================================
             try:
-                message = self.tx_queue.get_nowait()
+                # Blocks up to conn.timeout for the first byte, then takes everything buffered
+                chunk = conn.read(conn.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                self._link_lost(conn, e)
+                continue
 
-                # Ensure minimum 200ms between messages
-                time_since_last_tx = time.time() - last_tx_time
-                if time_since_last_tx < 0.2:  # 200ms minimum gap
-                    time.sleep(0.2 - time_since_last_tx)
+            if chunk:
+                self._receive(chunk, time.monotonic())
 
-                # Send message with delays
-                print(f"→ TX: {message.strip()}")  # Debug: show sending
+    def _receive(self, chunk: bytes, received: float):
+        """Queue the complete lines in chunk, stamped with the time the chunk was read"""
+        metrics.SERIAL_RX_BYTES.inc(len(chunk))
+        for raw in self._framer.feed(chunk):
+            metrics.SERIAL_RX_LINES.inc()
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self.rx_queue.put((line, received))
+                if LOG_SERIAL_LINES:
+                    log.info("rx", sample=line.split('|', 1)[0], line=line)
 
-                # Add generous pre-send delay
-                time.sleep(0.05)  # 50ms before sending
+    def _link_lost(self, conn: Transport, error: Exception):
+        """Mark the link down (once per connection); the supervisor in _run reopens it"""
+        with self._conn_lock:
+            if not self.is_running or conn is not self.serial_conn or not self.is_connected:
+                return  # Shutting down, or a stale error from a connection we already replaced
+            self.is_connected = False
+        # USB unplugged / port vanished
+        log.error("serial_link_lost", port=self.port, error=error)
 
-                # Send the message
-                self.serial_conn.write(message.encode('utf-8'))
+    def _transmit(self, message: str):
+        """Write one message with the MCU pacing delays"""
+        pacing_start = time.perf_counter()
 
-                # CRITICAL: Flush to ensure data is sent immediately
-                self.serial_conn.flush()
+        # Ensure minimum 200ms between messages
+        time_since_last_tx = time.time() - self._last_tx_time
+        if time_since_last_tx < 0.2:  # 200ms minimum gap
+            time.sleep(0.2 - time_since_last_tx)
 
-                # Add generous post-send delay for MCU to process
-                time.sleep(0.15)  # 150ms after sending
+        # Send message with delays
+        if LOG_SERIAL_LINES:
+            log.info("tx", line=message.strip())
 
-                last_tx_time = time.time()
+        # Add generous pre-send delay
+        time.sleep(0.05)  # 50ms before sending
 
-            except queue.Empty:
-                pass
-            except Exception as e:
-                print(f"✗ TX Error: {e}")
+        # Send the message
+        data = message.encode('utf-8')
+        write_start = time.perf_counter()
+        self.serial_conn.write(data)
+
+        # CRITICAL: Flush to ensure data is sent immediately
+        self.serial_conn.flush()
+        write_time = time.perf_counter() - write_start
+        if self.on_transmit:
+            self.on_transmit(message, time.monotonic())
+
+        # Add generous post-send delay for MCU to process
+        time.sleep(0.15)  # 150ms after sending
+
+        self._last_tx_time = time.time()
+        metrics.SERIAL_TX_BYTES.inc(len(data))
+        metrics.SERIAL_TX_LINES.inc()
+        metrics.SERIAL_TX_PACING_WAIT.observe(time.perf_counter() - pacing_start - write_time)
 
-            # Slow loop to avoid CPU hogging
-            time.sleep(0.02)  # 20ms loop delay
+    def _requeue(self, message: str):
+        """Put a message back at the front of the TX queue"""
+        with self.tx_queue.mutex:
+            self.tx_queue.queue.appendleft(message)
+            self.tx_queue.not_empty.notify()
 
-    def get_message(self):
-        """Get received message from MCU (non-blocking)"""
+    def _reconnect(self) -> bool:
+        """Reopen the port and re-sync the MCU with the active session"""
+        self._close()
         try:
+            self._open()
+            self._wait_for_ready(RECONNECT_HANDSHAKE_TIMEOUT, ping_now=True)
+            if self.on_reconnect:
+                for frame in self._frames(self.on_reconnect()):
+                    self._transmit(frame)
+        except (serial.SerialException, OSError):
+            self._close()
+            return False
+
+        with self._conn_lock:
+            self.is_connected = True
+        metrics.SERIAL_RECONNECTS.inc()
+        log.info("serial_reconnected", port=self.port)
+        return True
+
+    def get_message(self, timeout: Optional[float] = None):
+        """Get received message from MCU (non-blocking, or wait up to timeout seconds)"""
+        timed = self.get_timed_message(timeout)
+        return timed[0] if timed else None
+
+    def get_timed_message(self, timeout: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """Like get_message, but returns (message, time.monotonic() when it was read from the port)"""
+        try:
+            if timeout:
+                return self.rx_queue.get(timeout=timeout)
             return self.rx_queue.get_nowait()
         except queue.Empty:
             return None
@@ -118,6 +329,63 @@ class SerialHandler:
 
         self.tx_queue.put(message)
 
+    def send_batch(self, messages: List[str]):
+        """
+        Queue a sequence of commands to go out together
+
+        With batching on they share one paced BATCH| frame (one inter-message
+        gap instead of one per command); otherwise, or for a single command,
+        they are sent one by one as send_message would.
+        """
+        for frame in self._frames(messages):
+            self.tx_queue.put(frame)
+
+    def _frames(self, messages: List[str]) -> List[str]:
+        """Lines to transmit for a command sequence"""
+        commands = [m.strip() for m in messages if m.strip()]
+        if not self.batching or len(commands) < 2 or any(';' in c for c in commands):
+            return [c + '\n' for c in commands]
+        frames = []
+        group: List[str] = []
+        size = 0
+        for command in commands:
+            # "BATCH|nnnn|" plus the commands and their separators
+            if group and size + len(command) + 1 > MCU_BATCH_MAX_BYTES - 12:
+                frames.append(self._batch_frame(group))
+                group, size = [], 0
+            group.append(command)
+            size += len(command) + 1
+        frames.append(self._batch_frame(group))
+        return frames
+
+    def _batch_frame(self, commands: List[str]) -> str:
+        if len(commands) == 1:
+            return commands[0] + '\n'
+        now = time.monotonic()
+        with self._batch_lock:
+            self._batch_id = self._batch_id % 9999 + 1
+            for stale in [i for i, (_, queued) in self._batches.items() if now - queued > BATCH_ACK_TIMEOUT]:
+                log.warning("batch_unacknowledged", batch=stale, commands=len(self._batches[stale][0]))
+                del self._batches[stale]
+            self._batches[self._batch_id] = (commands, now)
+            return f"BATCH|{self._batch_id}|{';'.join(commands)}\n"
+
+    def batch_acked(self, batch_id: int, results: str) -> Optional[List[Tuple[str, str]]]:
+        """
+        Match a BATCH_ACK to its batch: [(command, result), ...], or None if unknown
+
+        A result missing from the ack (frame cut short) is reported as "MISSING".
+        """
+        with self._batch_lock:
+            batch = self._batches.pop(batch_id, None)
+        if batch is None:
+            return None
+        commands, queued = batch
+        metrics.SERIAL_BATCH_SECONDS.observe(time.monotonic() - queued)
+        answers = results.split(';') if results else []
+        answers += ["MISSING"] * (len(commands) - len(answers))
+        return list(zip(commands, answers))
+
     def send_message_blocking(self, message: str, wait_time: float = 0.3):
         """
         Send message and wait (blocking)
@@ -131,7 +399,8 @@ class SerialHandler:
             message += '\n'
 
         try:
-            print(f"→ TX (blocking): {message.strip()}")
+            if LOG_SERIAL_LINES:
+                log.info("tx_blocking", line=message.strip())
 
             # Pre-send delay
             time.sleep(0.05)
@@ -144,4 +413,4 @@ class SerialHandler:
             time.sleep(wait_time)
 
         except Exception as e:
-            print(f"✗ TX Error (blocking): {e}")
+            log.error("tx_blocking_failed", error=e)
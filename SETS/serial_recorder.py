@@ -0,0 +1,346 @@
+# serial_recorder.py
+"""
+Capture raw serial traffic with host timestamps, and replay it without hardware
+
+Recording wraps the SerialHandler transport, so every byte read or written
+(handshake and reconnects included) is stored exactly as it crossed the link:
+
+    SERIAL_RECORD_FILE = 'captures/gym.srec'      # in config.py, then run main.py
+
+An existing capture is never overwritten unless SERIAL_RECORD_OVERWRITE is
+set; the new one goes next to it with the start time in its name
+(captures/gym-20240101-093000.srec).
+
+Replay feeds the recorded MCU->host bytes through a LoopbackLink into a real
+SerialHandler and handle_serial_message, at the recorded pace, N times faster
+or as fast as possible, and reports throughput and handler timings:
+
+    python serial_recorder.py info captures/gym.srec
+    python serial_recorder.py replay captures/gym.srec              # real time
+    python serial_recorder.py replay captures/gym.srec --speed 10   # 10x
+    python serial_recorder.py replay captures/gym.srec --speed 0    # flat out
+
+File format (little-endian):
+
+    header  <4sd   magic b'SRC1', start time (epoch seconds)
+    record  <BIH   direction, microseconds since the previous record, length
+            then `length` bytes
+"""
+import argparse
+import json
+import pathlib
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+from event_log import get_logger
+from serial_handler import LineFramer, SerialHandler
+from transport import Transport
+
+log = get_logger("recorder")
+
+MAGIC = b'SRC1'
+FILE_HEADER = struct.Struct('<4sd')
+RECORD = struct.Struct('<BIH')
+RX, TX, OPEN = 0, 1, 2          # MCU->host bytes, host->MCU bytes, port (re)opened
+DIRECTIONS = {RX: 'rx', TX: 'tx', OPEN: 'open'}
+MAX_DELTA_US = 0xFFFFFFFF       # Gaps longer than ~71 minutes are stored as this
+FLUSH_INTERVAL = 1.0            # Seconds; a crash loses at most this much of the capture
+
+class SerialRecorder:
+    """Appends timestamped link traffic to a capture file"""
+
+    def __init__(self, path, overwrite: bool = False):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if overwrite:
+            self._file = open(self.path, 'wb')
+        else:
+            try:
+                self._file = open(self.path, 'xb')
+            except FileExistsError:
+                # Keep the earlier capture; name this one after its start time
+                stamp = time.strftime('%Y%m%d-%H%M%S')
+                self.path = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+                self._file = open(self.path, 'xb')
+        self._file.write(FILE_HEADER.pack(MAGIC, time.time()))
+        self._last = time.monotonic()
+        self._last_flush = self._last
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def record(self, direction: int, data: bytes = b''):
+        with self._lock:
+            if self._file is None:
+                return
+            now = time.monotonic()
+            delta = min(int((now - self._last) * 1e6), MAX_DELTA_US)
+            self._last = now
+            # Chunks longer than a record can hold are split (delta 0 for the rest)
+            for start in range(0, max(len(data), 1), 0xFFFF):
+                piece = data[start:start + 0xFFFF]
+                self._file.write(RECORD.pack(direction, delta, len(piece)))
+                self._file.write(piece)
+                self.records += 1
+                delta = 0
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def wrap(self, factory: Callable[[], Transport]) -> Callable[[], Transport]:
+        """A transport_factory that records everything the links it opens carry"""
+        def open_recorded() -> Transport:
+            conn = factory()
+            self.record(OPEN)
+            return RecordingTransport(conn, self)
+        return open_recorded
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        log.info("capture_saved", file=str(self.path), records=self.records)
+
+class RecordingTransport(Transport):
+    """Passes everything through to the wrapped transport, recording reads and writes"""
+
+    def __init__(self, conn: Transport, recorder: SerialRecorder):
+        self.conn = conn
+        self.recorder = recorder
+
+    @property
+    def timeout(self):
+        return self.conn.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.conn.timeout = value
+
+    @property
+    def is_open(self) -> bool:
+        return self.conn.is_open
+
+    @property
+    def in_waiting(self) -> int:
+        return self.conn.in_waiting
+
+    def read(self, size: int = 1) -> bytes:
+        chunk = self.conn.read(size)
+        if chunk:
+            self.recorder.record(RX, chunk)
+        return chunk
+
+    def write(self, data: bytes) -> int:
+        written = self.conn.write(data)
+        self.recorder.record(TX, data)
+        return written
+
+    def flush(self):
+        self.conn.flush()
+
+    def reset_input_buffer(self):
+        self.conn.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        self.conn.reset_output_buffer()
+
+    def close(self):
+        self.conn.close()
+
+# ==========================================
+# READING
+# ==========================================
+
+class Record(NamedTuple):
+    time: float       # Seconds since the capture started
+    direction: int
+    data: bytes
+
+def read_capture(path) -> Iterator[Record]:
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"{path} is not a serial capture")
+        elapsed = 0.0
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            direction, delta_us, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return  # Recording was cut off mid-record
+            elapsed += delta_us / 1e6
+            yield Record(elapsed, direction, data)
+
+def rx_lines(path) -> Iterator[bytes]:
+    """Non-empty MCU->host lines, framed the way SerialHandler frames them"""
+    framer = LineFramer()
+    for record in read_capture(path):
+        if record.direction == OPEN:
+            framer = LineFramer()  # New connection: a partial line from the old one is lost
+        elif record.direction == RX:
+            for line in framer.feed(record.data):
+                line = line.strip()
+                if line:
+                    yield line
+
+def capture_info(path) -> Dict:
+    """Duration, bytes and line counts per direction and message type"""
+    with open(path, 'rb') as f:
+        started = FILE_HEADER.unpack(f.read(FILE_HEADER.size))[1]
+    totals = {name: 0 for name in DIRECTIONS.values()}
+    types: Dict[str, int] = {}
+    duration = 0.0
+    for record in read_capture(path):
+        duration = record.time
+        totals[DIRECTIONS.get(record.direction, 'open')] += len(record.data) if record.direction != OPEN else 1
+    for line in rx_lines(path):
+        name = line.split(b'|', 1)[0].decode('utf-8', errors='replace')
+        types[name] = types.get(name, 0) + 1
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'seconds': round(duration, 3),
+        'rx_bytes': totals['rx'],
+        'tx_bytes': totals['tx'],
+        'opens': totals['open'],
+        'rx_types': dict(sorted(types.items(), key=lambda item: -item[1])),
+    }
+
+# ==========================================
+# REPLAY
+# ==========================================
+
+def replay(path, speed: float = 1.0, data_dir: Optional[pathlib.Path] = None,
+           drain_timeout: float = 5.0) -> Dict:
+    """
+    Feed a capture's MCU->host bytes through SerialHandler and handle_serial_message
+
+    speed 1 keeps the recorded timing, N plays N times faster, 0 sends every
+    chunk as soon as the previous one is written. Workouts completed during
+    the replay are written to data_dir (a temp dir by default). Returns
+    throughput, handler timings and how far dispatch fell behind the feed.
+    """
+    import app as flask_app
+    import main
+    from bench import percentiles
+    from config import BAUD_RATE, TIMEOUT, RFID_USERS, RFID_USERS_FILE
+    from database import UserDatabase
+    from rep_timeline import TimelineStore
+    from rfid_auth import RFIDAuth
+    from transport import LoopbackLink
+    from user_directory import UserDirectory
+
+    records = [r for r in read_capture(path) if r.direction == RX]
+    expected = sum(1 for _ in rx_lines(path))
+
+    tmp = None
+    if data_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        data_dir = pathlib.Path(tmp.name)
+
+    link = LoopbackLink()
+    device = link.open_device()
+    handler = SerialHandler('replay', BAUD_RATE, TIMEOUT, init_delay=0, handshake=False,
+                            transport_factory=link.open_host)
+    main.serial_handler = flask_app.serial_handler = handler
+    main.rfid_auth = flask_app.rfid_auth = RFIDAuth(UserDirectory(RFID_USERS_FILE, RFID_USERS))
+    main.database = flask_app.database = UserDatabase(data_dir)
+    flask_app.timelines = TimelineStore(data_dir)
+    handler.start()
+
+    stop = threading.Event()
+    handled = [0]
+    last_handled = [0.0]
+    per_type: Dict[str, List[float]] = {}
+    max_depth = [0]
+
+    def dispatch_loop():
+        while not stop.is_set():
+            max_depth[0] = max(max_depth[0], handler.rx_queue.qsize())
+            timed = handler.get_timed_message(timeout=0.05)
+            if timed:
+                message, received = timed
+                t0 = time.perf_counter()
+                main.handle_serial_message(message, received)
+                per_type.setdefault(main.message_type(message), []).append(time.perf_counter() - t0)
+                handled[0] += 1
+                last_handled[0] = time.perf_counter()
+
+    def drain_loop():
+        # Whatever the handler sends to the "MCU" is read and dropped
+        while not stop.is_set():
+            device.read(4096)
+
+    threads = [threading.Thread(target=dispatch_loop, daemon=True, name="replay-dispatch"),
+               threading.Thread(target=drain_loop, daemon=True, name="replay-drain")]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for record in records:
+        if speed > 0:
+            delay = start + record.time / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        device.write(record.data)
+    fed = time.perf_counter() - start
+
+    # Wait for dispatch to catch up (or give up after drain_timeout without progress)
+    last_count, last_progress = -1, time.perf_counter()
+    while handled[0] < expected and time.perf_counter() - last_progress < drain_timeout:
+        if handled[0] != last_count:
+            last_count, last_progress = handled[0], time.perf_counter()
+        time.sleep(0.01)
+    finished = max(last_handled[0], start + fed) - start
+
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=1.0)
+    handler.stop()
+    if tmp:
+        tmp.cleanup()
+
+    return {
+        'capture': str(path),
+        'speed': speed,
+        'lines_expected': expected,
+        'lines_handled': handled[0],
+        'feed_seconds': round(fed, 3),
+        'seconds': round(finished, 3),
+        'dispatch_lag_seconds': round(finished - fed, 3),
+        'lines_per_sec': round(handled[0] / finished) if finished else None,
+        'max_rx_queue_depth': max_depth[0],
+        'per_type': {t: percentiles(s) for t, s in sorted(per_type.items())},
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Inspect or replay serial captures")
+    sub = parser.add_subparsers(dest='command', required=True)
+    info = sub.add_parser('info', help="Summarize a capture")
+    info.add_argument('capture')
+    play = sub.add_parser('replay', help="Replay a capture through the protocol stack")
+    play.add_argument('capture')
+    play.add_argument('--speed', type=float, default=1.0, help="Time scale, 0 = as fast as possible")
+    play.add_argument('--data-dir', help="Keep workouts saved during the replay here (default: temp dir)")
+    play.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(json.dumps(capture_info(args.capture), indent=2))
+        return
+
+    import event_log
+    event_log.setup()
+    event_log.set_level('ERROR')  # Keep per-message logging out of the timings
+    result = replay(args.capture, args.speed, pathlib.Path(args.data_dir) if args.data_dir else None)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+# sessions.py
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from config import SESSION_IDLE_TIMEOUT
+from event_log import get_logger
+
+log = get_logger("sessions")
+
+MAX_BROWSERS = 10000  # Browser -> station bindings kept (least recently seen dropped first)
+
+class UserSession:
+    """One logged-in user at one station"""
+    __slots__ = ('token', 'username', 'station', 'created', 'last_seen')
+
+    def __init__(self, username: str, station: str, now: float):
+        self.token = secrets.token_hex(16)
+        self.username = username
+        self.station = station
+        self.created = now
+        self.last_seen = now
+
+class SessionStore:
+    """
+    Logged-in users per station, and which station each browser is looking at
+
+    An RFID tap logs a user in at the station whose reader it came from;
+    every browser bound to that station (kiosk screen, phone opened with
+    ?station=...) then sees that user. Sessions with no activity for
+    idle_timeout seconds are dropped on the next lookup. All lookups are
+    dict hits, so the per-request cost does not grow with the number of
+    stations or browsers.
+    """
+
+    def __init__(self, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._stations: Dict[str, UserSession] = {}
+        self._browsers: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.on_expire: Optional[Callable[[UserSession], None]] = None
+
+    def login(self, station: str, username: str) -> UserSession:
+        """Start a session at station, replacing whoever was logged in there"""
+        user_session = UserSession(username, station, self.clock())
+        with self._lock:
+            self._stations[station] = user_session
+        return user_session
+
+    def logout(self, station: str) -> Optional[UserSession]:
+        with self._lock:
+            return self._stations.pop(station, None)
+
+    def get(self, station: str, touch: bool = True) -> Optional[UserSession]:
+        """Live session at station (touch=True counts the lookup as activity)"""
+        now = self.clock()
+        with self._lock:
+            user_session = self._stations.get(station)
+            if user_session is None:
+                return None
+            if now - user_session.last_seen > self.idle_timeout:
+                del self._stations[station]
+                expired = user_session
+            else:
+                if touch:
+                    user_session.last_seen = now
+                return user_session
+        log.info("session_expired", user=expired.username, station=station,
+                 idle_s=round(now - expired.last_seen))
+        if self.on_expire:
+            self.on_expire(expired)
+        return None
+
+    def user(self, station: str, touch: bool = True) -> Optional[str]:
+        user_session = self.get(station, touch)
+        return user_session.username if user_session else None
+
+    def active(self) -> Dict[str, str]:
+        """{station: username} for all live sessions (no touch)"""
+        with self._lock:
+            stations = list(self._stations)
+        users = {}
+        for station in stations:
+            username = self.user(station, touch=False)
+            if username:
+                users[station] = username
+        return users
+
+    def bind_browser(self, browser_id: str, station: str):
+        with self._lock:
+            self._browsers[browser_id] = station
+            self._browsers.move_to_end(browser_id)
+            if len(self._browsers) > MAX_BROWSERS:
+                self._browsers.popitem(last=False)
+
+    def station_for(self, browser_id: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            station = self._browsers.get(browser_id)
+            if station is None:
+                return default
+            self._browsers.move_to_end(browser_id)
+            return station
@@ -0,0 +1,311 @@
+# sync_agent.py
+"""
+Store-and-forward sync of completed workouts to a central service
+
+A background thread picks up rows appended to the *_workouts.csv files
+since the last successful upload and POSTs them as gzip-compressed NDJSON
+batches to SYNC_URL. Per-file byte offsets are checkpointed to
+user_data/sync_state.json only after the server has accepted a batch, so a
+crash or outage never loses a workout; it is sent again later instead.
+Each checkpoint also keeps the file's inode and a hash of the bytes before
+the offset, so a file rewritten in the meantime (importer.py) is read again
+from the start rather than resumed mid-row.
+Re-sends are harmless: every row carries an id derived from the station,
+user and the row's normalized fields, and every batch an Idempotency-Key,
+so the server stores each workout once (see sync_server.py).
+
+Failed uploads are retried with exponential backoff (capped at
+SYNC_RETRY_MAX) and uploads are held to SYNC_MAX_BYTES_PER_SEC by a token
+bucket. A batch the server rejects (4xx other than auth and rate limiting)
+would fail the same way forever, so it is written to user_data/sync_dead_letter/
+and skipped. The serial side only calls notify() when a workout is saved.
+"""
+import csv
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import pathlib
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+import metrics
+from config import (SYNC_URL, SYNC_TOKEN, SYNC_INTERVAL, SYNC_BATCH_ROWS, SYNC_MAX_BYTES_PER_SEC,
+                    SYNC_RETRY_MAX, SYNC_TIMEOUT, STATION_ID)
+from importer import detect_schema
+from event_log import get_logger
+
+log = get_logger("sync")
+
+FILE_SUFFIX = "_workouts.csv"
+STATE_FILE = "sync_state.json"
+DEAD_LETTER_DIR = "sync_dead_letter"
+READ_CHUNK = 1 << 20           # Bytes read from a history file per pass
+TAIL_BYTES = 64                # Bytes before a checkpoint hashed to notice rewritten files
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+AUTH_STATUS = {401, 403}       # Station misconfigured, not the batch: keep it and retry
+
+class TokenBucket:
+    """Average rate limit in bytes per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: int) -> float:
+        """Take `amount` tokens; returns how long to wait before using them"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+def row_id(station: str, user: str, fields: List) -> str:
+    """
+    Stable id of one workout, from its normalized fields
+
+    The same workout gets the same id whichever schema the file was in, so
+    a history file converted by importer.py is not stored twice.
+    """
+    key = '|'.join([station, user] + [str(field) for field in fields])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def _tail_hash(f, offset: int) -> str:
+    """Hash of the TAIL_BYTES before offset"""
+    start = max(0, offset - TAIL_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()[:16]
+
+class SyncAgent:
+    def __init__(self, data_dir: pathlib.Path, url: Optional[str] = SYNC_URL, station: str = STATION_ID,
+                 token: Optional[str] = SYNC_TOKEN, interval: float = SYNC_INTERVAL,
+                 batch_rows: int = SYNC_BATCH_ROWS, max_bytes_per_sec: float = SYNC_MAX_BYTES_PER_SEC):
+        self.data_dir = pathlib.Path(data_dir)
+        self.url = url
+        self.station = station
+        self.token = token
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.bucket = TokenBucket(max_bytes_per_sec) if max_bytes_per_sec else None
+        self.state_path = self.data_dir / STATE_FILE
+        self.files: Dict[str, Dict] = self._load_state()  # name -> {'offset', 'inode', 'tail'}
+        self.failures = 0
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ==========================================
+    # CHECKPOINT
+    # ==========================================
+
+    def _load_state(self) -> Dict[str, Dict]:
+        try:
+            state = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning("sync_state_unreadable", file=str(self.state_path), error=e)
+            return {}
+        if 'offsets' in state:
+            # Older checkpoints kept only the offset; the rewrite checks start with the next batch
+            return {name: {'offset': offset} for name, offset in state['offsets'].items()}
+        return state.get('files', {})
+
+    def _save_state(self):
+        tmp = self.state_path.with_name(STATE_FILE + '.tmp')
+        tmp.write_text(json.dumps({'files': self.files}))
+        os.replace(tmp, self.state_path)  # A crash leaves the old checkpoint or the new one
+
+    # ==========================================
+    # BATCHING
+    # ==========================================
+
+    def _read_new(self, path: pathlib.Path, limit: int) -> Tuple[List[Dict], Optional[Dict]]:
+        """Up to `limit` rows appended since the checkpoint, and the checkpoint after them (None if unchanged)"""
+        name = path.name
+        user = name[:-len(FILE_SUFFIX)]
+        saved = self.files.get(name, {})
+        offset = saved.get('offset', 0)
+        stat = path.stat()
+        size = stat.st_size
+
+        rows = []
+        with open(path, 'rb') as f:
+            if offset and (size < offset
+                           or saved.get('inode', stat.st_ino) != stat.st_ino
+                           or saved.get('tail', '') not in ('', _tail_hash(f, offset))):
+                # Rewritten (e.g. converted by importer.py): start over; row ids are
+                # schema-independent, so the server dedups what it already has
+                log.warning("sync_file_rewritten", file=name, offset=offset, size=size)
+                offset = 0
+            elif size == offset:
+                return [], None
+            f.seek(0)
+            header = f.readline()
+            schema = detect_schema(next(csv.reader([header.decode('utf-8', errors='replace')]), []))
+            if schema is None:
+                log.warning("sync_unknown_schema", file=name)
+                return [], None
+            offset = max(offset, len(header))
+            f.seek(offset)
+            data = f.read(min(size - offset, READ_CHUNK))
+            pos = 0
+            while len(rows) < limit:
+                end = data.find(b'\n', pos)
+                if end < 0:
+                    break  # Partial row still being written, or the rest of the chunk
+                line = data[pos:end].decode('utf-8', errors='replace').rstrip('\r')
+                pos = end + 1
+                if not line.strip():
+                    continue
+                try:
+                    fields = schema.convert(next(csv.reader([line])))
+                except (ValueError, IndexError) as e:
+                    log.warning("sync_row_skipped", file=name, error=e)
+                    continue
+                rows.append(self._row(user, fields))
+            checkpoint = {'offset': offset + pos, 'inode': stat.st_ino, 'tail': _tail_hash(f, offset + pos)}
+        return rows, (checkpoint if checkpoint != saved else None)
+
+    def _row(self, user: str, fields: List) -> Dict:
+        timestamp, exercise, reps, sets, duration, valid = fields
+        return {
+            'id': row_id(self.station, user, fields),
+            'station': self.station,
+            'user': user,
+            'timestamp': timestamp,
+            'exercise': exercise,
+            'reps': reps,
+            'sets': sets,
+            'duration_min': float(duration),
+            'valid_reps': valid,
+        }
+
+    def next_batch(self) -> Tuple[List[Dict], Dict[str, Dict]]:
+        """Rows not yet uploaded (at most batch_rows) and the checkpoints to save once they are"""
+        rows: List[Dict] = []
+        checkpoints: Dict[str, Dict] = {}
+        for path in sorted(self.data_dir.glob(f"*{FILE_SUFFIX}")):
+            if len(rows) >= self.batch_rows:
+                break
+            new_rows, checkpoint = self._read_new(path, self.batch_rows - len(rows))
+            if checkpoint:
+                checkpoints[path.name] = checkpoint
+            rows.extend(new_rows)
+        return rows, checkpoints
+
+    # ==========================================
+    # UPLOAD
+    # ==========================================
+
+    def _post(self, body: bytes, key: str) -> Dict:
+        headers = {
+            'Content-Type': 'application/x-ndjson',
+            'Content-Encoding': 'gzip',
+            'Idempotency-Key': key,
+            'X-Station': self.station,
+        }
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        with urllib.request.urlopen(request, timeout=SYNC_TIMEOUT) as response:
+            return json.loads(response.read() or b'{}')
+
+    def _dead_letter(self, key: str, body: bytes, error: urllib.error.HTTPError, rows: int):
+        """Keep a batch the server refused, so it can be inspected and re-sent by hand"""
+        folder = self.data_dir / DEAD_LETTER_DIR
+        folder.mkdir(exist_ok=True)
+        path = folder / f"{time.strftime('%Y%m%d-%H%M%S')}-{key[:12]}.ndjson.gz"
+        path.write_bytes(body)
+        try:
+            detail = error.read(200).decode('utf-8', errors='replace')
+        except OSError:
+            detail = ''
+        metrics.SYNC_ERRORS.inc()
+        metrics.SYNC_DEAD_LETTER_ROWS.inc(rows)
+        log.error("sync_batch_rejected", status=error.code, rows=rows, file=str(path), detail=detail)
+
+    def sync_once(self) -> int:
+        """Upload one batch; returns rows handled (0 if nothing was new). Raises on failure."""
+        rows, checkpoints = self.next_batch()
+        if not rows:
+            if checkpoints:
+                # Only blank or unreadable lines were new
+                self.files.update(checkpoints)
+                self._save_state()
+            return 0
+        payload = ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+        body = gzip.compress(payload)
+        key = hashlib.sha1(''.join(row['id'] for row in rows).encode('ascii')).hexdigest()
+        if self.bucket:
+            wait = self.bucket.reserve(len(body))
+            if wait and self._stop.wait(wait):
+                return 0
+        try:
+            result = self._post(body, key)
+        except urllib.error.HTTPError as e:
+            if e.code in RETRYABLE_STATUS or e.code in AUTH_STATUS or not 400 <= e.code < 500:
+                raise
+            # Rejected as such: sending it again would fail the same way and block the rest
+            self._dead_letter(key, body, e, len(rows))
+            self.files.update(checkpoints)
+            self._save_state()
+            return len(rows)
+        self.files.update(checkpoints)
+        self._save_state()
+        metrics.SYNC_ROWS.inc(len(rows))
+        metrics.SYNC_BYTES.inc(len(body))
+        log.info("sync_batch_sent", rows=len(rows), bytes=len(body), raw_bytes=len(payload),
+                 stored=result.get('stored'), duplicates=result.get('duplicates'))
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.sync_once() >= self.batch_rows and not self._stop.is_set():
+                    pass  # Backlog: keep going without waiting for the interval
+                self.failures = 0
+                self.last_success = time.time()
+                delay = self.interval
+            except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+                status = getattr(e, 'code', None)
+                self.failures += 1
+                self.last_error = f"{status} {e}" if status else str(e)
+                metrics.SYNC_ERRORS.inc()
+                # Exponential backoff with jitter; an auth failure (401/403) waits the longest
+                delay = SYNC_RETRY_MAX if status and status not in RETRYABLE_STATUS else min(
+                    SYNC_RETRY_MAX, self.interval * 2 ** (self.failures - 1)) * random.uniform(0.5, 1.0)
+                log.warning("sync_failed", error=e, failures=self.failures, retry_in=f"{delay:.0f}s")
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def notify(self):
+        """A workout was saved: upload soon instead of at the next interval"""
+        if self.failures == 0:
+            self._wake.set()
+
+    def status(self) -> Dict:
+        return {'url': self.url, 'failures': self.failures, 'last_error': self.last_error,
+                'last_success': self.last_success,
+                'files': {name: checkpoint['offset'] for name, checkpoint in self.files.items()}}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="sync-agent")
+            self._thread.start()
+            log.info("sync_started", url=self.url, station=self.station)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=SYNC_TIMEOUT)
+            self._thread = None
@@ -0,0 +1,127 @@
+# sync_server.py
+"""
+Stand-in central aggregation service for sync_agent.py
+
+Accepts gzip NDJSON batches on POST /ingest and stores the rows in SQLite.
+Rows are keyed by their id, so a batch sent twice (or overlapping an earlier
+one) stores nothing new; a repeated Idempotency-Key gets the first answer
+back without touching the database.
+
+    python sync_server.py --port 5050 --db central.db
+    python sync_server.py --fail-rate 0.3        # answer 503 to 30% of batches (retry testing)
+
+GET /stats returns row counts per station and user.
+"""
+import argparse
+import gzip
+import json
+import random
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workouts (
+    id TEXT PRIMARY KEY,
+    station TEXT, user TEXT, timestamp TEXT, exercise TEXT,
+    reps INTEGER, sets INTEGER, duration_min REAL, valid_reps INTEGER
+);
+CREATE TABLE IF NOT EXISTS batches (
+    key TEXT PRIMARY KEY,
+    response TEXT
+);
+"""
+COLUMNS = ('id', 'station', 'user', 'timestamp', 'exercise', 'reps', 'sets', 'duration_min', 'valid_reps')
+MAX_BODY = 16 << 20
+
+class WorkoutStore:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def ingest(self, key: Optional[str], rows) -> Dict:
+        with self.lock, self.conn:
+            if key:
+                seen = self.conn.execute("SELECT response FROM batches WHERE key = ?", (key,)).fetchone()
+                if seen:
+                    return dict(json.loads(seen[0]), replayed=True)
+            before = self.conn.total_changes
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO workouts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                ([row.get(c) for c in COLUMNS] for row in rows))
+            stored = self.conn.total_changes - before
+            result = {'received': len(rows), 'stored': stored, 'duplicates': len(rows) - stored}
+            if key:
+                self.conn.execute("INSERT INTO batches (key, response) VALUES (?, ?)", (key, json.dumps(result)))
+            return result
+
+    def stats(self) -> Dict:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT station, user, COUNT(*) FROM workouts GROUP BY station, user").fetchall()
+        return {'total': sum(r[2] for r in rows),
+                'by_station': [{'station': s, 'user': u, 'workouts': n} for s, u, n in rows]}
+
+def make_handler(store: WorkoutStore, token: Optional[str] = None, fail_rate: float = 0.0):
+    class IngestHandler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: Dict):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._reply(200, store.stats())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/ingest':
+                return self._reply(404, {'error': 'not found'})
+            if token and self.headers.get('Authorization') != f"Bearer {token}":
+                return self._reply(401, {'error': 'bad token'})
+            length = int(self.headers.get('Content-Length', 0))
+            if length > MAX_BODY:
+                return self._reply(413, {'error': 'batch too large'})
+            body = self.rfile.read(length)
+            if fail_rate and random.random() < fail_rate:
+                return self._reply(503, {'error': 'simulated outage'})
+            try:
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                rows = [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+            except (OSError, ValueError) as e:
+                return self._reply(400, {'error': str(e)})
+            if any(not isinstance(row, dict) or not row.get('id') for row in rows):
+                return self._reply(400, {'error': 'every row needs an id'})
+            self._reply(200, store.ingest(self.headers.get('Idempotency-Key'), rows))
+
+        def log_message(self, fmt, *args):
+            pass  # One line per batch would drown the output during load tests
+
+    return IngestHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in central service for station workout sync")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--db', default='central.db')
+    parser.add_argument('--token', help="Require Authorization: Bearer <token>")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of batches answered with 503")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(WorkoutStore(args.db), args.token, args.fail_rate))
+    print(f"Sync server on http://{args.host}:{args.port}/ingest, storing to {args.db}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# transport.py
+import threading
+import time
+import serial
+from typing import Optional
+
+class Transport:
+    """
+    What SerialHandler needs from a link to the MCU
+
+    This is the subset of pyserial's Serial API the handler uses, so a real
+    serial.Serial is a Transport as-is. Link failures must raise
+    serial.SerialException (or OSError), which triggers the reconnect logic.
+    """
+    timeout: Optional[float]
+    is_open: bool
+
+    @property
+    def in_waiting(self) -> int:
+        raise NotImplementedError
+
+    def read(self, size: int = 1) -> bytes:
+        """Read up to size bytes, waiting at most timeout seconds for the first one"""
+        raise NotImplementedError
+
+    def write(self, data: bytes) -> int:
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        raise NotImplementedError
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        raise NotImplementedError
+
+def open_serial(port: str, baudrate: int, timeout: float) -> Transport:
+    """The default transport: a real serial port"""
+    return serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        timeout=timeout,
+        write_timeout=2.0  # 2 second write timeout
+    )
+
+class _Pipe:
+    """One direction of an in-memory link"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.cond = threading.Condition()
+
+    def put(self, data: bytes):
+        with self.cond:
+            self.data.extend(data)
+            self.cond.notify_all()
+
+    def take(self, size: int, timeout: Optional[float], alive) -> bytes:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while not self.data and alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            chunk = bytes(self.data[:size])
+            del self.data[:size]
+            return chunk
+
+    def clear(self):
+        with self.cond:
+            self.data.clear()
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+class LoopbackTransport(Transport):
+    """One end of a LoopbackLink"""
+
+    def __init__(self, link: 'LoopbackLink', rx: _Pipe, tx: _Pipe, timeout: Optional[float]):
+        self.link = link
+        self.rx = rx
+        self.tx = tx
+        self.timeout = timeout
+        self.is_open = True
+
+    def _check(self):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        if not self.link.connected:
+            raise serial.SerialException("loopback link unplugged")
+
+    @property
+    def in_waiting(self) -> int:
+        self._check()
+        return len(self.rx.data)
+
+    def read(self, size: int = 1) -> bytes:
+        self._check()
+        chunk = self.rx.take(size, self.timeout, lambda: self.is_open and self.link.connected)
+        if not chunk:
+            self._check()
+        return chunk
+
+    def write(self, data: bytes) -> int:
+        self._check()
+        self.tx.put(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._check()
+        self.rx.clear()
+
+    def close(self):
+        self.is_open = False
+        self.rx.wake()
+
+class LoopbackLink:
+    """
+    In-memory replacement for a USB serial cable
+
+    open_host() is a SerialHandler transport_factory, open_device() is the end
+    a VirtualMCU talks to. unplug()/plug() simulate the cable being pulled.
+    """
+
+    def __init__(self):
+        self.to_device = _Pipe()
+        self.to_host = _Pipe()
+        self.connected = True
+        self.device = LoopbackTransport(self, self.to_device, self.to_host, timeout=0.1)
+
+    def open_host(self, timeout: float = 0.5) -> LoopbackTransport:
+        if not self.connected:
+            raise serial.SerialException("loopback link unplugged")
+        return LoopbackTransport(self, self.to_host, self.to_device, timeout)
+
+    def open_device(self) -> LoopbackTransport:
+        return self.device
+
+    def unplug(self):
+        self.connected = False
+        self.to_host.wake()
+        self.to_device.wake()
+
+    def plug(self):
+        self.to_host.clear()
+        self.to_device.clear()
+        self.connected = True
@@ -0,0 +1,132 @@
+# user_directory.py
+import csv
+import pathlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import RFID_USERS_FILE, RFID_RELOAD_INTERVAL
+from event_log import get_logger
+
+log = get_logger("users")
+
+UID_LENGTH = 8  # Hex chars compared: 4-byte MIFARE UIDs, as the MCU has always sent them
+
+def normalize_uid(uid: str) -> str:
+    """'7d 13 37 21' / '7D:13:37:21' -> '7D133721'"""
+    return ''.join(c for c in uid if c.isalnum()).upper()[:UID_LENGTH]
+
+def load_users(path: pathlib.Path) -> Dict[str, str]:
+    """
+    Read a user file into {normalized_uid: username}
+
+    CSV: header row with uid,username columns. SQLite (.db/.sqlite): a users
+    table with uid and username columns.
+    """
+    if path.suffix in ('.db', '.sqlite', '.sqlite3'):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT uid, username FROM users").fetchall()
+        finally:
+            conn.close()
+    else:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {'uid', 'username'} <= set(reader.fieldnames):
+                raise ValueError(f"expected uid,username header, got {reader.fieldnames}")
+            rows = [(row['uid'], row['username']) for row in reader]
+
+    users = {}
+    for uid, username in rows:
+        if uid and username:
+            users[normalize_uid(uid)] = username.strip()
+    return users
+
+class UserDirectory:
+    """
+    RFID UID -> username, loaded from RFID_USERS_FILE
+
+    users seeds the index (config.RFID_USERS) and stays in use if the file
+    cannot be read at startup. Lookups are a dict hit on the normalized UID,
+    plus an LRU of raw tap strings so repeat taps skip normalization. A
+    watcher thread reloads the file when its mtime changes; the new index is
+    swapped in whole, so a tap never waits on (or sees half of) a reload.
+    """
+
+    def __init__(self, path=RFID_USERS_FILE, users: Optional[Dict[str, str]] = None,
+                 reload_interval: float = RFID_RELOAD_INTERVAL, recent_size: int = 256):
+        self.path = pathlib.Path(path) if path else None
+        self.reload_interval = reload_interval
+        self.recent_size = recent_size
+        self._index: Dict[str, str] = {normalize_uid(uid): name for uid, name in (users or {}).items()}
+        self._recent: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._recent_lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self.path:
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def lookup(self, uid: str) -> Optional[str]:
+        """Username for a UID as the MCU sends it, or None"""
+        with self._recent_lock:
+            if uid in self._recent:
+                self._recent.move_to_end(uid)
+                return self._recent[uid]
+        index = self._index
+        username = index.get(normalize_uid(uid))
+        with self._recent_lock:
+            if index is not self._index:
+                return username  # Reloaded meanwhile; do not cache a stale answer
+            self._recent[uid] = username
+            if len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+        return username
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return None
+        # SQLite in WAL mode commits into the -wal file first
+        wal = self.path.with_name(self.path.name + '-wal')
+        if wal.exists():
+            mtime = max(mtime, wal.stat().st_mtime)
+        return mtime
+
+    def reload(self) -> bool:
+        """Re-read the file; on error keep serving the previous index"""
+        # Remember the mtime even on failure, so a bad file is reported once, not every interval
+        self._mtime = self._file_mtime()
+        try:
+            index = load_users(self.path)
+        except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+            log.warning("user_file_unreadable", path=self.path, error=e)
+            return False
+        with self._recent_lock:
+            self._index = index
+            self._recent.clear()
+        log.info("users_loaded", path=self.path, users=len(index))
+        return True
+
+    def start(self):
+        """Watch the file for changes (no-op for dict-only directories)"""
+        if self.path is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="user-directory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._mtime:
+                self.reload()
@@ -0,0 +1,379 @@
+# virtual_mcu.py
+"""
+Virtual SmartDumbbell MCU for testing without hardware
+
+Speaks the protocol from MCU_COMMUNICATION_GUIDE.md over either an in-process
+LoopbackLink or a pseudo-terminal (so the real pyserial path is exercised).
+
+    # In-process (see SERIAL_TRANSPORT = 'virtual' in config.py)
+    link = LoopbackLink()
+    mcu = VirtualMCU(link.open_device())
+    handler = SerialHandler('virtual', BAUD_RATE, TIMEOUT, transport_factory=link.open_host)
+
+    # Separate process on a pty; point SERIAL_PORT at the printed path
+    python virtual_mcu.py --script workout.json --speed 4
+"""
+import argparse
+import json
+import os
+import random
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import serial
+from exercises import CATALOG
+
+# Default script: tap, configure on the OLED, one short workout
+DEMO_SCRIPT = [
+    {"do": "wait", "seconds": 1.0},
+    {"do": "tap", "uid": "7D 13 37 21"},
+    {"do": "wait", "seconds": 1.0},
+    {"do": "configure", "exercise": 0, "reps": 5, "sets": 2},
+    {"do": "workout", "reps": 5, "sets": 2, "rep_interval": 1.5, "rest": 3.0,
+     "jitter": 0.2, "imu_rate": 20},
+]
+
+class PtyPort:
+    """Device end of a pseudo-terminal; the host opens .port with pyserial"""
+
+    def __init__(self, timeout: float = 0.1):
+        import tty
+        self.master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)  # No echo, no CR/LF translation
+        self.port = os.ttyname(slave_fd)
+        self._slave_fd = slave_fd  # Keep open so the pty survives host reconnects
+        self.timeout = timeout
+
+    def read(self, size: int = 1) -> bytes:
+        ready, _, _ = select.select([self.master_fd], [], [], self.timeout)
+        if not ready:
+            return b''
+        try:
+            return os.read(self.master_fd, max(size, 4096))
+        except OSError:
+            return b''
+
+    def write(self, data: bytes) -> int:
+        return os.write(self.master_fd, data)
+
+    def close(self):
+        os.close(self.master_fd)
+        os.close(self._slave_fd)
+
+class VirtualMCU:
+    """
+    Scriptable simulated MCU
+
+    Answers host commands (PING, USER_OK/USER_FAIL/USER_LOGOUT, WORKOUT_START, WORKOUT_SYNC,
+    WORKOUT_CANCEL, WEB_*, and BATCH frames of them) and emits MCU messages from scripted steps. Time is
+    virtual: MCU timestamps follow the script, and speed scales how fast it
+    plays back in real time (speed=0 sends as fast as possible).
+    """
+
+    def __init__(self, port, speed: float = 1.0, boot_delay: float = 0.0,
+                 answer_ping: bool = True, seed: Optional[int] = None,
+                 auto_workout: Optional[Dict] = None):
+        self.port = port
+        self.speed = speed
+        self.boot_delay = boot_delay
+        self.answer_ping = answer_ping
+        # run_workout() arguments used when the web frontend sends WORKOUT_START
+        # (None = only record the command)
+        self.auto_workout = auto_workout
+        self.random = random.Random(seed)
+
+        self.is_running = False
+        self.thread = None
+        self.received: List[str] = []   # Every line the host sent (and each command of a BATCH), for assertions
+        self.sent_count = 0
+        self.user: Optional[str] = None
+        self.selection: Dict[str, str] = {}
+        self.workout: Optional[Dict[str, int]] = None
+        self._cancel = threading.Event()    # WORKOUT_CANCEL from the host
+        self._stopped = threading.Event()   # stop() called
+        self._write_lock = threading.Lock()
+
+        # Virtual clock (ms) and the real time it was anchored at
+        self._start = time.perf_counter()
+        self._virtual_ms = 0.0
+
+        # Optional hook: called with each host line after built-in handling
+        self.on_host_message: Optional[Callable[[str], None]] = None
+
+    # ==========================================
+    # LIFECYCLE
+    # ==========================================
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._rx_loop, daemon=True, name="virtual-mcu")
+        self.thread.start()
+        self.boot()
+
+    def stop(self):
+        self.is_running = False
+        self._stopped.set()
+        self._cancel.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+    def boot(self):
+        """Simulate setup(): optional reset delay, then the MCU_READY banner"""
+        if self.boot_delay:
+            time.sleep(self.boot_delay)
+        self._resync_clock()
+        self.send("MCU_READY")
+
+    # ==========================================
+    # CLOCK
+    # ==========================================
+
+    def millis(self) -> int:
+        if self.speed > 0:
+            # Idle time passes on a real MCU too, so never fall behind the scaled
+            # real clock (keeps PONG timestamps usable for the host's clock sync)
+            elapsed_ms = (time.perf_counter() - self._start) * 1000 * self.speed
+            self._virtual_ms = max(self._virtual_ms, elapsed_ms)
+        return int(self._virtual_ms)
+
+    def _resync_clock(self):
+        self._start = time.perf_counter() - self._virtual_ms / 1000 / (self.speed or 1)
+
+    def advance(self, seconds: float):
+        """Move the virtual clock forward, sleeping the scaled real time"""
+        self._virtual_ms += seconds * 1000
+        if self.speed <= 0:
+            return
+        target = self._start + self._virtual_ms / 1000 / self.speed
+        delay = target - time.perf_counter()
+        if delay > 0.001:  # Below 1ms just send and let the backlog catch up
+            self._stopped.wait(delay)
+
+    # ==========================================
+    # HOST -> MCU
+    # ==========================================
+
+    def _rx_loop(self):
+        buffer = b''
+        while self.is_running:
+            try:
+                chunk = self.port.read(4096)
+            except (serial.SerialException, OSError):
+                time.sleep(0.01)  # Cable pulled
+                continue
+            if not chunk:
+                continue
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            for raw in lines:
+                line = raw.decode('utf-8', errors='ignore').strip()
+                if line:
+                    self._handle_host(line)
+
+    def _handle_host(self, line: str):
+        self.received.append(line)
+        if line.startswith("BATCH|"):
+            # BATCH|id|cmd1;cmd2 -> run each command, answer BATCH_ACK|id|OK;ERR
+            _, batch_id, commands = (line.split('|', 2) + [''])[:3]
+            results = []
+            for command in filter(None, commands.split(';')):
+                self.received.append(command)
+                results.append("OK" if self._handle_command(command) else "ERR")
+            self.send(f"BATCH_ACK|{batch_id}|{';'.join(results)}")
+            return
+        self._handle_command(line)
+
+    def _handle_command(self, line: str) -> bool:
+        """Act on one host command; False if it is unknown or malformed"""
+        parts = line.split('|')
+        command = parts[0]
+
+        try:
+            known = self._apply(command, parts)
+        except ValueError:
+            known = False
+        if self.on_host_message:
+            self.on_host_message(line)
+        return known
+
+    def _apply(self, command: str, parts: List[str]) -> bool:
+        if command == "PING":
+            if self.answer_ping:
+                self.send(f"PONG|{self.millis()}")
+        elif command == "USER_OK":
+            self.user = parts[1] if len(parts) > 1 else ""
+        elif command == "USER_FAIL":
+            self.user = None
+        elif command == "USER_LOGOUT":
+            self.user = None
+            self.selection.clear()
+        elif command == "WORKOUT_START" and len(parts) >= 4:
+            self.workout = {'exercise': parts[1], 'reps': int(parts[2]), 'sets': int(parts[3]),
+                            'current_set': 1, 'current_reps': 0}
+            if self.auto_workout is not None:
+                index = CATALOG.mcu_index(parts[1])
+                kwargs = dict(self.auto_workout, exercise=index,
+                              reps=self.workout['reps'], sets=self.workout['sets'])
+                threading.Thread(target=self.run_workout, kwargs=kwargs, daemon=True).start()
+        elif command == "WORKOUT_SYNC" and len(parts) >= 6:
+            self.workout = {'exercise': parts[1], 'reps': int(parts[2]), 'sets': int(parts[3]),
+                            'current_set': int(parts[4]), 'current_reps': int(parts[5])}
+        elif command == "WORKOUT_CANCEL":
+            self.workout = None
+            self._cancel.set()
+        elif command in ("WEB_EXERCISE", "WEB_REPS", "WEB_SETS") and len(parts) > 1:
+            self.selection[command[4:].lower()] = parts[1]
+        else:
+            return False
+        return True
+
+    # ==========================================
+    # MCU -> HOST
+    # ==========================================
+
+    def send(self, message: str):
+        """Send one protocol line (dropped if the cable is unplugged)"""
+        with self._write_lock:
+            try:
+                self.port.write((message + '\n').encode('utf-8'))
+                self.sent_count += 1
+            except (serial.SerialException, OSError):
+                pass
+
+    def tap(self, uid: str = "7D 13 37 21"):
+        self.send(f"UID_REQ|{uid}")
+
+    def configure(self, exercise: int = 0, reps: int = 10, sets: int = 3, step: float = 0.5):
+        """OLED menu selection: CFG_EXERCISE, CFG_REPS, CFG_SETS"""
+        name = CATALOG.by_index[exercise]['name'] if exercise in CATALOG.by_index else ""
+        self.send(f"CFG_EXERCISE|{exercise}|{name}")
+        self.advance(step)
+        self.send(f"CFG_REPS|{reps}")
+        self.advance(step)
+        self.send(f"CFG_SETS|{sets}")
+
+    def run_workout(self, exercise: int = 0, reps: int = 10, sets: int = 3,
+                    rep_interval: float = 2.0, rest: float = 5.0, jitter: float = 0.0,
+                    imu_rate: float = 0.0, valid_ratio: float = 1.0, start_set: int = 1):
+        """
+        Full workout: WORKOUT_START, REP_DETECT per rep with IMU_DATA in between,
+        SET_COMPLETE per set and a final WORKOUT_COMPLETE.
+
+        jitter is the +/- fraction applied to each rep interval; imu_rate is
+        IMU_DATA samples per (virtual) second between reps.
+        """
+        self._cancel.clear()
+        started_ms = self.millis()
+        self.send(f"WORKOUT_START|{exercise}|{reps}|{sets}|{started_ms}")
+
+        for set_num in range(start_set, sets + 1):
+            for rep_num in range(1, reps + 1):
+                interval = rep_interval * (1 + self.random.uniform(-jitter, jitter))
+                self._imu_burst(interval, imu_rate)
+                if self._cancel.is_set():
+                    return
+                self.send(f"REP_DETECT|{rep_num}|{set_num}|{self.millis()}")
+            self.send(f"SET_COMPLETE|{set_num}|{reps}|{self.millis()}")
+            if set_num < sets:
+                self.advance(rest)
+
+        duration_min = (self.millis() - started_ms) / 60000
+        exercise_id = CATALOG.by_index[exercise]['id'] if exercise in CATALOG.by_index else str(exercise)
+        valid = round(reps * sets * valid_ratio)
+        self.send(f"WORKOUT_COMPLETE|{exercise_id}|{reps}|{sets}|{duration_min:.1f}|{valid}")
+        self.send(f"WORKOUT_END|{self.millis()}")
+
+    def _imu_burst(self, seconds: float, rate: float):
+        """IMU_DATA samples spread over seconds of virtual time (or just the wait)"""
+        count = int(seconds * rate)
+        if count <= 0:
+            self.advance(seconds)
+            return
+        step = seconds / count
+        for i in range(count):
+            self.advance(step)
+            if self._cancel.is_set():
+                return
+            value = 9.81 * self.random.uniform(-1.5, 1.5)
+            self.send(f"IMU_DATA|Y|{value:.2f}|{self.millis()}")
+
+    def flood(self, message_type: str = "IMU_DATA", rate: float = 1000, seconds: float = 1.0):
+        """Constant-rate stream of one message type (load testing)"""
+        count = int(rate * seconds)
+        step = 1.0 / rate
+        for i in range(count):
+            self.advance(step)
+            if message_type == "IMU_DATA":
+                self.send(f"IMU_DATA|Y|{self.random.uniform(-15, 15):.2f}|{self.millis()}")
+            elif message_type == "REP_DETECT":
+                self.send(f"REP_DETECT|{i + 1}|1|{self.millis()}")
+            elif message_type == "HEARTBEAT":
+                self.send(f"HEARTBEAT|{self.millis()}")
+            else:
+                self.send(message_type)
+
+    # ==========================================
+    # SCRIPTS
+    # ==========================================
+
+    def run_script(self, steps: List[Dict]):
+        """
+        Run a list of steps, e.g. loaded from JSON:
+        [{"do": "tap", "uid": "7D133721"}, {"do": "wait", "seconds": 1},
+         {"do": "workout", "reps": 10, "sets": 3, "imu_rate": 100, "jitter": 0.1}]
+        """
+        actions = {
+            'wait': lambda seconds=1.0: self.advance(seconds),
+            'tap': self.tap,
+            'configure': self.configure,
+            'workout': self.run_workout,
+            'flood': self.flood,
+            'send': self.send,
+            'boot': self.boot,
+            'speed': self._set_speed,
+        }
+        for step in steps:
+            step = dict(step)
+            action = step.pop('do')
+            repeat = step.pop('repeat', 1)
+            for _ in range(repeat):
+                actions[action](**step)
+
+    def _set_speed(self, speed: float):
+        self.speed = speed
+        self._resync_clock()
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual SmartDumbbell MCU on a pseudo-terminal")
+    parser.add_argument('--script', help="JSON list of steps (default: built-in demo)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time scale, 0 = as fast as possible")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--loop', action='store_true', help="Repeat the script forever")
+    args = parser.parse_args()
+
+    steps = DEMO_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            steps = json.load(f)
+
+    pty_port = PtyPort()
+    mcu = VirtualMCU(pty_port, speed=args.speed, seed=args.seed)
+    print(f"Virtual MCU on {pty_port.port} - set SERIAL_PORT = '{pty_port.port}' in config.py")
+    mcu.start()
+    try:
+        input("Press Enter once main.py is connected...")
+        while True:
+            mcu.run_script(steps)
+            if not args.loop:
+                break
+        print(f"Script done, {mcu.sent_count} messages sent. Ctrl+C to exit.")
+        while True:
+            time.sleep(1)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        mcu.stop()
+        pty_port.close()
+
+if __name__ == "__main__":
+    main()